@@ -0,0 +1,116 @@
+import numpy as np
+
+from geometry import ecef2pos, station_geometry
+from rinex_compress import open_rinex
+from satpos import CLIGHT, as_gps_seconds
+
+# Klobuchar coefficients alpha0-3, beta0-3 used when the NAV header has none
+# (2004/1/1, rtkcmn.c ion_default)
+ION_DEFAULT = np.array([0.1118E-07, -0.7451E-08, -0.5961E-07, 0.1192E-06,
+                        0.1167E+06, -0.2294E+06, -0.1311E+06, 0.1049E+07])
+REL_HUMI = 0.7  # Relative humidity of the standard atmosphere (rtkpos.c REL_HUMI)
+TEMP0 = 15.0  # Temperature at sea level (deg C)
+
+
+# Klobuchar coefficients (8,) of a NAV header dict as built by the
+# rinex_reader*.decode_nav_rinex_header parsers ("ion_alpha", "ion_beta")
+def ion_params(header_data):
+    alpha, beta = header_data.get("ion_alpha"), header_data.get("ion_beta")
+    if not alpha or not beta or len(alpha) < 4 or len(beta) < 4:
+        return ION_DEFAULT
+    return np.array(list(alpha[:4]) + list(beta[:4]), dtype=np.float64)
+
+
+# Klobuchar coefficients of a NAV RINEX file: ION ALPHA/BETA (ver.2) or
+# IONOSPHERIC CORR GPSA/GPSB (ver.3/4); ION_DEFAULT if not present
+def read_ion_params(file_path):
+    header_data = {}
+    with open_rinex(file_path) as fp:
+        for line in fp:
+            label = line[60:]
+            fields = line[:60].replace('D', 'E')
+            if "ION ALPHA" in label:
+                header_data["ion_alpha"] = [float(fields[i:i + 12]) for i in range(2, 50, 12)]
+            elif "ION BETA" in label:
+                header_data["ion_beta"] = [float(fields[i:i + 12]) for i in range(2, 50, 12)]
+            elif "IONOSPHERIC CORR" in label and line[:4] in ("GPSA", "GPSB"):
+                key = "ion_alpha" if line[3] == 'A' else "ion_beta"
+                header_data[key] = [float(fields[i:i + 12]) for i in range(5, 53, 12)]
+            elif "END OF HEADER" in label:
+                break
+    return ion_params(header_data)
+
+
+# Station position of a rinex.RinexRecord: ECEF (3,) from x/y/z and geodetic
+# latitude, longitude (rad) and height (m) from lat/lon (deg) and h, computed
+# from x/y/z when not set
+def station_position(record):
+    rr = np.array([record.x, record.y, record.z], dtype=np.float64)
+    if record.lat is not None and record.lon is not None and record.h is not None:
+        return rr, (np.deg2rad(float(record.lat)), np.deg2rad(float(record.lon)), float(record.h))
+    return rr, ecef2pos(rr)
+
+
+# Klobuchar ionospheric delay on GPS L1 (m) (rtkcmn.c ionmodel) for
+# broadcastable arrays of times t (GPS seconds or datetime64), receiver
+# latitude/longitude/height (rad, m) and azimuth/elevation (rad); scale by
+# (f_L1 / f)^2 for other frequencies
+def klobuchar(t, lat, lon, h, az, el, ion=ION_DEFAULT):
+    ion = np.asarray(ion, dtype=np.float64)
+    if np.linalg.norm(ion) <= 0.0:
+        ion = ION_DEFAULT
+
+    # earth centered angle, sub-ionospheric and geomagnetic latitude (semi-circle)
+    psi = 0.0137 / (el / np.pi + 0.11) - 0.022
+    phi = np.clip(lat / np.pi + psi * np.cos(az), -0.416, 0.416)
+    lam = lon / np.pi + psi * np.sin(az) / np.cos(phi * np.pi)
+    phi = phi + 0.064 * np.cos((lam - 1.617) * np.pi)
+
+    # local time (s) and slant factor
+    tt = np.mod(43200.0 * lam + as_gps_seconds(t), 86400.0)
+    f = 1.0 + 16.0 * (0.53 - el / np.pi) ** 3
+
+    amp = np.maximum(ion[0] + phi * (ion[1] + phi * (ion[2] + phi * ion[3])), 0.0)
+    per = np.maximum(ion[4] + phi * (ion[5] + phi * (ion[6] + phi * ion[7])), 72000.0)
+    x = 2.0 * np.pi * (tt - 50400.0) / per
+    delay = CLIGHT * f * np.where(np.abs(x) < 1.57, 5e-9 + amp * (1.0 + x * x * (-0.5 + x * x / 24.0)), 5e-9)
+    return np.where((h < -1e3) | (el <= 0.0), 0.0, delay)
+
+
+# Saastamoinen tropospheric delay (m) with the standard atmosphere
+# (rtkcmn.c tropmodel) for broadcastable receiver latitude/height (rad, m)
+# and elevation (rad) arrays
+def saastamoinen(lat, h, el, humi=REL_HUMI):
+    hgt = np.clip(h, 0.0, 1e4)
+    pres = 1013.25 * (1.0 - 2.2557e-5 * hgt) ** 5.2568
+    temp = TEMP0 - 6.5e-3 * hgt + 273.16
+    e = 6.108 * humi * np.exp((17.15 * temp - 4684.0) / (temp - 38.45))
+    cosz = np.sin(el)  # cos of the zenith angle
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trph = 0.0022768 * pres / (1.0 - 0.00266 * np.cos(2.0 * lat) - 0.00028 * hgt / 1e3) / cosz
+        trpw = 0.002277 * (1255.0 / temp + 0.05) * e / cosz
+    return np.where((h < -100.0) | (h > 1e4) | (el <= 0.0), 0.0, trph + trpw)
+
+
+# Ionospheric (GPS L1) and tropospheric delays (m) at a station of geodetic
+# position pos (lat, lon, h) for broadcastable times and azimuths/elevations
+def station_delays(pos, t, az, el, ion=ION_DEFAULT):
+    lat, lon, h = pos
+    return klobuchar(t, lat, lon, h, az, el, ion), saastamoinen(lat, h, el)
+
+
+# Delays of satellites rs (..., 3) seen from one station rr (3,) at times t
+# broadcastable to rs[..., 0], e.g. (nsat, ntime, 3) positions and (ntime,)
+# times, with the cached local frame of geometry.station_geometry
+def atmosphere_delays(t, rr, rs, ion=ION_DEFAULT):
+    station = station_geometry(rr)
+    az, el = station.azel(rs)
+    iono, tropo = station_delays(station.pos, t, az, el, ion)
+    return {'az': az, 'el': el, 'iono': iono, 'tropo': tropo}
+
+
+# Delays (nsat, ntime) of a geometry tensor of StationGeometry.grid, reusing
+# its azimuths/elevations
+def grid_delays(station, geom, ion=ION_DEFAULT):
+    iono, tropo = station_delays(station.pos, geom['time'], geom['az'], geom['el'], ion)
+    return {'iono': iono, 'tropo': tropo}
@@ -0,0 +1,263 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from rinex_nav import read_nav_tables
+from rinex_obs import epoch_rows, obs_table, open_obs_rinex
+from satpos import BroadcastOrbits
+from spp import solve_spp, spp_errors
+
+PROGRESS_FILE = 'batch_progress.jsonl'  # Completed tasks, one JSON line each
+OUTPUT_SUFFIX = '.pos.csv'
+
+# ver.3 long names: ANKR00TUR_R_20190010000_01D_30S_MO.rnx, ABPO00MDG_R_20240010000_01D_GN.rnx.gz
+LONG_NAME = re.compile(r'^(?P<station>\w{4})\w{5}_\w_(?P<year>\d{4})(?P<doy>\d{3})\d{4}_\d{2}\w'
+                       r'(?:_\d{2}\w)?_(?P<sys>\w)(?P<type>[ON])(?:_[\w-]+)?\.(?:rnx|crx)(?:\.gz|\.Z)?$', re.IGNORECASE)
+# ver.2 short names: ssssdddf.yyt, e.g. 07590920.05o, base123i.24p, 07590920.05d.Z
+SHORT_NAME = re.compile(r'^(?P<station>\w{4})(?P<doy>\d{3})\w\.(?P<year>\d{2})(?P<type>[a-z])(?:\.gz|\.Z)?$',
+                        re.IGNORECASE)
+SHORT_OBS_TYPES = 'od'
+SHORT_NAV_TYPES = 'nghlpqf'
+
+# Preference of NAV files by system: GPS/mixed first, then the other systems
+# with Keplerian ephemerides (Galileo, QZSS, BeiDou); GLONASS/SBAS/NavIC-only
+# files give no satellite positions (NAV_UNUSABLE)
+LONG_NAV_RANKS = {'G': 0, 'M': 0, 'E': 1, 'J': 1, 'C': 1}
+SHORT_NAV_RANKS = {'n': 0, 'p': 0, 'l': 1, 'q': 1, 'f': 1}
+NAV_UNUSABLE = 2
+
+
+# (kind, station, year, doy) of a RINEX file name, None if not a RINEX name
+def parse_rinex_name(file_path):
+    name = os.path.basename(file_path)
+    match = LONG_NAME.match(name)
+    if match:
+        kind = 'obs' if match['type'].upper() == 'O' else 'nav'
+        return kind, match['station'].lower(), int(match['year']), int(match['doy'])
+    match = SHORT_NAME.match(name)
+    if match:
+        file_type = match['type'].lower()
+        if file_type in SHORT_OBS_TYPES:
+            kind = 'obs'
+        elif file_type in SHORT_NAV_TYPES:
+            kind = 'nav'
+        else:
+            return None
+        year = int(match['year'])
+        year += 2000 if year < 80 else 1900
+        return kind, match['station'].lower(), year, int(match['doy'])
+    return None
+
+
+# Preference rank of a NAV file name (LONG_NAV_RANKS, SHORT_NAV_RANKS), lower first
+def nav_rank(file_path):
+    name = os.path.basename(file_path)
+    match = LONG_NAME.match(name)
+    if match:
+        return LONG_NAV_RANKS.get(match['sys'].upper(), NAV_UNUSABLE)
+    match = SHORT_NAME.match(name)
+    if match:
+        return SHORT_NAV_RANKS.get(match['type'].lower(), NAV_UNUSABLE)
+    return NAV_UNUSABLE
+
+
+# Files named by the inputs: directories are walked, other inputs are globs
+def find_files(inputs):
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files += [os.path.join(root, name) for name in names]
+        else:
+            files += glob.glob(item, recursive=True)
+    return sorted(set(os.path.abspath(path) for path in files))
+
+
+# Pair every OBS file with the best ranked NAV file (nav_rank) of the same
+# station and day, or of any station of that day (e.g. merged broadcast files);
+# at equal rank the station's own file, then the first name. NAV files without
+# Keplerian ephemerides are not used.
+# Returns the (obs, nav) pairs and the OBS files without usable navigation data.
+def match_pairs(files):
+    obs, nav_station, nav_day = [], {}, {}
+    for path in files:
+        info = parse_rinex_name(path)
+        if info is None:
+            continue
+        kind, station, year, doy = info
+        if kind == 'obs':
+            obs.append((path, station, year, doy))
+            continue
+        nav = (nav_rank(path), path)
+        if nav[0] >= NAV_UNUSABLE:
+            continue
+        for key, table in (((station, year, doy), nav_station), ((year, doy), nav_day)):
+            if key not in table or nav < table[key]:
+                table[key] = nav
+
+    pairs, unmatched = [], []
+    for path, station, year, doy in obs:
+        own, day = nav_station.get((station, year, doy)), nav_day.get((year, doy))
+        nav = own if own is not None and own[0] <= day[0] else day
+        if nav is None:
+            unmatched.append(path)
+        else:
+            pairs.append((path, nav[1]))
+    return pairs, unmatched
+
+
+# Output file of every OBS file, named after the OBS file; names found in more
+# than one input directory get a hash of the full path appended
+def output_paths(out_dir, obs_paths):
+    names = [os.path.basename(path) for path in obs_paths]
+    paths = {}
+    for path, name in zip(obs_paths, names):
+        if names.count(name) > 1:
+            name += '.' + hashlib.blake2b(path.encode(), digest_size=4).hexdigest()
+        paths[path] = os.path.join(out_dir, name + OUTPUT_SUFFIX)
+    return paths
+
+
+# Solution of one station-day as CSV: time, position, GPS receiver clock,
+# satellites, residual rms and error against the header position
+def write_solution(file_path, solution, errors):
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write('time,x,y,z,clk,nsat,rms,dx,dy,dz\n')
+        for i, t in enumerate(solution['time']):
+            if not solution['ok'][i]:
+                continue
+            x, y, z = solution['pos'][i]
+            dx, dy, dz = errors[i]
+            file.write(f"{np.datetime_as_string(t, unit='ms')},{x:.4f},{y:.4f},{z:.4f},"
+                       f"{solution['clk'][i, 0]:.4f},{solution['nsat'][i]},{solution['rms'][i]:.4f},"
+                       f"{dx:.4f},{dy:.4f},{dz:.4f}\n")
+    os.replace(tmp_path, file_path)
+
+
+# Parse -> position -> write for one OBS/NAV pair, run in a worker process.
+# Never raises: failures are returned with their traceback.
+def process_pair(obs_path, nav_path, out_path):
+    timings = {}
+    try:
+        t0 = time.perf_counter()
+        header, epochs = open_obs_rinex(obs_path)
+        table = obs_table(header, epoch_rows(header, epochs))
+        orbits = BroadcastOrbits(read_nav_tables(nav_path))
+        t1 = time.perf_counter()
+        solution = solve_spp(table, orbits)
+        t2 = time.perf_counter()
+        reference = np.array(header.sta.pos, dtype=np.float64)
+        errors = spp_errors(solution, reference) if reference.any() else np.full_like(solution['pos'], np.nan)
+        write_solution(out_path, solution, errors)
+        t3 = time.perf_counter()
+        timings = {'parse': t1 - t0, 'position': t2 - t1, 'write': t3 - t2}
+        return {'status': 'done', 'epochs': len(solution['time']),
+                'solved': int(solution['ok'].sum()), 'timings': timings}
+    except Exception:
+        return {'status': 'failed', 'error': traceback.format_exc(), 'timings': timings}
+
+
+# Tasks already finished in an earlier run: done, output present and the
+# OBS file unchanged since
+def read_progress(progress_path):
+    done = {}
+    try:
+        with open(progress_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # line cut short by an interrupted run
+                if record.get('status') == 'done':
+                    done[record['obs']] = record
+                else:
+                    done.pop(record.get('obs'), None)
+    except OSError:
+        pass
+    return done
+
+
+def is_finished(record, obs_path, out_path):
+    if record is None or not os.path.exists(out_path):
+        return False
+    st = os.stat(obs_path)
+    return record['size'] == st.st_size and record['mtime'] == st.st_mtime
+
+
+# Run all pairs over a process pool; every result is appended to the progress
+# file as soon as it arrives so that an interrupted run can be resumed
+def run_batch(pairs, out_dir, workers=None, resume=True):
+    os.makedirs(out_dir, exist_ok=True)
+    progress_path = os.path.join(out_dir, PROGRESS_FILE)
+    done = read_progress(progress_path) if resume else {}
+
+    out_paths = output_paths(out_dir, [obs_path for obs_path, _ in pairs])
+    todo, skipped = [], 0
+    for obs_path, nav_path in pairs:
+        out_path = out_paths[obs_path]
+        if is_finished(done.get(obs_path), obs_path, out_path):
+            skipped += 1
+        else:
+            todo.append((obs_path, nav_path, out_path))
+
+    results = []
+    with open(progress_path, 'a') as progress, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_pair, *task): task for task in todo}
+        for future in as_completed(futures):
+            obs_path, nav_path, out_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # worker died (e.g. killed or out of memory)
+                result = {'status': 'failed', 'error': repr(e), 'timings': {}}
+            st = os.stat(obs_path)
+            record = dict(result, obs=obs_path, nav=nav_path, out=out_path,
+                          size=st.st_size, mtime=st.st_mtime)
+            progress.write(json.dumps(record) + '\n')
+            progress.flush()
+            results.append(record)
+            report(record)
+    return results, skipped
+
+
+def report(record):
+    name = os.path.basename(record['obs'])
+    if record['status'] == 'done':
+        total = sum(record['timings'].values())
+        steps = ' '.join(f"{key}={value:.2f}s" for key, value in record['timings'].items())
+        print(f"done   {name}: {record['solved']}/{record['epochs']} epochs, {total:.2f}s ({steps})")
+    else:
+        print(f"failed {name}: {record['error'].strip().splitlines()[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch single point positioning of OBS/NAV RINEX pairs")
+    parser.add_argument('inputs', nargs='+', help="directories or glob patterns of RINEX files")
+    parser.add_argument('--out', default='batch_results', help="output directory")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--no-resume', action='store_true', help="reprocess finished station-days")
+    args = parser.parse_args()
+
+    pairs, unmatched = match_pairs(find_files(args.inputs))
+    for path in unmatched:
+        print(f"no GPS, Galileo, QZSS or BeiDou NAV file for {os.path.basename(path)}")
+    for obs_path, nav_path in pairs:
+        if nav_rank(nav_path) > 0:
+            print(f"no GPS/mixed NAV file for {os.path.basename(obs_path)}, "
+                  f"using {os.path.basename(nav_path)} (other systems only)")
+    results, skipped = run_batch(pairs, args.out, args.workers, resume=not args.no_resume)
+
+    failed = sum(record['status'] != 'done' for record in results)
+    print(f"{len(results) - failed} done, {failed} failed, {skipped} skipped, {len(unmatched)} without NAV")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import time
+
+from batch import match_pairs
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# File names of one day with several NAV types per station and the NAV file
+# every OBS file is expected to be paired with (None: no usable NAV file)
+PAIRING_FILES = [
+    "abcd0920.05o", "abcd0920.05g", "abcd0920.05n", "abcd0920.05l",
+    "efgh0920.05o", "efgh0920.05g", "efgh0920.05l",
+    "ijkl0920.05d.Z", "ijkl0920.05g",
+    "ANKR00TUR_R_20190010000_01D_30S_MO.crx.gz", "ANKR00TUR_R_20190010000_01D_RN.rnx",
+    "ANKR00TUR_R_20190010000_01D_GN.rnx", "ANKR00TUR_R_20190010000_01D_MN.rnx",
+    "ABPO00MDG_R_20190010000_01D_30S_MO.rnx", "ABPO00MDG_R_20190010000_01D_RN.rnx",
+    "BRDC00IGS_R_20190010000_01D_MN.rnx.gz",
+    "ISTA00TUR_R_20190020000_01D_30S_MO.rnx", "ISTA00TUR_R_20190020000_01D_EN.rnx",
+    "ISTA00TUR_R_20190020000_01D_RN.rnx",
+    "mnop0930.05o", "mnop0930.05g", "mnop0930.05h",
+]
+PAIRING_EXPECTED = {
+    "abcd0920.05o": "abcd0920.05n",
+    "efgh0920.05o": "abcd0920.05n",  # GPS file of another station before its own Galileo file
+    "ijkl0920.05d.Z": "abcd0920.05n",
+    "ANKR00TUR_R_20190010000_01D_30S_MO.crx.gz": "ANKR00TUR_R_20190010000_01D_GN.rnx",
+    "ABPO00MDG_R_20190010000_01D_30S_MO.rnx": "ANKR00TUR_R_20190010000_01D_GN.rnx",
+    "ISTA00TUR_R_20190020000_01D_30S_MO.rnx": "ISTA00TUR_R_20190020000_01D_EN.rnx",
+    "mnop0930.05o": None,  # GLONASS and SBAS only
+}
+
+
+# NAV file chosen for every OBS file of PAIRING_FILES against PAIRING_EXPECTED
+def check_pairs():
+    pairs, unmatched = match_pairs([os.path.join("/data", name) for name in PAIRING_FILES])
+    got = {os.path.basename(obs): os.path.basename(nav) for obs, nav in pairs}
+    got.update({os.path.basename(obs): None for obs in unmatched})
+    for obs, nav in PAIRING_EXPECTED.items():
+        if got.get(obs) != nav:
+            raise AssertionError(f"{obs}: paired with {got.get(obs)}, expected {nav}")
+    print(f"pairing check: {len(PAIRING_EXPECTED)} OBS files paired as expected")
+
+
+# match_pairs over n copies of the sample names spread over days
+def bench(n=2000):
+    files = [os.path.join(DATA_DIR, f"{station:04d}{doy:03d}0.05{t}")
+             for station in range(n // 100) for doy in range(1, 101) for t in "ongl"]
+    t = time.perf_counter()
+    pairs, unmatched = match_pairs(files)
+    t = time.perf_counter() - t
+    print(f"match_pairs of {len(files)} files: {t * 1e3:.1f} ms, {len(pairs)} pairs, {len(unmatched)} unmatched")
+
+
+if __name__ == '__main__':
+    check_pairs()
+    bench()
@@ -0,0 +1,60 @@
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+from rinex_compress import open_rinex_binary
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "observation")
+OBS_V2 = os.path.join(DATA_DIR, "07590920.05o")
+OBS_V3 = os.path.join(DATA_DIR, "base123i.24o")
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "compress")
+
+# Encoded samples and their plain RINEX: compact RINEX written by rnx2crx
+# (ver.2 file; 20 ver.3 epochs with receiver clock offsets and an event
+# record) with the output of crx2rnx, and a .Z written by compress
+SAMPLES = [
+    (os.path.join(SAMPLE_DIR, "07590920.05d"), OBS_V2),
+    (os.path.join(SAMPLE_DIR, "base123i.crx"), os.path.join(SAMPLE_DIR, "base123i.rnx")),
+    (os.path.join(SAMPLE_DIR, "07590920.05o.Z"), OBS_V2),
+]
+
+
+# Decoded RINEX bytes per second of a plain, gzip, .Z or compact RINEX file
+def bench(file_path, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        with open_rinex_binary(file_path) as file:
+            size = len(file.read())
+        best = min(best, time.perf_counter() - t)
+    print(f"{os.path.basename(file_path)}: {os.path.getsize(file_path) / 1e6:.1f} MB -> {size / 1e6:.1f} MB"
+          f"  {best * 1e3:8.1f} ms  ({size / 1e6 / best:.1f} MB/s)")
+
+
+# Decoded samples compared byte for byte with the output of the reference tools
+def check():
+    for encoded, expected in SAMPLES:
+        with open_rinex_binary(encoded) as file, open(expected, 'rb') as ref:
+            data, want = file.read(), ref.read()
+        if data != want:
+            line = next((i for i, (a, b) in enumerate(zip(data.split(b'\n'), want.split(b'\n'))) if a != b),
+                        min(data.count(b'\n'), want.count(b'\n')))
+            raise AssertionError(f"{os.path.basename(encoded)}: decoded bytes differ from "
+                                 f"{os.path.basename(expected)} at line {line + 1}")
+        print(f"{os.path.basename(encoded)}: {len(data)} bytes identical to {os.path.basename(expected)}")
+
+
+# Sample check, then the sample OBS files gzipped; .Z and .crx files (made with compress/rnx2crx)
+# can be given on the command line
+if __name__ == '__main__':
+    check()
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in (OBS_V2, OBS_V3):
+            out = os.path.join(tmp, os.path.basename(path) + '.gz')
+            with open(path, 'rb') as src, gzip.open(out, 'wb') as dst:
+                dst.write(src.read())
+            bench(out)
+    for path in sys.argv[1:]:
+        bench(path)
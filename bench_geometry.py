@@ -0,0 +1,67 @@
+import os
+import timeit
+
+import numpy as np
+
+from atmosphere import grid_delays, read_ion_params
+from geometry import dops, ecef2pos, pos2ecef, station_geometry
+from rinex_nav import read_nav_tables
+from satpos import BroadcastOrbits
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+REFERENCE_POSITION = np.array([4097216.5539, 4429119.1897, -2065771.1988])  # ABPO
+
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+TIMES = np.datetime64("2024-01-01T00:00:00", "ns") + np.arange(2880) * np.timedelta64(30, "s")
+EL_MASK = np.deg2rad(10.0)
+
+
+# Stages of a run on one geometry tensor: elevation mask, atmosphere, DOP
+def stages(station, geom, ion):
+    visible = geom['el'] >= EL_MASK
+    delays = grid_delays(station, geom, ion)
+    dop = dops(geom['az'].T, geom['el'].T, EL_MASK)
+    return visible, delays, dop
+
+
+def bench(number=5):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-np.pi / 2, np.pi / 2, 100000)
+    lon = rng.uniform(-np.pi, np.pi, 100000)
+    h = rng.uniform(-500.0, 30000.0, 100000)
+    t = min(timeit.repeat(lambda: ecef2pos(pos2ecef(lat, lon, h)), number=number, repeat=3)) / number
+    lat2, lon2, h2 = ecef2pos(pos2ecef(lat, lon, h))
+    print(f"pos2ecef/ecef2pos of {len(lat)} points: {t * 1e3:8.3f} ms, "
+          f"{np.abs(lat2 - lat).max() * 6.4e6 * 1e3:.3g} mm / {np.abs(h2 - h).max() * 1e3:.3g} mm max error")
+
+    orbits = BroadcastOrbits(read_nav_tables(NAV_V3))
+    ion = read_ion_params(NAV_V3)
+    station = station_geometry(REFERENCE_POSITION)
+    t_first = min(timeit.repeat(lambda: station.grid(orbits, SATS, TIMES), number=1, repeat=1))
+    t_cached = min(timeit.repeat(lambda: station.grid(orbits, SATS, TIMES), number=number, repeat=3)) / number
+    print(f"{len(SATS)} sats x {len(TIMES)} epochs")
+    print(f"  grid           : {t_first * 1e3:8.3f} ms first, {t_cached * 1e3:8.3f} ms cached")
+
+    geom = station.grid(orbits, SATS, TIMES)
+    t = min(timeit.repeat(lambda: stages(station, station.grid(orbits, SATS, TIMES), ion),
+                          number=number, repeat=3)) / number
+    print(f"  stages         : {t * 1e3:8.3f} ms (mask, atmosphere, DOP on the cached tensor)")
+
+    # every stage evaluating the orbits and the local frame on its own
+    def uncached():
+        for _ in range(3):
+            station.clear()
+            station.grid(orbits, SATS, TIMES)
+        stages(station, station.grid(orbits, SATS, TIMES), ion)
+    t = min(timeit.repeat(uncached, number=1, repeat=3))
+    print(f"  uncached       : {t * 1e3:8.3f} ms (geometry per stage)")
+
+    visible, delays, dop = stages(station, geom, ion)
+    print(f"  visible        : {visible.sum(axis=0).mean():.1f} sats/epoch, "
+          f"PDOP {np.nanmedian(dop[:, 1]):.2f} median, "
+          f"iono {np.nanmax(np.where(visible, delays['iono'], np.nan)):.2f} m max")
+
+
+if __name__ == '__main__':
+    bench()
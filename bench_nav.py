@@ -0,0 +1,43 @@
+import os
+import timeit
+
+import numpy as np
+
+import rinex_nav
+import rinex_reader3
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V2 = os.path.join(DATA_DIR, "07590920.05n")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+
+
+# Regex reader vs. fixed-column reader on the same file
+def compare_fields(file_path):
+    regex_rows = rinex_reader3.parse_nav_rinex_body(file_path)
+    table = rinex_nav.parse_nav_rinex_body(file_path)
+    if len(regex_rows) != len(table):
+        return f"record count differs: regex={len(regex_rows)} fixed={len(table)}"
+    for row, fast in zip(regex_rows, rinex_nav.nav_records_to_dicts(table)):
+        for key in rinex_nav.NAV_FIELDS:
+            if isinstance(row[key], str):
+                same = row[key] == fast[key]
+            else:
+                same = np.isclose(row[key], fast[key], rtol=1e-15, atol=0.0)
+            if not same:
+                return f"{row['satellite']} {row['epoch']} {key}: regex={row[key]} fixed={fast[key]}"
+    return f"{len(table)} records identical"
+
+
+def bench(file_path, number=20):
+    t_regex = min(timeit.repeat(lambda: rinex_reader3.parse_nav_rinex_body(file_path), number=number, repeat=3))
+    t_fixed = min(timeit.repeat(lambda: rinex_nav.parse_nav_rinex_body(file_path), number=number, repeat=3))
+    print(f"{os.path.basename(file_path)}")
+    print(f"  regex loop   : {t_regex / number * 1e3:8.3f} ms")
+    print(f"  fixed column : {t_fixed / number * 1e3:8.3f} ms  ({t_regex / t_fixed:.1f}x)")
+
+
+if __name__ == '__main__':
+    bench(NAV_V2)
+    bench(NAV_V3)
+    # the regex reader only starts records on 'G', so ver.2 files cannot be compared
+    print(f"field check {os.path.basename(NAV_V3)}: {compare_fields(NAV_V3)}")
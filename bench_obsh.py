@@ -0,0 +1,52 @@
+import io
+import logging
+import os
+import timeit
+
+import rinex6
+from rinex_obs import ObsHeader
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "observation")
+OBS_V2 = os.path.join(DATA_DIR, "07590920.05o")
+OBS_V3 = os.path.join(DATA_DIR, "base123i.24o")
+
+
+# Header text of an OBS file, decoded from memory so that only decoding is timed
+def read_header_text(file_path):
+    lines = []
+    with open(file_path, "r", encoding="latin-1") as file:
+        for line in file:
+            lines.append(line)
+            if "END OF HEADER" in line[60:]:
+                break
+    return "".join(lines)
+
+
+def decode_header(text):
+    header = ObsHeader()
+    return rinex6.readrnxh(io.StringIO(text), header.tobs, None, header.sta)
+
+
+def bench_header(file_path, number=500):
+    text = read_header_text(file_path)
+    t_off = min(timeit.repeat(lambda: decode_header(text), number=number, repeat=3))
+    rinex6.logger.setLevel(logging.DEBUG)
+    rinex6.logger.addHandler(logging.NullHandler())
+    try:
+        t_debug = min(timeit.repeat(lambda: decode_header(text), number=number, repeat=3))
+    finally:
+        rinex6.logger.setLevel(logging.NOTSET)
+    print(f"{os.path.basename(file_path)}")
+    print(f"  readrnxh, logging off   : {t_off / number * 1e6:8.1f} us")
+    print(f"  readrnxh, debug enabled : {t_debug / number * 1e6:8.1f} us")
+
+
+def bench_convcode(number=100000):
+    t = min(timeit.repeat(lambda: rinex6.convcode(2.11, rinex6.SYS_GPS, "P2"), number=number, repeat=3))
+    print(f"convcode lookup           : {t / number * 1e9:8.1f} ns")
+
+
+if __name__ == '__main__':
+    bench_header(OBS_V2)
+    bench_header(OBS_V3)
+    bench_convcode()
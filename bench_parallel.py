@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench_writer import OBS_V2, OBS_V3, repeat_table
+from rinex_obs import build_epoch_index, open_obs_rinex, read_obs_table, read_obs_table_parallel
+from rinex_shm import read_obs_table_shared
+from rinex_writer import write_obs_table
+
+
+def same_table(a, b):
+    return a.keys() == b.keys() and all(
+        np.array_equal(a[key], b[key], equal_nan=a[key].dtype.kind == 'f') for key in a)
+
+
+# Sequential read_obs_table against read_obs_table_parallel (results pickled
+# back) and read_obs_table_shared (results in shared memory) with
+# 1..max_workers workers on a large file made by repeating a sample file
+def bench(file_path, copies, max_workers):
+    header, epochs = open_obs_rinex(file_path)
+    epochs.close()
+    table = repeat_table(read_obs_table(file_path), copies)
+    with tempfile.TemporaryDirectory() as tmp:
+        big = os.path.join(tmp, os.path.basename(file_path))
+        write_obs_table(big, header, table)
+        build_epoch_index(big)
+        size = os.path.getsize(big)
+        print(f"{os.path.basename(file_path)} x{copies}: {size / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+
+        t = time.perf_counter()
+        expected = read_obs_table(big)
+        t_seq = time.perf_counter() - t
+        print(f"  sequential    : {t_seq:7.2f} s  ({size / 1e6 / t_seq:5.1f} MB/s)")
+        workers = 1
+        while workers <= max_workers:
+            t = time.perf_counter()
+            result = read_obs_table_parallel(big, workers)
+            dt = time.perf_counter() - t
+            print(f"  {workers:2d} workers    : {dt:7.2f} s  ({size / 1e6 / dt:5.1f} MB/s, "
+                  f"speedup {t_seq / dt:4.2f}){'' if same_table(result, expected) else '  MISMATCH'}")
+            t = time.perf_counter()
+            result, shared = read_obs_table_shared(big, workers)
+            dt = time.perf_counter() - t
+            print(f"  {workers:2d} shared     : {dt:7.2f} s  ({size / 1e6 / dt:5.1f} MB/s, "
+                  f"speedup {t_seq / dt:4.2f}){'' if same_table(result, expected) else '  MISMATCH'}")
+            del result
+            shared.close()
+            workers *= 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scaling of chunk-parallel OBS parsing")
+    parser.add_argument('--copies', type=int, default=100, help="times the sample files are repeated")
+    parser.add_argument('--max-workers', type=int, default=16)
+    args = parser.parse_args()
+    bench(OBS_V2, args.copies, args.max_workers)
+    bench(OBS_V3, args.copies, args.max_workers)
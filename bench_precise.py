@@ -0,0 +1,105 @@
+import os
+import tempfile
+import timeit
+
+import numpy as np
+
+from gtime import gtime2epoch
+from precise import read_clk, read_precise, read_sp3
+from rinex_nav import read_nav_tables
+from satpos import BroadcastOrbits, gps_seconds
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+DAY = np.datetime64("2024-01-01T00:00:00", "ns")
+TIMES = DAY + np.arange(2880) * np.timedelta64(30, "s")
+SP3_STEP = 900  # s
+CLK_STEP = 30  # s
+
+
+def epoch_fields(t):
+    y, m, d, hh, mm, ss = gtime2epoch(t)
+    return int(y), int(m), int(d), int(hh), int(mm), ss
+
+
+# Smooth reference orbits/clocks (the test data has no precise products): the
+# broadcast ephemeris of noon of every satellite over the whole day, as
+# switching between ephemerides leaves steps of up to hundreds of meters
+def reference(orbits, times):
+    t = gps_seconds(times)
+    noon = np.full(len(SATS), gps_seconds(DAY) + 43200.0)
+    idx = orbits.select(SATS, noon)
+    ok = idx >= 0
+    tt = np.broadcast_to(t, (ok.sum(), len(t))).ravel()
+    ii = np.repeat(idx[ok], len(t))
+    rs = np.full((len(SATS), len(t), 3), np.nan)
+    dts = np.full((len(SATS), len(t)), np.nan)
+    rs[ok] = orbits.eph2pos(tt, ii).reshape(-1, len(t), 3)
+    dts[ok] = orbits.eph2clk(tt, ii, rel=False, tgd=False).reshape(-1, len(t))
+    return rs, dts
+
+
+# SP3-c file of reference positions/clocks
+def write_sp3(file_path, orbits, times):
+    rs, dts = reference(orbits, times)
+    gt = (gps_seconds(times) * 1e9).astype(np.int64)
+    with open(file_path, "w") as file:
+        file.write("#cP%4d %2d %2d %2d %2d %11.8f %7d ORBIT IGS14 HLM  TEST\n" % (epoch_fields(gt[0]) + (len(times),)))
+        file.write("%c G  cc GPS ccc cccc cccc cccc cccc ccccc ccccc ccccc ccccc\n")
+        for j, t in enumerate(gt):
+            file.write("*  %4d %2d %2d %2d %2d %11.8f\n" % epoch_fields(t))
+            for i, sat in enumerate(SATS):
+                if np.isnan(rs[i, j, 0]):
+                    continue
+                x, y, z = rs[i, j] / 1e3
+                file.write("P%s%14.6f%14.6f%14.6f%14.6f\n" % (sat, x, y, z, dts[i, j] * 1e6))
+        file.write("EOF\n")
+
+
+# RINEX 3 clock file of broadcast clocks
+def write_clk(file_path, orbits, times):
+    dts = reference(orbits, times)[1]
+    gt = (gps_seconds(times) * 1e9).astype(np.int64)
+    with open(file_path, "w") as file:
+        file.write("%9.2f           C                   GPS                 RINEX VERSION / TYPE\n" % 3.0)
+        file.write("%60sEND OF HEADER\n" % "")
+        for j, t in enumerate(gt):
+            for i, sat in enumerate(SATS):
+                if not np.isnan(dts[i, j]):
+                    file.write("AS %-4s %4d %2d %2d %2d %2d %9.6f  1   %19.12E\n" % ((sat,) + epoch_fields(t) + (dts[i, j],)))
+
+
+def bench(number=10):
+    orbits = BroadcastOrbits(read_nav_tables(NAV_V3))
+    with tempfile.TemporaryDirectory() as tmp:
+        sp3_path, clk_path = os.path.join(tmp, "test.sp3"), os.path.join(tmp, "test.clk")
+        write_sp3(sp3_path, orbits, DAY + np.arange(86400 // SP3_STEP + 1) * np.timedelta64(SP3_STEP, "s"))
+        write_clk(clk_path, orbits, DAY + np.arange(86400 // CLK_STEP) * np.timedelta64(CLK_STEP, "s"))
+
+        t_sp3 = min(timeit.repeat(lambda: read_sp3(sp3_path), number=1, repeat=3))
+        t_clk = min(timeit.repeat(lambda: read_clk(clk_path), number=1, repeat=3))
+        precise = read_precise([sp3_path], [clk_path])
+
+    print(f"read_sp3       : {t_sp3 * 1e3:8.3f} ms")
+    print(f"read_clk       : {t_clk * 1e3:8.3f} ms")
+
+    t_first = min(timeit.repeat(lambda: precise.positions_grid(SATS, TIMES), number=1, repeat=1))
+    t_cached = min(timeit.repeat(lambda: precise.positions_grid(SATS, TIMES), number=number, repeat=3)) / number
+    print(f"{len(SATS)} sats x {len(TIMES)} epochs")
+    print(f"  positions_grid : {t_first * 1e3:8.3f} ms first, {t_cached * 1e3:8.3f} ms cached windows")
+    t = min(timeit.repeat(lambda: precise.clock_grid(SATS, TIMES), number=number, repeat=3)) / number
+    print(f"  clock_grid     : {t * 1e3:8.3f} ms")
+
+    # reference sampled every 15 min (orbits) / 30 s (clocks) and interpolated back
+    rs = precise.positions_grid(SATS, TIMES)
+    ref, ref_dts = reference(orbits, TIMES)
+    err = np.linalg.norm(rs - ref, axis=-1)
+    dts = precise.clock_grid(SATS, TIMES, rel=False)
+    print(f"  orbit error    : {np.nanmax(err) * 1e3:8.3f} mm max, {np.nanmedian(err) * 1e3:.3f} mm median")
+    print(f"  clock error    : {np.nanmax(np.abs(dts - ref_dts)) * 1e12:8.3f} ps max")
+
+
+if __name__ == '__main__':
+    bench()
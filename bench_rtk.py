@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from rinex_nav import read_nav_tables
+from rtk import SOLQ_FIX, WAVELENGTHS, solve_rtk
+from satpos import CLIGHT, BroadcastOrbits, gps_seconds
+from spp import OMGE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+BASE_POSITION = np.array([4097216.5539, 4429119.1897, -2065771.1988])  # ABPO
+BASELINE = np.array([1200.0, -800.0, 500.0])  # Rover - base (m)
+
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+DAY = np.datetime64("2024-01-01T00:00:00", "ns")
+CODE_NOISE = 0.3  # m
+PHASE_NOISE = 0.002  # m
+RECEIVER_CLOCKS = (30.0, -120.0)  # base, rover clock offsets (m)
+
+
+# Obs table of C1C/L1C ranges from position rr every `step` s over `hours`,
+# with integer phase ambiguities per satellite and white noise
+def simulate_table(orbits, rr, clock, ambiguities, hours, step, rng):
+    times = DAY + np.arange(int(hours * 3600 / step)) * np.timedelta64(step, "s")
+    sat = np.repeat(SATS[None, :], len(times), axis=0).ravel()
+    t = np.repeat(times, len(SATS))
+    t_rx = gps_seconds(t)
+
+    tau = np.full(len(sat), 0.075)
+    for _ in range(3):
+        dts = orbits.clock_bias(sat, t_rx - tau)
+        rs = orbits.positions(sat, t_rx - tau)
+        rho = np.linalg.norm(rs - rr, axis=-1)
+        rho += OMGE * (rs[:, 0] * rr[1] - rs[:, 1] * rr[0]) / CLIGHT
+        tau = rho / CLIGHT
+    y = rho + clock - CLIGHT * dts
+    lam = WAVELENGTHS["G"]
+    P = y + rng.normal(0.0, CODE_NOISE, len(y))
+    L = (y + rng.normal(0.0, PHASE_NOISE, len(y))) / lam + np.tile(ambiguities, len(times))
+
+    up = rr / np.linalg.norm(rr)
+    visible = ((rs - rr) @ up / rho > np.sin(np.deg2rad(15.0))) & ~np.isnan(y)
+    obs = np.stack([P, L], axis=-1)[visible]
+    table = {"time": t[visible], "sat": sat[visible], "obs": obs, "lli": np.zeros(obs.shape, dtype=np.uint8)}
+    for code in "GREJSCI":
+        table["types_" + code] = np.array(["C1C", "L1C"] if code == "G" else [], dtype="U3")
+    return table
+
+
+def bench(hours=24.0, step=1):
+    rng = np.random.default_rng(0)
+    orbits = BroadcastOrbits(read_nav_tables(NAV_V3))
+    rover_pos = BASE_POSITION + BASELINE
+    base = simulate_table(orbits, BASE_POSITION, RECEIVER_CLOCKS[0], rng.integers(-1000000, 1000000, len(SATS)),
+                          hours, step, rng)
+    rover = simulate_table(orbits, rover_pos, RECEIVER_CLOCKS[1], rng.integers(-1000000, 1000000, len(SATS)),
+                           hours, step, rng)
+    print(f"{hours:g} h at {step} s: {len(rover['sat'])} rover, {len(base['sat'])} base observations")
+
+    for mode in ("kinematic", "static"):
+        t = time.perf_counter()
+        out = solve_rtk(rover, base, orbits, BASE_POSITION, mode=mode)
+        t = time.perf_counter() - t
+        fix = out["status"] == SOLQ_FIX
+        err = np.linalg.norm(out["pos"] - rover_pos, axis=-1)
+        print(f"  {mode:9s} : {t:8.2f} s, {len(out['time'])} epochs, {fix.mean() * 100:.1f} % fixed, "
+              f"fixed error {np.nanmax(err[fix]) * 1e3:.1f} mm max")
+
+
+if __name__ == '__main__':
+    bench(*[float(arg) for arg in sys.argv[1:2]])
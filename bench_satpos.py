@@ -0,0 +1,33 @@
+import os
+import timeit
+
+import numpy as np
+
+from rinex_nav import read_nav_tables
+from satpos import BroadcastOrbits
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+TIMES = np.datetime64("2024-01-01T00:00:00", "ns") + np.arange(2880) * np.timedelta64(30, "s")
+
+
+def bench(number=10):
+    orbits = BroadcastOrbits(read_nav_tables(NAV_V3))
+    rs = orbits.positions_grid(SATS, TIMES)
+    t = min(timeit.repeat(lambda: orbits.positions_grid(SATS, TIMES), number=number, repeat=3))
+    valid = ~np.isnan(rs[..., 0])
+    r = np.linalg.norm(rs[valid], axis=-1)
+    print(f"{len(SATS)} sats x {len(TIMES)} epochs ({valid.sum()} with ephemeris)")
+    print(f"  positions_grid : {t / number * 1e3:8.3f} ms")
+    print(f"  orbit radius   : {r.min() / 1e3:.0f} - {r.max() / 1e3:.0f} km")
+
+    times_1hz = TIMES[0] + np.arange(86400) * np.timedelta64(1, "s")
+    t = min(timeit.repeat(lambda: orbits.clock_grid(SATS, times_1hz), number=1, repeat=3))
+    print(f"{len(SATS)} sats x {len(times_1hz)} epochs")
+    print(f"  clock_grid     : {t * 1e3:8.3f} ms")
+
+
+if __name__ == '__main__':
+    bench()
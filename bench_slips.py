@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from gtime import NS, epoch2gtime
+from rinex_obs import ObsEpoch, open_obs_rinex
+from satpos import CLIGHT
+from slips import FREQS, SlipDetector, clean_epochs
+
+OBS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "observation", "base123i.24o")
+
+OBS_TYPES = {"G": ["C1C", "L1C", "C2W", "L2W"]}
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+F1, F2 = FREQS["G"]["1"], FREQS["G"]["2"]
+LAM1, LAM2 = CLIGHT / F1, CLIGHT / F2
+CODE_NOISE = 0.3  # m
+PHASE_NOISE = 0.003  # m
+ARC = 6 * 3600  # Visibility of a satellite per 12 h (s)
+# (L1, L2) slips (cycles); 5/4 gives 2.6 cm GF and 1 wide-lane cycle, below both thresholds
+SLIPS = [(1, 0), (0, 1), (1, 2), (5, 4), (9, 7), (-3, -2)]
+NSLIP = 300
+NOUTLIER = 300
+
+
+# 1 Hz dual-frequency epochs over `hours`: smooth ranges and ionosphere, one
+# visible arc per satellite and 12 h, integer slips and phase/code outliers
+# injected at random epochs. Returns epochs and the injected (epoch, sat) sets.
+def simulate_epochs(hours, rng):
+    nt = int(hours * 3600)
+    t = np.arange(nt, dtype=np.float64)
+    rise = rng.uniform(0, 43200, len(SATS))
+    visible = ((t[:, None] - rise) % 43200) < ARC
+    rho = 2.2e7 + 2e6 * np.sin(2 * np.pi * (t[:, None] - rise) / 43200)
+    iono = 3.0 + 2.0 * np.sin(2 * np.pi * (t[:, None] - rise) / 21600 + rng.uniform(0, 6, len(SATS)))
+    i1, i2 = iono, iono * (F1 / F2) ** 2
+    amb1 = rng.integers(-10 ** 6, 10 ** 6, len(SATS)).astype(np.float64)
+    amb2 = rng.integers(-10 ** 6, 10 ** 6, len(SATS)).astype(np.float64)
+
+    n1 = np.zeros((nt, len(SATS)))
+    n2 = np.zeros((nt, len(SATS)))
+    ie, js = np.nonzero(visible)
+    pick = rng.choice(len(ie), NSLIP + NOUTLIER, replace=False)
+    slips = set()
+    for k in pick[:NSLIP]:
+        d1, d2 = SLIPS[rng.integers(len(SLIPS))]
+        n1[ie[k]:, js[k]] += d1
+        n2[ie[k]:, js[k]] += d2
+        slips.add((ie[k], SATS[js[k]]))
+    shape = (nt, len(SATS))
+    L1 = (rho - i1 + rng.normal(0, PHASE_NOISE, shape)) / LAM1 + amb1 + n1
+    L2 = (rho - i2 + rng.normal(0, PHASE_NOISE, shape)) / LAM2 + amb2 + n2
+    P1 = rho + i1 + rng.normal(0, CODE_NOISE, shape)
+    P2 = rho + i2 + rng.normal(0, CODE_NOISE, shape)
+    outliers = set()
+    for k in pick[NSLIP:]:
+        if rng.random() < 0.5:
+            L1[ie[k], js[k]] += rng.choice([-1, 1]) * rng.uniform(2, 20)
+        else:
+            P2[ie[k], js[k]] += rng.choice([-1, 1]) * rng.uniform(5, 30)
+        outliers.add((ie[k], SATS[js[k]]))
+
+    t0 = epoch2gtime([2024, 1, 1, 0, 0, 0])
+    obs = np.stack([P1, L1, P2, L2], axis=-1)
+    epochs = []
+    for i in range(nt):
+        j = np.flatnonzero(visible[i])
+        epochs.append(ObsEpoch(t0 + i * NS, 0, SATS[j], obs[i, j], np.zeros((len(j), 4), dtype=np.uint8),
+                               np.zeros((len(j), 4), dtype=np.uint8)))
+    return epochs, slips, outliers
+
+
+def bench(hours=24.0):
+    rng = np.random.default_rng(0)
+    epochs, slips, outliers = simulate_epochs(hours, rng)
+    print(f"{hours:g} h at 1 s: {len(epochs)} epochs, {sum(len(e.sats) for e in epochs)} observations, "
+          f"{len(slips)} slips, {len(outliers)} outliers injected")
+
+    t0 = epochs[0].time
+    detector = SlipDetector(OBS_TYPES)
+    t = time.perf_counter()
+    found_slips, found_outliers = set(), set()
+    for epoch in detector.filter(epochs):
+        i = (epoch.time - t0) // NS
+        found_slips.update((i, sat) for sat in epoch.sats[(epoch.lli[:, 1] & 1) > 0])
+        found_outliers.update((i, sat) for sat in epoch.sats[np.isnan(epoch.obs[:, 1])])
+    t = time.perf_counter() - t
+    print(f"  filter         : {t:8.3f} s, {t / len(epochs) * 1e6:.1f} us/epoch")
+    print(f"  slips          : {len(found_slips & slips)} / {len(slips)} found, {len(found_slips - slips)} false")
+    print(f"  outliers       : {len(found_outliers & outliers)} / {len(outliers)} removed, "
+          f"{len(found_outliers - outliers)} false")
+
+    # overhead on a real file
+    header, stream = open_obs_rinex(OBS_FILE)
+    t = time.perf_counter()
+    n = sum(1 for _ in stream)
+    t_parse = time.perf_counter() - t
+    header, stream = open_obs_rinex(OBS_FILE)
+    t = time.perf_counter()
+    sum(1 for _ in clean_epochs(header, stream))
+    t_clean = time.perf_counter() - t
+    print(f"{os.path.basename(OBS_FILE)}: parse {t_parse / n * 1e6:.1f} us/epoch, "
+          f"parse + clean {t_clean / n * 1e6:.1f} us/epoch")
+
+
+if __name__ == '__main__':
+    bench(*[float(arg) for arg in sys.argv[1:2]])
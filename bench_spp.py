@@ -0,0 +1,74 @@
+import os
+import timeit
+
+import numpy as np
+
+from atmosphere import atmosphere_delays, read_ion_params
+from rinex_nav import read_nav_tables
+from satpos import CLIGHT, BroadcastOrbits, gps_seconds
+from spp import CODE_PRIORITY, OMGE, solve_spp, spp_errors
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "navigation")
+NAV_V3 = os.path.join(DATA_DIR, "ABPO00MDG_R_20240010000_01D_GN.rnx")
+REFERENCE_POSITION = np.array([4097216.5539, 4429119.1897, -2065771.1988])  # ABPO
+
+SATS = np.array(["G%02d" % prn for prn in range(1, 33)])
+TIMES = np.datetime64("2024-01-01T00:00:00", "ns") + np.arange(2880) * np.timedelta64(30, "s")
+RECEIVER_CLOCK = 30.0  # Receiver clock offset of the simulated ranges (m)
+
+
+# Obs table of C1C ranges from REFERENCE_POSITION, 24 h at 30 s, error-free
+# or with Klobuchar/Saastamoinen delays of ion
+def simulate_table(orbits, ion=None):
+    sat = np.repeat(SATS[None, :], len(TIMES), axis=0).ravel()
+    time = np.repeat(TIMES, len(SATS))
+    t_rx = gps_seconds(time)
+
+    tau = np.full(len(sat), 0.075)
+    for _ in range(3):
+        dts = orbits.clock_bias(sat, t_rx - tau)
+        rs = orbits.positions(sat, t_rx - tau)
+        rho = np.linalg.norm(rs - REFERENCE_POSITION, axis=-1)
+        rho += OMGE * (rs[:, 0] * REFERENCE_POSITION[1] - rs[:, 1] * REFERENCE_POSITION[0]) / CLIGHT
+        tau = rho / CLIGHT
+    P = rho + RECEIVER_CLOCK - CLIGHT * dts
+    if ion is not None:
+        delays = atmosphere_delays(t_rx, REFERENCE_POSITION, rs, ion)
+        P += delays['iono'] + delays['tropo']
+
+    up = REFERENCE_POSITION / np.linalg.norm(REFERENCE_POSITION)
+    visible = ((rs - REFERENCE_POSITION) @ up / rho > np.sin(np.deg2rad(15.0))) & ~np.isnan(P)
+    table = {"time": time[visible], "sat": sat[visible], "obs": P[visible, None]}
+    for sys in CODE_PRIORITY:
+        table["types_" + sys] = np.array(["C1C"], dtype="U3")
+    return table
+
+
+def bench(number=3):
+    orbits = BroadcastOrbits(read_nav_tables(NAV_V3))
+    table = simulate_table(orbits)
+    solution = solve_spp(table, orbits)
+    t = min(timeit.repeat(lambda: solve_spp(table, orbits), number=number, repeat=3))
+    errors = spp_errors(solution, REFERENCE_POSITION)
+    print(f"{len(solution['time'])} epochs, {len(table['sat'])} ranges, {solution['ok'].sum()} solved")
+    print(f"  solve_spp      : {t / number * 1e3:8.3f} ms")
+    print(f"  max error      : {np.nanmax(np.abs(errors)) * 1e3:8.3f} mm")
+
+    # ranges through the atmosphere, solved with and without the models
+    ion = read_ion_params(NAV_V3)
+    table = simulate_table(orbits, ion)
+    t = min(timeit.repeat(lambda: solve_spp(table, orbits, ion=ion, tropo=True), number=number, repeat=3))
+    print("with ionosphere/troposphere delays")
+    print(f"  solve_spp      : {t / number * 1e3:8.3f} ms (Klobuchar + Saastamoinen)")
+    for label, kwargs in (("corrected", {'ion': ion, 'tropo': True}), ("uncorrected", {})):
+        errors = spp_errors(solve_spp(table, orbits, **kwargs), REFERENCE_POSITION)
+        print(f"  max error      : {np.nanmax(np.abs(errors)) * 1e3:8.3f} mm {label}")
+
+    # all satellites x all epochs in one call
+    rs = orbits.positions_grid(SATS, TIMES)
+    t = min(timeit.repeat(lambda: atmosphere_delays(TIMES, REFERENCE_POSITION, rs, ion), number=number, repeat=3))
+    print(f"  atmosphere     : {t / number * 1e3:8.3f} ms for {len(SATS)} sats x {len(TIMES)} epochs")
+
+
+if __name__ == '__main__':
+    bench()
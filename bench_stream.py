@@ -0,0 +1,63 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from rinex_obs import open_obs_rinex
+from rinex_stream import RnxCtr, watch_inotify, watch_poll
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "observation")
+OBS_V2 = os.path.join(DATA_DIR, "07590920.05o")
+OBS_V3 = os.path.join(DATA_DIR, "base123i.24o")
+
+
+# Append the file to out_path in pieces of random size (cutting epochs and lines),
+# recording the time every byte offset was flushed
+def replay(file_path, out_path, written, pieces=200, pause=0.005):
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    cuts = np.sort(np.random.default_rng(0).choice(len(data), pieces, replace=False))
+    with open(out_path, 'wb') as out:
+        for a, b in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(data)]])):
+            out.write(data[a:b])
+            out.flush()
+            written.append((b, time.perf_counter()))
+            time.sleep(pause)
+
+
+def bench(file_path, watch):
+    header, epochs = open_obs_rinex(file_path)
+    expected = list(epochs)
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, os.path.basename(file_path))
+        ctr = RnxCtr(out_path)
+        received, latency, written = [], [], []
+
+        # latency: from the flush of the last byte of an epoch to its callback
+        def on_epoch(ctr, epoch):
+            received.append(epoch)
+            flushed = next(t for offset, t in written if offset >= ctr.offset)
+            latency.append(time.perf_counter() - flushed)
+        ctr.subscribe(on_epoch)
+
+        writer = threading.Thread(target=replay, args=(file_path, out_path, written))
+        writer.start()
+        done = lambda: not writer.is_alive() and len(received) >= len(expected)
+        deadline = time.perf_counter() + 30
+        watch([ctr], stop=lambda: done() or time.perf_counter() > deadline)
+        writer.join()
+
+    same = len(received) == len(expected) and all(
+        a.time == b.time and np.array_equal(a.sats, b.sats) and np.array_equal(a.obs, b.obs, equal_nan=True)
+        for a, b in zip(received, expected))
+    print(f"{os.path.basename(file_path)} {watch.__name__}: {len(received)}/{len(expected)} epochs "
+          f"{'ok' if same else 'MISMATCH'}, latency mean {np.mean(latency) * 1e3:.1f} ms "
+          f"max {np.max(latency) * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    for watch in (watch_poll, watch_inotify):
+        bench(OBS_V2, watch)
+        bench(OBS_V3, watch)
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from rinex_obs import open_obs_rinex, read_obs_table
+from rinex_writer import write_obs_table
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "observation")
+OBS_V2 = os.path.join(DATA_DIR, "07590920.05o")
+OBS_V3 = os.path.join(DATA_DIR, "base123i.24o")
+
+
+# Obs table repeated `copies` times with the epochs shifted after each other
+def repeat_table(table, copies):
+    span = table['time'][-1] - table['time'][0] + np.timedelta64(1, 's')
+    out = dict(table)
+    out['time'] = np.concatenate([table['time'] + k * span for k in range(copies)])
+    for key in ('sat', 'obs', 'lli', 'ssi'):
+        out[key] = np.concatenate([table[key]] * copies)
+    return out
+
+
+def bench(file_path, copies=200):
+    header, epochs = open_obs_rinex(file_path)
+    epochs.close()
+    table = repeat_table(read_obs_table(file_path), copies)
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, os.path.basename(file_path))
+        t = time.perf_counter()
+        write_obs_table(out, header, table)
+        t = time.perf_counter() - t
+        size = os.path.getsize(out)
+    print(f"{os.path.basename(file_path)} x{copies}: {len(table['sat'])} records, {size / 1e6:.1f} MB")
+    print(f"  write_obs_table : {t * 1e3:8.1f} ms  ({size / 1e6 / t:.0f} MB/s)")
+
+
+if __name__ == '__main__':
+    bench(OBS_V2)
+    bench(OBS_V3)
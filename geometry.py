@@ -0,0 +1,167 @@
+from collections import OrderedDict
+
+import numpy as np
+
+RE_WGS84 = 6378137.0  # Earth semimajor axis (WGS84) (m)
+FE_WGS84 = 1.0 / 298.257223563  # Earth flattening (WGS84)
+STATION_CACHE = 16  # Stations whose rotation matrix is kept
+GRID_CACHE = 1  # Geometry tensors kept per station (~200 MB for 32 sats x 86400 epochs)
+
+
+# ECEF positions (..., 3) -> geodetic latitude, longitude (rad) and height (m)
+def ecef2pos(r):
+    e2 = FE_WGS84 * (2.0 - FE_WGS84)
+    x, y, z = r[..., 0], r[..., 1], r[..., 2]
+    r2 = x * x + y * y
+    zk = np.zeros_like(z)
+    v = np.full_like(z, RE_WGS84)
+    zz = z.copy()
+    for _ in range(10):
+        zk = zz
+        sinp = zz / np.sqrt(np.maximum(r2 + zz * zz, 1e-12))
+        v = RE_WGS84 / np.sqrt(1.0 - e2 * sinp * sinp)
+        zz = z + v * e2 * sinp
+        if np.abs(zz - zk).max(initial=0.0) < 1e-4:
+            break
+    lat = np.arctan2(zz, np.sqrt(r2))
+    lon = np.arctan2(y, x)
+    h = np.sqrt(r2 + zz * zz) - v
+    return lat, lon, h
+
+
+# Geodetic latitude, longitude (rad) and height (m), broadcastable arrays ->
+# ECEF positions (..., 3) (rtkcmn.c pos2ecef)
+def pos2ecef(lat, lon, h):
+    e2 = FE_WGS84 * (2.0 - FE_WGS84)
+    sinp, cosp = np.sin(lat), np.cos(lat)
+    sinl, cosl = np.sin(lon), np.cos(lon)
+    v = RE_WGS84 / np.sqrt(1.0 - e2 * sinp * sinp)
+    return np.stack(np.broadcast_arrays((v + h) * cosp * cosl, (v + h) * cosp * sinl, (v * (1.0 - e2) + h) * sinp),
+                    axis=-1)
+
+
+# ECEF (..., 3) -> latitude, longitude (deg) and height (m)
+def ecef2lla(r):
+    lat, lon, h = ecef2pos(np.asarray(r, dtype=np.float64))
+    return np.rad2deg(lat), np.rad2deg(lon), h
+
+
+# Latitude, longitude (deg) and height (m) -> ECEF (..., 3)
+def lla2ecef(lat, lon, h):
+    return pos2ecef(np.deg2rad(lat), np.deg2rad(lon), np.asarray(h, dtype=np.float64))
+
+
+# Rotation matrices ECEF -> local east/north/up (..., 3, 3) of geodetic
+# latitudes/longitudes (rad)
+def enu_matrix(lat, lon):
+    sinp, cosp = np.sin(lat), np.cos(lat)
+    sinl, cosl = np.sin(lon), np.cos(lon)
+    zero = np.zeros_like(sinp * sinl)
+    return np.stack([
+        np.stack([-sinl + zero, cosl + zero, zero], axis=-1),
+        np.stack([-sinp * cosl, -sinp * sinl, cosp + zero], axis=-1),
+        np.stack([cosp * cosl, cosp * sinl, sinp + zero], axis=-1),
+    ], axis=-2)
+
+
+# ECEF vectors d (..., 3) -> local east/north/up with rotation matrices E
+# (..., 3, 3) broadcastable to d
+def ecef2enu(d, E):
+    return np.einsum('...ij,...j->...i', E, d)
+
+
+# Azimuth and elevation (rad) of line-of-sight vectors los (..., 3) (ECEF)
+# seen through rotation matrices E (..., 3, 3) broadcastable to los
+def azel(los, E):
+    enu = ecef2enu(los, E)
+    az = np.arctan2(enu[..., 0], enu[..., 1])
+    el = np.arctan2(enu[..., 2], np.hypot(enu[..., 0], enu[..., 1]))
+    return np.where(az < 0.0, az + 2.0 * np.pi, az), el
+
+
+# Dilution of precision (..., 4) GDOP, PDOP, HDOP, VDOP of azimuths/elevations
+# (..., nsat) (rtkcmn.c dops): satellites below el_mask or nan are left out,
+# nan with less than 4 satellites
+def dops(az, el, el_mask=0.0):
+    use = el >= el_mask
+    cosel = np.cos(el)
+    H = np.stack([cosel * np.sin(az), cosel * np.cos(az), np.sin(el), np.ones_like(el)], axis=-1)
+    H = np.where(use[..., None], H, 0.0)
+    N = np.einsum('...si,...sj->...ij', H, H)
+    ok = use.sum(axis=-1) >= 4
+    N[~ok] = np.eye(4)
+    Q = np.linalg.inv(N)
+    q = np.diagonal(Q, axis1=-2, axis2=-1)
+    out = np.sqrt(np.stack([q.sum(axis=-1), q[..., :3].sum(axis=-1), q[..., :2].sum(axis=-1), q[..., 2]], axis=-1))
+    out[~ok] = np.nan
+    return out
+
+
+# Geometry of one station: geodetic position and ECEF -> ENU rotation computed
+# once, plus the (satellite, epoch) geometry tensors of the last max_grids
+# (orbits, sats, times) queries, so that every stage of a run (elevation
+# masks, atmosphere, DOP) shares one evaluation of the orbits; clear() drops
+# the tensors at the end of a run
+class StationGeometry:
+    def __init__(self, rr, max_grids=GRID_CACHE):
+        self.rr = np.array(rr, dtype=np.float64)
+        self.pos = tuple(float(v) for v in ecef2pos(self.rr))
+        self.E = enu_matrix(self.pos[0], self.pos[1])
+        self.max_grids = max_grids
+        self.grids = OrderedDict()
+
+    def clear(self):
+        self.grids.clear()
+
+    # Local east/north/up (..., 3) of ECEF positions r (..., 3)
+    def enu(self, r):
+        return ecef2enu(r - self.rr, self.E)
+
+    # Azimuth and elevation (rad) of satellite ECEF positions rs (..., 3)
+    def azel(self, rs):
+        return azel(rs - self.rr, self.E)
+
+    # Geometry tensor of satellites sats at times (datetime64 or GPS seconds)
+    # from an orbit provider (BroadcastOrbits, PreciseOrbits): rs (nsat, ntime,
+    # 3), range (m), los (unit vectors) and az/el (rad) (nsat, ntime), nan
+    # without ephemeris
+    def grid(self, orbits, sats, times):
+        sats, times = np.asarray(sats), np.asarray(times)
+        key = (id(orbits), sats.tobytes(), str(times.dtype), times.tobytes())
+        cached = self.grids.get(key)
+        if cached is not None and cached[0] is orbits:
+            self.grids.move_to_end(key)
+            return cached[1]
+        rs = orbits.positions_grid(sats, times)
+        d = rs - self.rr
+        r = np.linalg.norm(d, axis=-1)
+        az, el = azel(d, self.E)
+        geom = {'sats': sats, 'time': times, 'rs': rs, 'range': r, 'los': d / r[..., None], 'az': az, 'el': el}
+        self.grids[key] = (orbits, geom)
+        while len(self.grids) > self.max_grids:
+            self.grids.popitem(last=False)
+        return geom
+
+
+station_cache = OrderedDict()
+
+
+# StationGeometry of an ECEF position, shared by all callers of the run
+def station_geometry(rr):
+    rr = np.asarray(rr, dtype=np.float64)
+    key = rr.tobytes()
+    station = station_cache.get(key)
+    if station is None:
+        station = station_cache[key] = StationGeometry(rr)
+        if len(station_cache) > STATION_CACHE:
+            station_cache.popitem(last=False)
+    else:
+        station_cache.move_to_end(key)
+    return station
+
+
+# Drop the shared stations and their geometry tensors
+def clear_station_cache():
+    for station in station_cache.values():
+        station.clear()
+    station_cache.clear()
@@ -0,0 +1,105 @@
+import numpy as np
+
+# GPS time (gtime): int64 nanoseconds since the GPS epoch (1980-01-06 00:00:00 GPST).
+# Every function works on Python scalars as well as on NumPy arrays, so a million
+# epochs are handled with the same integer arithmetic as one.
+
+GPS_EPOCH = np.datetime64('1980-01-06T00:00:00', 'ns')  # GPS time origin
+GPS_EPOCH_DAYS = 3657  # Days from 1970-01-01 to the GPS epoch
+NS = 1000000000  # Nanoseconds per second
+DAY_NS = 86400 * NS
+WEEK_NS = 7 * DAY_NS
+
+
+# Days since 1970-01-01 of a proleptic Gregorian date (y, m, d may be arrays)
+def days_from_civil(y, m, d):
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * ((m + 9) % 12) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+# Calendar epoch (..., 6) {year, month, day, hour, min, sec} -> gtime.
+# Two digit years are taken as 1980-2079.
+def epoch2gtime(ep):
+    ep = np.asarray(ep, dtype=np.float64)
+    year = ep[..., 0]
+    year = np.where(year < 80, year + 2000, np.where(year < 100, year + 1900, year))
+    ymd = [x.astype(np.int64) for x in (year, ep[..., 1], ep[..., 2])]
+    days = days_from_civil(*ymd) - GPS_EPOCH_DAYS
+    secs = (ep[..., 3].astype(np.int64) * 3600 + ep[..., 4].astype(np.int64) * 60) * NS
+    return days * DAY_NS + secs + np.round(ep[..., 5] * NS).astype(np.int64)
+
+
+# gtime -> calendar epoch (..., 6)
+def gtime2epoch(t):
+    dt = gtime2datetime64(t)
+    days = dt.astype('M8[D]')
+    months = dt.astype('M8[M]')
+    years = dt.astype('M8[Y]')
+    sod = (dt - days).astype(np.int64) / NS
+    return np.stack([years.astype(np.int64) + 1970.0,
+                     (months - years).astype(np.int64) + 1.0,
+                     (days - months).astype(np.int64) + 1.0,
+                     sod // 3600, sod % 3600 // 60, sod % 60], axis=-1)
+
+
+# Epoch strings ("yyyy mm dd hh mm ss.sssssss" or ver.2 "yy mm dd hh mm ss.s") -> gtime
+def str2gtime(strings):
+    ep = np.array([s.split()[:6] for s in np.atleast_1d(strings)], dtype=np.float64).reshape(-1, 6)
+    return epoch2gtime(ep).reshape(np.shape(strings))
+
+
+def datetime2gtime(t):
+    return (np.asarray(t, dtype='M8[ns]') - GPS_EPOCH).astype(np.int64)
+
+
+def gtime2datetime64(t):
+    return GPS_EPOCH + np.asarray(t, dtype=np.int64).astype('m8[ns]')
+
+
+# gtime from datetime64 or already int64 times
+def as_gtime(t):
+    t = np.asarray(t)
+    return datetime2gtime(t) if t.dtype.kind == 'M' else t.astype(np.int64)
+
+
+# t1 - t2 (s)
+def timediff(t1, t2):
+    return (np.asarray(t1, dtype=np.int64) - np.asarray(t2, dtype=np.int64)) / NS
+
+
+# t + sec
+def timeadd(t, sec):
+    return np.asarray(t, dtype=np.int64) + np.round(np.asarray(sec) * NS).astype(np.int64)
+
+
+# gtime -> (GPS week, time of week (s))
+def time2gpst(t):
+    t = np.asarray(t, dtype=np.int64)
+    return t // WEEK_NS, (t % WEEK_NS) / NS
+
+
+def gpst2time(week, sec):
+    return np.asarray(week, dtype=np.int64) * WEEK_NS + np.round(np.asarray(sec) * NS).astype(np.int64)
+
+
+# Adjust time considering week handover: t within half a week of t0
+def adjweek(t, t0):
+    tt = np.asarray(t, dtype=np.int64) - np.asarray(t0, dtype=np.int64)
+    return t + np.where(tt < -WEEK_NS // 2, WEEK_NS, np.where(tt > WEEK_NS // 2, -WEEK_NS, 0))
+
+
+# Adjust time considering day handover: t within half a day of t0
+def adjday(t, t0):
+    tt = np.asarray(t, dtype=np.int64) - np.asarray(t0, dtype=np.int64)
+    return t + np.where(tt < -DAY_NS // 2, DAY_NS, np.where(tt > DAY_NS // 2, -DAY_NS, 0))
+
+
+# gtime -> "yyyy/mm/dd hh:mm:ss.sss" with n (0, 3, 6 or 9) decimals
+def time2str(t, n=0):
+    unit = {0: 's', 3: 'ms', 6: 'us', 9: 'ns'}[n]
+    s = np.datetime_as_string(gtime2datetime64(t), unit=unit)
+    return np.char.replace(np.char.replace(s, '-', '/'), 'T', ' ')
@@ -0,0 +1,196 @@
+import os
+
+import numpy as np
+
+from gtime import datetime2gtime, gtime2datetime64
+from rinex_obs import open_obs_rinex
+from rinex6 import syscodes
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_results')
+CSV_COLUMNS = 'sat,obs_type,count,mean,std,min,max,gaps,first,last'
+SAT_GROW = 64  # Satellite rows added at a time
+NO_TIME = np.iinfo(np.int64).min  # first/last time of a cell without values
+
+
+# Online statistics of every (satellite, obs type) cell of an OBS file, updated
+# one epoch at a time in constant memory (Welford): count, mean, M2 (sum of
+# squared deviations), min, max, first/last time and gaps. A gap is a missing
+# epoch of the stream between two values of a cell. Partial results of
+# consecutive epoch ranges (e.g. file chunks parsed in parallel) are combined
+# with merge() into the result of the whole stream.
+class ObsStats:
+    def __init__(self, header):
+        self.header = header
+        self.ntype = max([len(header.obs_types(sys)) for sys in syscodes] + [1])
+        self.sats = {}  # satellite -> row
+        self.first_epoch = NO_TIME  # first and last epoch of the stream
+        self.last_epoch = NO_TIME
+        self.count = np.zeros((0, self.ntype), dtype=np.int64)
+        self.mean = np.zeros((0, self.ntype))
+        self.m2 = np.zeros((0, self.ntype))
+        self.min = np.zeros((0, self.ntype))
+        self.max = np.zeros((0, self.ntype))
+        self.gaps = np.zeros((0, self.ntype), dtype=np.int64)
+        self.first = np.zeros((0, self.ntype), dtype=np.int64)
+        self.last = np.zeros((0, self.ntype), dtype=np.int64)
+
+    # Rows of satellites, new ones appended
+    def rows(self, sats):
+        for sat in sats:
+            if sat not in self.sats:
+                self.sats[sat] = len(self.sats)
+        if len(self.sats) > len(self.count):
+            grow = max(len(self.sats) - len(self.count), SAT_GROW)
+            for name, fill in (('count', 0), ('mean', 0.0), ('m2', 0.0), ('min', np.inf), ('max', -np.inf),
+                               ('gaps', 0), ('first', NO_TIME), ('last', NO_TIME)):
+                old = getattr(self, name)
+                setattr(self, name, np.concatenate([old, np.full((grow, self.ntype), fill, dtype=old.dtype)]))
+        return np.array([self.sats[sat] for sat in sats], dtype=np.int64)
+
+    def update(self, epoch):
+        if len(epoch.sats) == 0:
+            return
+        rows = self.rows(epoch.sats)
+        k = min(epoch.obs.shape[1], self.ntype)
+        x = np.full((len(rows), self.ntype), np.nan)
+        x[:, :k] = epoch.obs[:, :k]
+        ok = ~np.isnan(x)
+        r, c = np.nonzero(ok)
+        r = rows[r]
+        x = x[ok]
+
+        # a value whose cell was last seen before the previous epoch ends a gap
+        seen = self.count[r, c] > 0
+        self.gaps[r, c] += seen & (self.last[r, c] != self.last_epoch)
+        self.first[r[~seen], c[~seen]] = epoch.time
+        self.last[r, c] = epoch.time
+
+        n = self.count[r, c] + 1
+        delta = x - self.mean[r, c]
+        mean = self.mean[r, c] + delta / n
+        self.m2[r, c] += delta * (x - mean)
+        self.mean[r, c] = mean
+        self.count[r, c] = n
+        self.min[r, c] = np.minimum(self.min[r, c], x)
+        self.max[r, c] = np.maximum(self.max[r, c], x)
+
+        if self.first_epoch == NO_TIME:
+            self.first_epoch = epoch.time
+        self.last_epoch = epoch.time
+
+    # Add the statistics of the epochs following this stream (Chan et al.
+    # pairwise update); a cell present at both ends of the boundary without a
+    # missing epoch in between continues its run, otherwise the boundary is a gap
+    def merge(self, other):
+        if other.first_epoch == NO_TIME:
+            return self
+        names = list(other.sats)
+        dst = self.rows(names)
+        src = np.array([other.sats[name] for name in names], dtype=np.int64)
+        nb = other.count[src]
+        have = nb > 0
+        r, c = np.nonzero(have)
+        s, d = src[r], dst[r]
+
+        na = self.count[d, c]
+        nb = other.count[s, c]
+        n = na + nb
+        delta = other.mean[s, c] - self.mean[d, c]
+        self.m2[d, c] += other.m2[s, c] + delta ** 2 * na * nb / n
+        self.mean[d, c] += delta * nb / n
+        self.count[d, c] = n
+        self.min[d, c] = np.minimum(self.min[d, c], other.min[s, c])
+        self.max[d, c] = np.maximum(self.max[d, c], other.max[s, c])
+
+        joined = (self.last[d, c] == self.last_epoch) & (other.first[s, c] == other.first_epoch)
+        self.gaps[d, c] += other.gaps[s, c] + ((na > 0) & ~joined)
+        self.first[d, c] = np.where(na > 0, self.first[d, c], other.first[s, c])
+        self.last[d, c] = other.last[s, c]
+
+        if self.first_epoch == NO_TIME:
+            self.first_epoch = other.first_epoch
+        self.last_epoch = other.last_epoch
+        return self
+
+    # Add an OBS table of the epochs following this stream: read_obs_table(),
+    # read_obs_table_parallel() or the shared memory views of
+    # read_obs_table_shared(), which are only read. The cells of the table are
+    # sorted once and reduced segment-wise, then merged.
+    def add_table(self, table):
+        if len(table['sat']) == 0:
+            return self
+        part = ObsStats(self.header)
+        times = datetime2gtime(table['time'])
+        epoch = np.unique(times, return_inverse=True)[1]
+        names, sat_index = np.unique(table['sat'], return_inverse=True)
+        rows = part.rows(names.tolist())[sat_index]
+        obs = table['obs'][:, :self.ntype]
+        r, c = np.nonzero(~np.isnan(obs))
+        part.first_epoch, part.last_epoch = times.min(), times.max()
+        if len(r) == 0:
+            return self.merge(part)
+        cell = rows[r] * self.ntype + c
+        srt = np.lexsort((epoch[r], cell))
+        r, cell = r[srt], cell[srt]
+        x = obs[r, c[srt]]
+
+        first = np.flatnonzero(np.concatenate([[True], cell[1:] != cell[:-1]]))
+        last = np.append(first[1:], len(cell)) - 1
+        cells = cell[first]
+        count = np.diff(np.append(first, len(cell)))
+        mean = np.add.reduceat(x, first) / count
+        dev = x - np.repeat(mean, count)
+        gap = np.diff(epoch[r]) > 1
+        gap[last[:-1]] = False  # differences between cells
+
+        part.count.reshape(-1)[cells] = count
+        part.mean.reshape(-1)[cells] = mean
+        part.m2.reshape(-1)[cells] = np.add.reduceat(dev * dev, first)
+        part.min.reshape(-1)[cells] = np.minimum.reduceat(x, first)
+        part.max.reshape(-1)[cells] = np.maximum.reduceat(x, first)
+        part.gaps.reshape(-1)[cells] = np.add.reduceat(np.append(gap, False), first)
+        part.first.reshape(-1)[cells] = times[r[first]]
+        part.last.reshape(-1)[cells] = times[r[last]]
+        return self.merge(part)
+
+    # One record per (satellite, obs type) with values, satellites sorted
+    def records(self):
+        for sat in sorted(self.sats):
+            row = self.sats[sat]
+            types = self.header.obs_types(sat[0]) if sat[0] in syscodes else []
+            for col, obs_type in enumerate(types[:self.ntype]):
+                n = self.count[row, col]
+                if n == 0:
+                    continue
+                yield {'sat': sat, 'obs_type': obs_type, 'count': int(n), 'mean': self.mean[row, col],
+                       'std': np.sqrt(self.m2[row, col] / n), 'min': self.min[row, col],
+                       'max': self.max[row, col], 'gaps': int(self.gaps[row, col]),
+                       'first': self.first[row, col], 'last': self.last[row, col]}
+
+    def write_csv(self, file_path, obs_types=None):
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(CSV_COLUMNS + '\n')
+            for rec in self.records():
+                if obs_types is not None and rec['obs_type'] not in obs_types:
+                    continue
+                first, last = (np.datetime_as_string(gtime2datetime64(rec[key]), unit='s')
+                               for key in ('first', 'last'))
+                file.write(f"{rec['sat']},{rec['obs_type']},{rec['count']},{rec['mean']:.4f},{rec['std']:.4f},"
+                           f"{rec['min']:.4f},{rec['max']:.4f},{rec['gaps']},{first},{last}\n")
+        os.replace(tmp_path, file_path)
+
+
+# Statistics of a whole OBS file, streamed epoch by epoch
+def file_stats(file_path):
+    header, epochs = open_obs_rinex(file_path)
+    stats = ObsStats(header)
+    for epoch in epochs:
+        stats.update(epoch)
+    return stats
+
+
+# csv_results/<OBS file name>.csv
+def csv_path(file_path, out_dir=CSV_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, os.path.basename(file_path) + '.csv')
@@ -0,0 +1,316 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from gtime import NS, epoch2gtime, str2gtime
+from rinex_compress import open_rinex_binary
+from rinex6 import satid2code
+from satpos import BDT_GPST, CLIGHT, as_gps_seconds
+
+NMAX = 10  # Order of the polynomial interpolation of precise orbits (preceph.c)
+NODES = np.arange(NMAX + 1)  # Node offsets in an interpolation window
+MAXDTE = 900.0  # Max time difference to the first/last SP3 or CLK epoch (s)
+OMGE = 7.2921151467e-5  # Earth rotation rate (rad/s, WGS84)
+REL_DT = 1e-3  # Time step of the velocity in the relativistic correction (s)
+WINDOW_CACHE = 16  # Query time sets whose interpolation windows are kept
+
+SP3_LINE_LEN = 80
+SP3_FIELD_LEN = 14  # Width of one x/y/z (km) or clock (us) field of a P record
+SP3_BAD = 999999.0  # Bad or absent values are 999999.999999
+CLK_LINE_LEN = 80
+CLK_304_SHIFT = 5  # Columns added by the ver.3.04 9 character station/satellite names
+CLK_EPOCH_FIELDS = [(8, 12), (13, 15), (16, 18), (19, 21), (22, 24), (25, 34)]  # yyyy mm dd hh mm ss
+# SP3 time systems -> offset to GPST (s); UTC/GLO would need leap seconds
+SP3_TIME_SYSTEMS = {'GPS': 0.0, 'GAL': 0.0, 'QZS': 0.0, 'IRN': 0.0, 'BDT': BDT_GPST}
+
+
+# Per-satellite value grids ({'time': gtime (ntime,), 'sats': (nsat,), name:
+# (nsat, ntime, ...)}) of several files joined on the union of their
+# satellites and epochs; a value present in a later file replaces the one of
+# an earlier file (rinex.c combpclk, preceph.c combpeph)
+def combine_grids(grids):
+    if len(grids) == 1:
+        return grids[0]
+    names = [name for name in grids[0] if name not in ('time', 'sats') and all(name in g for g in grids)]
+    sats = np.unique(np.concatenate([g['sats'] for g in grids]))
+    time = np.unique(np.concatenate([g['time'] for g in grids]))
+    out = {'time': time, 'sats': sats}
+    for name in names:
+        shape = grids[0][name].shape[2:]
+        out[name] = np.full((len(sats), len(time)) + shape, np.nan)
+    for g in grids:
+        rows = np.searchsorted(sats, g['sats'])[:, None]
+        cols = np.searchsorted(time, g['time'])[None, :]
+        for name in names:
+            old = out[name][rows, cols]
+            out[name][rows, cols] = np.where(np.isnan(g[name]), old, g[name])
+    return out
+
+
+# True for the names that are satellite codes ("G01", "R24", ...), each
+# distinct name checked once
+def valid_sats(names):
+    unique, inverse = np.unique(names, return_inverse=True)
+    return np.array([satid2code(name) == name for name in unique], dtype=bool)[inverse]
+
+
+# Convert a (..., 14) byte block of SP3 fields into floats, blank, zero and
+# bad fields -> nan
+def sp3_fields_to_float(fields):
+    fields = np.ascontiguousarray(fields)
+    blank = (fields == ord(' ')).all(axis=-1)
+    fields[blank, -1] = ord('0')
+    values = fields.view('S%d' % SP3_FIELD_LEN)[..., 0].astype(np.float64)
+    values[blank | (values == 0.0) | (np.abs(values) >= SP3_BAD)] = np.nan
+    return values
+
+
+# SP3-a/b/c/d precise ephemeris file (plain, .gz or .Z) -> {'time': gtime
+# (ntime,), 'sats': (nsat,), 'pos': ECEF (nsat, ntime, 3) m, 'clk': (nsat,
+# ntime) s}, nan where a satellite has no value. Velocity records are skipped.
+def read_sp3(file_path):
+    with open_rinex_binary(file_path) as file:
+        data = file.read()
+    if data[:1] != b'#':
+        raise ValueError(f"not an SP3 file: {file_path}")
+    lines = b''.join([line[:SP3_LINE_LEN].ljust(SP3_LINE_LEN) for line in data.splitlines()])
+    chars = np.frombuffer(lines, dtype=np.uint8).reshape(-1, SP3_LINE_LEN)
+
+    tsys = 'GPS'
+    head = np.flatnonzero((chars[:, 0] == ord('%')) & (chars[:, 1] == ord('c')))
+    if len(head) and data[:2] not in (b'#a', b'#b'):
+        tsys = chars[head[0], 9:12].tobytes().decode().strip() or 'GPS'
+    if tsys not in SP3_TIME_SYSTEMS:
+        raise ValueError(f"unsupported SP3 time system {tsys}: {file_path}")
+
+    epochs = np.flatnonzero(chars[:, 0] == ord('*'))
+    records = np.flatnonzero(chars[:, 0] == ord('P'))
+    strings = [chars[i, 3:31].tobytes().decode() for i in epochs]
+    time = str2gtime(np.array(strings, dtype='U28')) + round(SP3_TIME_SYSTEMS[tsys] * NS)
+    epoch = np.searchsorted(epochs, records) - 1
+    keep = epoch >= 0
+    records, epoch = records[keep], epoch[keep]
+
+    ids = chars[records, 1:4].copy()
+    ids[ids == ord(' ')] = ord('0')  # "G 1" -> "G01", SP3-a " 1" -> "001"
+    ids[ids[:, 0] == ord('0'), 0] = ord('G')
+    names = ids.view('S3')[:, 0].astype('U3')
+    valid = valid_sats(names)
+    names, records, epoch = names[valid], records[valid], epoch[valid]
+
+    values = sp3_fields_to_float(chars[records, 4:4 + 4 * SP3_FIELD_LEN].reshape(-1, 4, SP3_FIELD_LEN))
+    sats, row = np.unique(names, return_inverse=True)
+    pos = np.full((len(sats), len(time), 3), np.nan)
+    clk = np.full((len(sats), len(time)), np.nan)
+    pos[row, epoch] = values[:, :3] * 1e3
+    clk[row, epoch] = values[:, 3] * 1e-6
+    pos[np.isnan(pos).any(axis=-1)] = np.nan
+    return {'time': time, 'sats': sats, 'pos': pos, 'clk': clk}
+
+
+# Fixed width fields [start, end) of the rows of a char matrix -> floats,
+# blank fields -> nan
+def char_fields_to_float(chars, start, end):
+    fields = np.ascontiguousarray(chars[:, start:end])
+    blank = (fields == ord(' ')).all(axis=-1)
+    fields[blank, -1] = ord('0')
+    values = fields.view('S%d' % (end - start))[:, 0].astype(np.float64)
+    values[blank] = np.nan
+    return values
+
+
+# RINEX clock file (plain, .gz or .Z) -> satellite clocks {'time': gtime
+# (ntime,), 'sats': (nsat,), 'clk': (nsat, ntime) s, 'std': (nsat, ntime) s}
+# from the AS records (rinex.c readrnxclk), fixed columns read for all records
+# at once; ver.3.04 records (9 character names) are shifted by CLK_304_SHIFT
+def read_clk(file_path):
+    with open_rinex_binary(file_path) as file:
+        data = file.read()
+    end = data.find(b'END OF HEADER')
+    if end < 0:
+        raise ValueError("END OF HEADER not found")
+    shift = CLK_304_SHIFT if float(data[:9]) >= 3.04 else 0
+    width = CLK_LINE_LEN + shift
+    body = data[data.find(b'\n', end) + 1:].replace(b'D', b'E')
+    lines = b''.join([line[:width].ljust(width) for line in body.splitlines() if line.startswith(b'AS')])
+    chars = np.frombuffer(lines, dtype=np.uint8).reshape(-1, width)
+
+    ids = chars[:, 3:6].copy()
+    ids[ids == ord(' ')] = ord('0')  # "G 1" -> "G01"
+    names = ids.view('S3')[:, 0].astype('U3')
+    ep = np.stack([char_fields_to_float(chars, start + shift, end + shift) for start, end in CLK_EPOCH_FIELDS], axis=-1)
+    bias = char_fields_to_float(chars, 40 + shift, 59 + shift)
+    std = char_fields_to_float(chars, 60 + shift, 79 + shift)
+    valid = valid_sats(names) & ~np.isnan(ep).any(axis=-1) & ~np.isnan(bias)
+
+    time, col = np.unique(epoch2gtime(ep[valid]), return_inverse=True)
+    sats, row = np.unique(names[valid], return_inverse=True)
+    clk = np.full((len(sats), len(time)), np.nan)
+    clk_std = np.full((len(sats), len(time)), np.nan)
+    clk[row, col] = bias[valid]
+    clk_std[row, col] = std[valid]
+    return {'time': time, 'sats': sats, 'clk': clk, 'std': clk_std}
+
+
+# Relativistic clock correction -2 r.v / c^2 (s) from the positions at t and
+# t + REL_DT
+def relativity(rs, rs_dt):
+    vs = (rs_dt - rs) / REL_DT
+    return -2.0 * np.sum(rs * vs, axis=-1) / CLIGHT ** 2
+
+
+# Satellite positions and clocks from precise ephemerides (SP3 grids of
+# read_sp3) and optionally precise clocks (CLK grids of read_clk, otherwise
+# the SP3 clocks), with the interface of satpos.BroadcastOrbits. Positions are
+# interpolated by a 10th order Lagrange polynomial over the 11 SP3 epochs
+# around each query time, with the nodes rotated into the earth-fixed frame of
+# the query time; clocks linearly between the two CLK epochs around it
+# (preceph.c pephpos/pephclk). The windows and weights depend on the query
+# times only and are shared by all satellites; they are cached per set of
+# query times, so repeating positions_grid/clock_grid over the epochs of the
+# same day only gathers and sums the node values.
+class PreciseOrbits:
+    def __init__(self, sp3, clk=None):
+        self.sats = sp3['sats']
+        self.time = sp3['time'] / NS
+        self.xyz = np.ascontiguousarray(np.moveaxis(sp3['pos'], -1, 0))  # (3, nsat, ntime)
+        if clk is None:
+            clk = sp3
+        self.clk_sats = clk['sats']
+        self.clk_time = clk['time'] / NS
+        self.clk = clk['clk']
+        self.windows = OrderedDict()
+
+    # Row of each satellite in sats (sorted names), -1 if not present
+    @staticmethod
+    def rows(sats, names):
+        if len(sats) == 0:
+            return np.full(np.shape(names), -1)
+        idx = np.minimum(np.searchsorted(sats, names), len(sats) - 1)
+        return np.where(sats[idx] == names, idx, -1)
+
+    # Cached windows of a 1-D array of query times (GPS seconds)
+    def cached(self, kind, t, build):
+        key = (kind, t.tobytes())
+        win = self.windows.get(key)
+        if win is None:
+            win = build(t)
+            self.windows[key] = win
+            if len(self.windows) > WINDOW_CACHE:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(key)
+        return win
+
+    # Orbit windows: first node j0 and the weights of every node (n, NMAX + 1)
+    # with the earth rotation folded in (w cos, w sin, w), valid flag
+    def orbit_window(self, t):
+        ne = len(self.time)
+        if ne <= NMAX:
+            zeros = np.zeros((len(t), NMAX + 1))
+            return np.zeros(len(t), dtype=np.int64), zeros, zeros, zeros, np.zeros(len(t), dtype=bool)
+        ok = (t >= self.time[0] - MAXDTE) & (t <= self.time[-1] + MAXDTE)
+        index = np.maximum(np.searchsorted(self.time, t) - 1, 0)
+        j0 = np.clip(index - (NMAX + 1) // 2, 0, ne - NMAX - 1)
+        dt = self.time[j0[:, None] + NODES] - t[:, None]
+
+        # w_j = prod_{k != j} (0 - dt_k) / (dt_j - dt_k)
+        num = np.broadcast_to(-dt[:, None, :], dt.shape + (NMAX + 1,)).copy()
+        den = dt[:, :, None] - dt[:, None, :]
+        num[:, NODES, NODES] = 1.0
+        den[:, NODES, NODES] = 1.0
+        w = num.prod(axis=2) / den.prod(axis=2)
+        return j0, w * np.cos(OMGE * dt), w * np.sin(OMGE * dt), w, ok
+
+    # Clock windows: first node and linear weights (n, 2), valid flag
+    def clock_window(self, t):
+        nc = len(self.clk_time)
+        if nc < 2:
+            return np.zeros(len(t), dtype=np.int64), np.ones((len(t), 2)), np.zeros(len(t), dtype=bool)
+        ok = (t >= self.clk_time[0] - MAXDTE) & (t <= self.clk_time[-1] + MAXDTE)
+        index = np.clip(np.searchsorted(self.clk_time, t) - 1, 0, nc - 2)
+        t0 = t - self.clk_time[index]
+        t1 = t - self.clk_time[index + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.stack([-t1 / (t0 - t1), t0 / (t0 - t1)], axis=-1)
+        w[t0 <= 0.0] = (1.0, 0.0)  # before the first / after the last epoch: nearest value
+        w[(t0 > 0.0) & (t1 >= 0.0)] = (0.0, 1.0)
+        return index, w, ok
+
+    # Positions (n, 3) of satellite rows i at window entries k (1-D arrays);
+    # node values (..., NMAX + 1) rotated to the query time and summed
+    def interp_orbit(self, i, k, win):
+        j0, wc, ws, w, _ = win
+        nodes = j0[k][:, None] + NODES
+        x, y, z = (self.xyz[c][i[:, None], nodes] for c in range(3))
+        wc, ws, w = wc[k], ws[k], w[k]
+        return np.stack([(wc * x - ws * y).sum(axis=-1), (ws * x + wc * y).sum(axis=-1),
+                         (w * z).sum(axis=-1)], axis=-1)
+
+    # Clock offsets (...) of clock rows isat at window entries k (broadcastable)
+    def interp_clock(self, isat, k, win):
+        index, w, ok = win
+        isat, k = np.broadcast_arrays(isat, k)
+        dts = np.full(isat.shape, np.nan)
+        sel = ok[k] & (isat >= 0)
+        i, k = isat[sel], k[sel]
+        c0, c1 = self.clk[i, index[k]], self.clk[i, index[k] + 1]
+        w0, w1 = w[k, 0], w[k, 1]
+        dts[sel] = np.where(w1 == 0.0, c0, np.where(w0 == 0.0, c1, w0 * c0 + w1 * c1))
+        return dts
+
+    # ECEF positions (..., 3) of satellites sats at times t (GPS seconds or
+    # datetime64, broadcastable arrays), nan where no precise orbit is available
+    def positions(self, sats, t):
+        sats, t = np.broadcast_arrays(np.asarray(sats), as_gps_seconds(t))
+        tu, k = np.unique(t, return_inverse=True)
+        win = self.cached('orbit', tu, self.orbit_window)
+        isat, k = self.rows(self.sats, sats), k.reshape(t.shape)
+        rs = np.full(t.shape + (3,), np.nan)
+        sel = win[-1][k] & (isat >= 0)
+        rs[sel] = self.interp_orbit(isat[sel], k[sel], win)
+        return rs
+
+    # Positions for every satellite at every epoch: (nsat, ntime, 3)
+    def positions_grid(self, sats, times):
+        times = np.ascontiguousarray(as_gps_seconds(times))
+        j0, wc, ws, w, ok = self.cached('orbit', times, self.orbit_window)
+        isat = self.rows(self.sats, np.asarray(sats))
+        have = isat >= 0
+        nodes = j0[:, None] + NODES
+        x, y, z = (self.xyz[c][isat[have]][:, nodes] for c in range(3))  # (nsat, ntime, NMAX + 1)
+        rs = np.full((len(isat), len(times), 3), np.nan)
+        rs[have] = np.stack([np.einsum('tj,stj->st', wc, x) - np.einsum('tj,stj->st', ws, y),
+                             np.einsum('tj,stj->st', ws, x) + np.einsum('tj,stj->st', wc, y),
+                             np.einsum('tj,stj->st', w, z)], axis=-1)
+        rs[:, ~ok] = np.nan
+        return rs
+
+    # Satellite clock offsets (s) of sats at times t (broadcastable arrays),
+    # with the relativistic correction (rel), nan where no clock is available
+    def clock_bias(self, sats, t, rel=True):
+        sats, t = np.broadcast_arrays(np.asarray(sats), as_gps_seconds(t))
+        tu, k = np.unique(t, return_inverse=True)
+        win = self.cached('clock', tu, self.clock_window)
+        dts = self.interp_clock(self.rows(self.clk_sats, sats), k.reshape(t.shape), win)
+        if rel:
+            dts += relativity(self.positions(sats, t), self.positions(sats, t + REL_DT))
+        return dts
+
+    # Clock offsets for every satellite at every epoch: (nsat, ntime)
+    def clock_grid(self, sats, times, rel=True):
+        times = np.ascontiguousarray(as_gps_seconds(times))
+        win = self.cached('clock', times, self.clock_window)
+        sats = np.asarray(sats)
+        dts = self.interp_clock(self.rows(self.clk_sats, sats)[:, None], np.arange(len(times))[None, :], win)
+        if rel:
+            dts += relativity(self.positions_grid(sats, times), self.positions_grid(sats, times + REL_DT))
+        return dts
+
+
+# Precise orbits of SP3 files and optional CLK files (e.g. the three days
+# around the processed one), each group combined in the given order
+def read_precise(sp3_files, clk_files=()):
+    sp3 = combine_grids([read_sp3(path) for path in sp3_files])
+    clk = combine_grids([read_clk(path) for path in clk_files]) if clk_files else None
+    return PreciseOrbits(sp3, clk)
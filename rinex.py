@@ -15,7 +15,7 @@ import glob
 
 # app
 from pyEvents import Event
-from Utils import ecef2lla
+from geometry import ecef2lla
 from pyRinexName import check_year
 import pyRinexName
 import pyDate
@@ -27,6 +27,7 @@ from Utils import (file_open,
                    file_readlines,
                    struct_unpack,
                    chmod_exec)
+from rinex_header import HEADER_FORMATS
 
 TYPE_CRINEZ = 0
 TYPE_RINEX  = 1
@@ -104,56 +105,56 @@ class RinexRecord(object):
         # list of required header records and a flag to know if they were found or not in the current header
         # also, have a tuple of default values in case there is a missing record
         self.required_records = {'RINEX VERSION / TYPE':
-                                     {'format_tuple': ('%9.2f', '%11s', '%1s', '%19s', '%1s', '%19s'),
+                                     {'format_tuple': HEADER_FORMATS['RINEX VERSION / TYPE'],
                                       'found': False,
                                       'default': ('',)},
 
                                  'PGM / RUN BY / DATE':
-                                     {'format_tuple': ('%-20s', '%-20s', '%-20s'),
+                                     {'format_tuple': HEADER_FORMATS['PGM / RUN BY / DATE'],
                                       'found': False,
                                       'default': ('pyRinex: 1.00 000', 'Parallel.PPP', '21FEB17 00:00:00')},
 
                                  'MARKER NAME':
-                                     {'format_tuple': ('%-60s',),
+                                     {'format_tuple': HEADER_FORMATS['MARKER NAME'],
                                       'found': False,
                                       'default': (self.StationCode.upper(),)},
 
                                  'MARKER NUMBER':
-                                     {'format_tuple': ('%-20s',),
+                                     {'format_tuple': HEADER_FORMATS['MARKER NUMBER'],
                                       'found': False,
                                       'default': (self.StationCode.upper(),)},
 
                                  'OBSERVER / AGENCY':
-                                     {'format_tuple': ('%-20s', '%-40s'),
+                                     {'format_tuple': HEADER_FORMATS['OBSERVER / AGENCY'],
                                       'found': False,
                                       'default': ('UNKNOWN', 'UNKNOWN')},
 
                                  'REC # / TYPE / VERS':
-                                     {'format_tuple': ('%-20s', '%-20s', '%-20s'),
+                                     {'format_tuple': HEADER_FORMATS['REC # / TYPE / VERS'],
                                       'found': False,
                                       'default': ('0000000', 'ASHTECH Z-XII3', 'CC00')},
 
                                  'ANT # / TYPE':
-                                     {'format_tuple': ('%-20s', '%-20s'),
+                                     {'format_tuple': HEADER_FORMATS['ANT # / TYPE'],
                                       'found': False,
                                       'default': ('0000', 'ASH700936C_M SNOW')},
 
                                  'ANTENNA: DELTA H/E/N':
-                                     {'format_tuple': ('%14.4f', '%14.4f', '%14.4f'),
+                                     {'format_tuple': HEADER_FORMATS['ANTENNA: DELTA H/E/N'],
                                       'found': False,
                                       'default': (0.0, 0.0, 0.0)},
 
                                  'APPROX POSITION XYZ':
-                                     {'format_tuple': ('%14.4f', '%14.4f', '%14.4f'),
+                                     {'format_tuple': HEADER_FORMATS['APPROX POSITION XYZ'],
                                       'found': False,
                                       'default': (0.0, 0.0, 6371000.0)},
                                  # '# / TYPES OF OBSERV' : [('%6i',), False, ('',)],
                                  'TIME OF FIRST OBS':
-                                     {'format_tuple': ('%6i', '%6i', '%6i', '%6i', '%6i', '%13.7f', '%8s'),
+                                     {'format_tuple': HEADER_FORMATS['TIME OF FIRST OBS'],
                                       'found': False,
                                       'default': (1, 1, 1, 1, 1, 0, 'GPS')},
                                  'INTERVAL':
-                                     {'format_tuple': ('%10.3f',),
+                                     {'format_tuple': HEADER_FORMATS['INTERVAL'],
                                       'found': False,
                                       'default': (30,)},  # put a wrong interval when first reading the file so that
                                  # RinSum does not fail to read RINEX if interval record is > 60 chars
@@ -163,7 +164,7 @@ class RinexRecord(object):
                                  # True, (int(first_obs.year), int(first_obs.month), int(first_obs.day),
                                  # int(23), int(59), float(59), 'GPS')],
                                  'COMMENT':
-                                     {'format_tuple': ('%-60s',), 'found': True, 'default': ('',)}}
+                                     {'format_tuple': HEADER_FORMATS['COMMENT'], 'found': True, 'default': ('',)}}
 
         fieldnames = ['NetworkCode','StationCode','ObservationYear','ObservationMonth','ObservationDay',
                       'ObservationDOY','ObservationFYear','ObservationSTime','ObservationETime','ReceiverType',
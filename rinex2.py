@@ -15,29 +15,204 @@ list_obs_types(rinex_path)
 """   
 
 
-from flask import Flask, render_template
-import georinex as gr
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from flask import Flask, abort, jsonify, render_template, request
+
+from batch import find_files, parse_rinex_name
+from rinex_cache import load_obs
+
+DATA_DIR = os.environ.get('RINEX_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+DEFAULT_FILE = 'ANKR00TUR_R_20190010000_01D_30S_MO_edited.rnx'
+OBS_TYPE = 'L1C'  # Obs type analyzed (ver.2 types are read as ver.3 codes, L1 -> L1C)
+LOAD_WORKERS = 2  # Background parse/aggregate threads
+RETRY_DELAY = 5.0  # Delay before a failed load is retried, doubled per failure (s)
+RETRY_MAX = 600.0  # Max retry delay (s)
+SCAN_INTERVAL = 10.0  # Period of the data directory rescans (s)
 
 app = Flask(__name__)
 
-def load_rinex_data(rinex_path):
-    obs = gr.load(rinex_path)
-    L1C_data = obs['L1C'].dropna(dim='time', how='all')
-    return L1C_data
 
-def analyze_data(L1C_data):
-    mean_values = L1C_data.mean(dim='time')
-    std_deviation = L1C_data.std(dim='time')
-    return mean_values.values, std_deviation.values
+# Mean and standard deviation over time of one obs type, per satellite
+def analyze_table(table, obs_type):
+    sats = table['sat']
+    col = np.full(len(sats), -1)
+    systems = sats.astype('U1')
+    for key in table:
+        if key.startswith('types_') and obs_type in table[key]:
+            col[systems == key[6:]] = list(table[key]).index(obs_type)
+    values = table['obs'][np.arange(len(sats)), np.maximum(col, 0)]
+    ok = (col >= 0) & ~np.isnan(values)
+
+    names, inverse = np.unique(sats[ok], return_inverse=True)
+    count = np.bincount(inverse, minlength=len(names))
+    mean = np.bincount(inverse, values[ok], minlength=len(names)) / count
+    std = np.sqrt(np.bincount(inverse, (values[ok] - mean[inverse]) ** 2, minlength=len(names)) / count)
+    return {'obs_type': obs_type, 'sats': names.tolist(), 'count': count.tolist(),
+            'mean': mean.tolist(), 'std': std.tolist(), 'epochs': int(len(np.unique(table['time'])))}
+
+
+# Stats of one OBS file, parsed through the NPZ table cache
+def load_file_stats(file_path, obs_type=OBS_TYPE):
+    stats = analyze_table(load_obs(file_path), obs_type)
+    stats['file'] = os.path.basename(file_path)
+    return stats
+
+
+# OBS files under a directory by file name: (path, station)
+def find_obs_files(data_dir):
+    files = {}
+    for path in find_files([data_dir]):
+        info = parse_rinex_name(path)
+        if info is not None and info[0] == 'obs':
+            files[os.path.basename(path)] = (path, info[1])
+    return files
+
+
+# Per-file results and the file list kept in memory. A request never touches
+# the disk: it reads the last scan and the last result of its file. A
+# background thread rescans the data directory every `interval` s and
+# (re)loads files that are new or whose mtime/size changed since. A failed
+# load is retried after RETRY_DELAY, doubled per consecutive failure up to
+# RETRY_MAX.
+class StatsCache:
+    def __init__(self, data_dir=DATA_DIR, workers=LOAD_WORKERS, interval=SCAN_INTERVAL):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.files = {}  # name -> (path, station) of the last scan
+        self.scanned = False  # first scan done
+        self.entries = {}  # path -> {'stamp', 'stats', 'error', 'failures', 'retry_at', 'html', 'html_key'}
+        self.loading = {}  # path -> stamp being loaded
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.scanner = None
+
+    # (st_mtime_ns, st_size) of a file, None if it is gone
+    def stamp(self, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    # Rescan the data directory: loads of new, changed and due failed files
+    # are scheduled, entries of files gone are dropped
+    def scan(self):
+        files = find_obs_files(self.data_dir)
+        stamps = {path: self.stamp(path) for path, _ in files.values()}
+        now = time.monotonic()
+        with self.lock:
+            self.files = files
+            self.scanned = True
+            for path in [path for path in self.entries if stamps.get(path) is None]:
+                del self.entries[path]
+            for path, stamp in stamps.items():
+                entry = self.entries.get(path)
+                stale = entry is None or entry['stamp'] != stamp or \
+                    (entry['error'] is not None and now >= entry['retry_at'])
+                if stamp is not None and stale and self.loading.get(path) != stamp:
+                    self.loading[path] = stamp
+                    self.pool.submit(self.load, path, stamp)
+
+    def run(self):
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                app.logger.warning("scanning %s failed: %r", self.data_dir, e)
+            time.sleep(self.interval)
+
+    # Start the background scans (once)
+    def start(self):
+        with self.lock:
+            if self.scanner is None:
+                self.scanner = threading.Thread(target=self.run, name='stats-scan', daemon=True)
+                self.scanner.start()
+
+    def load(self, file_path, stamp):
+        try:
+            entry = {'stamp': stamp, 'stats': load_file_stats(file_path), 'error': None, 'failures': 0}
+        except Exception as e:
+            app.logger.warning("loading %s failed: %r", file_path, e)
+            with self.lock:
+                old = self.entries.get(file_path)
+                failures = old['failures'] + 1 if old is not None and old['stamp'] == stamp else 1
+            entry = {'stamp': stamp, 'stats': None, 'error': repr(e), 'failures': failures,
+                     'retry_at': time.monotonic() + min(RETRY_DELAY * 2 ** (failures - 1), RETRY_MAX)}
+        with self.lock:
+            self.entries[file_path] = entry
+            if self.loading.get(file_path) == stamp:
+                del self.loading[file_path]
+
+    # Entry of a file by name: None until its first load finished; 404 for a
+    # name the last scan did not find (while the first scan runs: None)
+    def get(self, name):
+        with self.lock:
+            if name not in self.files:
+                if self.scanned:
+                    abort(404, f"unknown file {name}")
+                return None
+            return self.entries.get(self.files[name][0])
+
+    def file_list(self):
+        with self.lock:
+            return [{'file': name, 'station': station, 'ready': path in self.entries}
+                    for name, (path, station) in sorted(self.files.items())]
+
+    # Page of a loaded entry, rendered once per loaded version of the file and
+    # file list (the list shows which files are ready)
+    def page(self, entry, name, files):
+        key = tuple((f['file'], f['ready']) for f in files)
+        with self.lock:
+            if entry.get('html_key') == key:
+                return entry['html']
+        stats = entry['stats'] or {}
+        html = render_template('index.html', file=name, files=files, loading=False,
+                               error=entry['error'], stats=stats,
+                               mean_values=np.array(stats.get('mean', [])),
+                               std_deviation=np.array(stats.get('std', [])))
+        with self.lock:
+            entry['html'], entry['html_key'] = html, key
+        return html
+
+
+# Scans and loads start with the app, under `flask run` and WSGI servers too
+cache = StatsCache()
+cache.start()
+
 
 @app.route('/')
 def index():
-    rinex_path = r"C:\RTKApp\data\ANKR00TUR_R_20190010000_01D_30S_MO_edited.rnx"
-    L1C_data = load_rinex_data(rinex_path)
-    mean_values, std_deviation = analyze_data(L1C_data)
-    return render_template('index.html', mean_values=mean_values, std_deviation=std_deviation)
+    return station(request.args.get('file', DEFAULT_FILE))
 
-if __name__ == '__main__':
-    app.run(debug=True)
 
+@app.route('/files/<name>')
+def station(name):
+    entry = cache.get(name)
+    files = cache.file_list()
+    if entry is None:
+        return render_template('index.html', file=name, files=files, loading=True), 202
+    return cache.page(entry, name, files)
+
+
+@app.route('/api/files')
+def api_files():
+    return jsonify(cache.file_list())
+
+
+@app.route('/api/files/<name>')
+def api_stats(name):
+    entry = cache.get(name)
+    if entry is None:
+        return jsonify({'file': name, 'status': 'loading'}), 202
+    if entry['error']:
+        return jsonify({'file': name, 'status': 'failed', 'error': entry['error']}), 500
+    return jsonify(dict(entry['stats'], status='ready'))
+
+
+if __name__ == '__main__':
+    app.run(debug=True, threaded=True, use_reloader=False)
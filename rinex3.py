@@ -1,34 +1,48 @@
-import georinex as gr
-import numpy as np
-import datetime
-
-def load_rinex_data(rinex_path):
-    # RINEX dosyasını yükle
-    obs = gr.load(rinex_path)
-    L1C_data = obs['L1C'].dropna(dim='time', how='all')  # Tamamen NaN olan zamanları kaldır
-    return L1C_data
-
-def analyze_data(L1C_data):
-    # Veri üzerinde basit istatistiksel analizler yap
-    mean_values = L1C_data.mean(dim='time')  # Zaman boyunca ortalama değerleri hesapla
-    std_deviation = L1C_data.std(dim='time')  # Standart sapmaları hesapla
-    return mean_values.values, std_deviation.values
-
-def save_results_to_file(mean_values, std_deviation, filename="results.txt"):
-    # Sonuçları bir txt dosyasına kaydet
-    now = datetime.datetime.now()  # Şu anki tarih ve zaman
-    with open(filename, 'a') as file:
-        file.write(f"Analysis Time: {now.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        file.write(f"Mean Values: {mean_values}\n")
-        file.write(f"Standard Deviations: {std_deviation}\n")
-        file.write("--------------------------------------------------\n")
-
-# Örnek kullanım
-rinex_path = r"C:\RTKApp\data\ANKR00TUR_R_20190010000_01D_30S_MO_edited.rnx"
-L1C_data = load_rinex_data(rinex_path)
-mean_values, std_deviation = analyze_data(L1C_data)
-
-# Sonuçları dosyaya kaydet
-save_results_to_file(mean_values, std_deviation)
-
-print("Sonuçlar kaydedildi.")
+import argparse
+import os
+
+from obs_stats import CSV_DIR, ObsStats, csv_path, file_stats
+from rinex_compress import is_encoded
+from rinex_obs import open_obs_rinex
+from rinex_shm import read_obs_table_shared
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                            'ANKR00TUR_R_20190010000_01D_30S_MO_edited.rnx')
+
+
+# Statistics of one file parsed by `workers` processes into shared memory; the
+# table views are reduced in place and the blocks released right after
+def shared_file_stats(file_path, workers):
+    header, epochs = open_obs_rinex(file_path)
+    epochs.close()
+    table, shared = read_obs_table_shared(file_path, workers)
+    with shared:
+        stats = ObsStats(header).add_table(table)
+        del table
+    return stats
+
+
+# Per-satellite statistics of OBS files, one pass over the epochs in constant
+# memory (or over the shared memory table of parallel workers), written to
+# csv_results/<file>.csv
+def main():
+    parser = argparse.ArgumentParser(description="Per-satellite observation statistics of OBS RINEX files")
+    parser.add_argument('files', nargs='*', default=[DEFAULT_FILE], help="OBS RINEX files")
+    parser.add_argument('--types', default='L1C', help="comma separated obs types, 'all' for every type")
+    parser.add_argument('--out', default=CSV_DIR, help="output directory")
+    parser.add_argument('--workers', type=int, default=1, help="parser processes per file (plain RINEX only)")
+    args = parser.parse_args()
+
+    obs_types = None if args.types == 'all' else args.types.split(',')
+    for file_path in args.files:
+        if args.workers > 1 and not is_encoded(file_path):
+            stats = shared_file_stats(file_path, args.workers)
+        else:
+            stats = file_stats(file_path)
+        out_path = csv_path(file_path, args.out)
+        stats.write_csv(out_path, obs_types)
+        print(f"{os.path.basename(file_path)}: {len(stats.sats)} satellites -> {out_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 import georinex as gr
-import numpy as np
+
+from atmosphere import grid_delays, read_ion_params
+from geometry import station_geometry
+from rinex_nav import read_nav_tables
+from satpos import BroadcastOrbits
 
 # Sabitler
 c = 299792458  # Işık hızı (m/s)
@@ -11,7 +15,7 @@ rinex_file_o = r"C:\RTKApp\data\observation\07590920.05o"
 rinex_file_n = r"C:\RTKApp\data\navigation\07590920.05n"
 
 obs_data = gr.load(rinex_file_o)
-nav_data = gr.load(rinex_file_n)
+nav_data = BroadcastOrbits(read_nav_tables(rinex_file_n))
 
 # Örnek olarak ilk gözlem epochunu alalım
 epoch_time = obs_data.time.values[0]
@@ -25,36 +29,16 @@ L1 = obs_epoch['L1'].values  # Carrier Phase (cycle)
 Phi1 = L1 * lambda_L1  # Carrier Phase (m)
 
 # Navigasyon verilerinden uydu saat hatalarını hesaplama
-def satellite_clock_correction(nav_data, prn, epoch_time):
-    # Uydu saat hatası hesaplama
-    sv_clock_bias = nav_data.sel(sv=prn)['SVclockBias'].values
-    sv_clock_drift = nav_data.sel(sv=prn)['SVclockDrift'].values
-    sv_clock_drift_rate = nav_data.sel(sv=prn)['SVclockDriftRate'].values
-
-    trans_time = nav_data.sel(sv=prn)['TransTime'].values
-    
-    # trans_time'ı kontrol edip datetime64 formatına dönüştürme
-    if isinstance(trans_time, (np.datetime64, np.ndarray)):
-        trans_time_sec = trans_time.astype('datetime64[s]').astype(float)
-    else:
-        # trans_time'ı datetime64 formatına dönüştürme
-        trans_time_sec = np.datetime64(trans_time, 's').astype(float)
-
-    # epoch_time'ı saniyeye dönüştürme
-    epoch_time_sec = np.datetime64(epoch_time, 's').astype(float)
-
-    # Zaman farkını hesaplama
-    t = epoch_time_sec - trans_time_sec
-    
-    dt = sv_clock_bias + sv_clock_drift * t + sv_clock_drift_rate * t**2
-    
-    return dt
-
-# Örnek PRN (uydu numarası)
-prn = obs_epoch.sv.values[0]
+# Clock offsets (s) of satellites sv at times epoch_time (broadcastable arrays),
+# relativistic correction and TGD included
+def satellite_clock_correction(nav_data, sv, epoch_time):
+    return nav_data.clock_bias(sv, epoch_time)
+
+# All satellites at all epochs in one call: (nsat, ntime)
+dT_s_all = satellite_clock_correction(nav_data, obs_data.sv.values[:, None], obs_data.time.values[None, :])
 
 # Uydu saat hatasını hesapla
-dT_s = satellite_clock_correction(nav_data, prn, epoch_time)
+dT_s = dT_s_all[:, 0]
 
 # Alıcı saat hatası (örnek olarak sıfır alındı, gerçek uygulamalarda bu hesaplanmalıdır)
 dT = 0
@@ -62,9 +46,15 @@ dT = 0
 # Gerçek mesafeyi hesaplama (basitleştirilmiş, burada sadece pseudorange kullanılmıştır)
 rho = P1 - c * (dT - dT_s)
 
-# İyonosferik ve troposferik hatalar (basitleştirilmiş, burada sıfır alınmıştır)
-I = 0  # İyonosferik hata (örnek değeri)
-T = 0  # Troposferik hata (örnek değeri)
+# İyonosferik ve troposferik hatalar
+# Klobuchar (ION ALPHA/BETA of the NAV header) and Saastamoinen delays at the
+# APPROX POSITION XYZ of the OBS header, all satellites at all epochs in one
+# call on the cached geometry tensor of the station: (nsat, ntime)
+station = station_geometry(obs_data.position)
+geometry = station.grid(nav_data, obs_data.sv.values, obs_data.time.values)
+delays = grid_delays(station, geometry, read_ion_params(rinex_file_n))
+I = delays['iono'][:, 0]  # İyonosferik hata (m)
+T = delays['tropo'][:, 0]  # Troposferik hata (m)
 epsilon_p = 0  # Diğer hatalar (örnek değeri)
 epsilon_phi = 0  # Diğer hatalar (örnek değeri)
 N = 0  # Faz kayması (örnek değeri)
@@ -73,7 +63,7 @@ N = 0  # Faz kayması (örnek değeri)
 P = rho + c * (dT - dT_s) + I + T + epsilon_p
 
 # Carrier Phase denklemi
-Phi = rho + c * (dT - dT_s) + N * lambda_L1 + I - T + epsilon_phi
+Phi = rho + c * (dT - dT_s) + N * lambda_L1 - I + T + epsilon_phi
 
 print(f'Pseudorange (P): {P} meters')
 print(f'Carrier Phase (Phi): {Phi} meters')
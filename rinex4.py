@@ -1,19 +1,25 @@
-import georinex as gr
 import numpy as np
 import os
 
+from atmosphere import ION_DEFAULT, read_ion_params
+from rinex_cache import load_nav, load_obs
+from satpos import BroadcastOrbits
+from spp import solve_spp, spp_errors
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
 def load_rinex_obs_nav(obs_path, nav_path):
     # RINEX OBS ve NAV dosyalarını yükler
-    obs_data = gr.load(obs_path)
-    nav_data = gr.load(nav_path)
+    obs_data = load_obs(obs_path)
+    nav_data = BroadcastOrbits(load_nav(nav_path))
     return obs_data, nav_data
 
-def rtk_correction(obs_data, nav_data, reference_position):
-    # Bu fonksiyon, RTKLIB veya benzeri bir kütüphane kullanılarak doldurulmalıdır.
-    # Burada basitçe ölçümlerden pozisyon hesaplaması ve referans pozisyon ile karşılaştırma simüle edilmektedir.
-    # Örnek bir hesaplama yapıyoruz:
-    estimated_positions = np.random.normal(loc=reference_position, scale=0.1, size=(len(obs_data.time), 3))
-    errors = estimated_positions - reference_position
+def rtk_correction(obs_data, nav_data, reference_position, ion=ION_DEFAULT):
+    # Code-based single point positioning of every epoch (see spp.solve_spp) with
+    # Klobuchar (coefficients ion) and Saastamoinen corrections as solve_spp_files,
+    # errors of the estimated positions against reference_position (nan: no solution)
+    solution = solve_spp(obs_data, nav_data, ion=ion, tropo=True)
+    errors = spp_errors(solution, reference_position)
     return errors
 
 def write_errors_to_file(errors, file_path):
@@ -24,18 +30,18 @@ def write_errors_to_file(errors, file_path):
         file.write("\n")  # Her çalışma arasında boş bir satır ekleyerek ayır
 
 def main():
-    obs_path = r"C:\RTKApp\data\observation\abpo0010.24o"  # Örnek OBS dosya yolu
-    nav_path = r"C:\RTKApp\data\navigation\ABPO00MDG_R_20240010000_01D_GN.rnx"  # Örnek NAV dosya yolu
-    reference_position = np.array([4097216.5539, 4429119.1897, -2065771.1988])  # Örnek referans konumu
+    obs_path = os.path.join(DATA_DIR, "observation", "base123i.24o")  # Örnek OBS dosya yolu
+    nav_path = os.path.join(DATA_DIR, "navigation", "base123i.24p")  # Örnek NAV dosya yolu
+    reference_position = np.array([4451477.4519, 2271046.0177, 3950022.8913])  # Base1 APPROX POSITION XYZ
 
-    corrections_folder = r"C:\RTKApp\corrections"
+    corrections_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corrections")
     if not os.path.exists(corrections_folder):
         os.makedirs(corrections_folder)
 
     corrections_file_path = os.path.join(corrections_folder, "corrections.txt")
 
     obs_data, nav_data = load_rinex_obs_nav(obs_path, nav_path)
-    errors = rtk_correction(obs_data, nav_data, reference_position)
+    errors = rtk_correction(obs_data, nav_data, reference_position, read_ion_params(nav_path))
     
     write_errors_to_file(errors, corrections_file_path)
     
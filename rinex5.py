@@ -1,35 +1,35 @@
-import georinex as gr
+import argparse
+import os
+
 import numpy as np
 
-# RINEX dosyalarını yükleme
-obs_file = r"C:\RTKApp\data\observation\abpo0010.24o"  # Örnek OBS dosya yolu
-nav_file = r"C:\RTKApp\data\navigation\ABPO00MDG_R_20240010000_01D_GN.rnx"  # Örnek NAV dosya yolu
+from rinex_compress import is_encoded
+from rinex_nav import read_nav_tables
+from rinex_obs import read_obs_table
+from rinex_shm import read_obs_table_shared
+from satpos import BroadcastOrbits
+from slips import clean_table
 
-obs_data = gr.load(obs_file)
-nav_data = gr.load(nav_file)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+OBS_FILE = os.path.join(DATA_DIR, 'observation', 'base123i.24o')  # Örnek OBS dosya yolu
+NAV_FILE = os.path.join(DATA_DIR, 'navigation', 'base123i.24p')  # Örnek NAV dosya yolu
 
-# OBS verilerindeki gözlemler
-observations = obs_data.sel(sv='G01')  # Örnek olarak 'G01' uydusu için gözlemler
-print(observations)
 
-# NAV verilerini görüntüleme
-print(nav_data)
+# Times and values of one obs type of one satellite from OBS table columns
+# (read_obs_table or the shared memory views of read_obs_table_shared)
+def satellite_series(table, sat, obs_type):
+    rows = np.flatnonzero(table['sat'] == sat)
+    col = list(table['types_' + sat[0]]).index(obs_type)
+    return table['time'][rows], table['obs'][rows, col]
 
-# Pseudorange ve Carrier Phase verilerini ayıklama
-pseudorange = observations['C1'].values  # C1 kod gözlemi
-carrier_phase = observations['L1'].values  # L1 taşıyıcı faz gözlemi
 
 # Uyduların konumlarını hesaplama
-def calculate_satellite_positions(nav_data, obs_times):
-    satellite_positions = {}
-    for time in obs_times:
-        # 'nearest' yöntemi ile en yakın zaman damgasını bulma
-        try:
-            satellite_positions[time] = nav_data.sel(time=time, method='nearest').values
-        except KeyError as e:
-            print(f"Time {time} not found in navigation data: {e}")
-            satellite_positions[time] = None
-    return satellite_positions
+# ECEF positions (nsat, ntime, 3) of all satellites at all observation times,
+# nan where no ephemeris is valid
+def calculate_satellite_positions(nav_data, obs_times, sats):
+    orbits = BroadcastOrbits(nav_data)
+    return orbits.positions_grid(np.asarray(sats), np.asarray(obs_times, dtype='M8[ns]'))
+
 
 # Pseudorange ve carrier phase düzeltmeleri
 def calculate_corrections(pseudorange, carrier_phase, satellite_positions):
@@ -42,22 +42,46 @@ def calculate_corrections(pseudorange, carrier_phase, satellite_positions):
     corrections['delta_s'] = delta_s
     return corrections
 
-# Uydu konumlarını hesaplama
-obs_times = obs_data.time.values
-satellite_positions = calculate_satellite_positions(nav_data, obs_times)
-
-# Düzeltmeleri hesaplama
-corrections = calculate_corrections(pseudorange, carrier_phase, satellite_positions)
-print(corrections)
 
 # Düzeltmeleri txt dosyasına yazma
-output_file = 'corrections_output.txt'
+def write_corrections(output_file, corrections):
+    with open(output_file, 'w') as f:
+        for key, value in corrections.items():
+            f.write(f'{key}:\n')
+            np.savetxt(f, value, fmt='%0.8f')
+            f.write('\n')
+
+
+def run(table, nav_data, sat, output_file):
+    _, pseudorange = satellite_series(table, sat, 'C1C')  # C1 kod gözlemi
+    obs_times, carrier_phase = satellite_series(table, sat, 'L1C')  # L1 taşıyıcı faz gözlemi
+    satellite_positions = calculate_satellite_positions(nav_data, obs_times, [sat])
+    corrections = calculate_corrections(pseudorange, carrier_phase, satellite_positions)
+    write_corrections(output_file, corrections)
+    print(f'Corrections have been saved to {output_file}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pseudorange differences of one satellite")
+    parser.add_argument('--obs', default=OBS_FILE)
+    parser.add_argument('--nav', default=NAV_FILE)
+    parser.add_argument('--sat', default='G05')
+    parser.add_argument('--out', default='corrections_output.txt')
+    parser.add_argument('--workers', type=int, default=1, help="parser processes (plain RINEX only)")
+    parser.add_argument('--raw', action='store_true', help="skip cycle slip/outlier cleaning of the phases")
+    args = parser.parse_args()
 
-with open(output_file, 'w') as f:
-    for key, value in corrections.items():
-        f.write(f'{key}:\n')
-        np.savetxt(f, value, fmt='%0.8f')
-        f.write('\n')
+    nav_data = read_nav_tables(args.nav)
+    if args.workers > 1 and not is_encoded(args.obs):
+        table, shared = read_obs_table_shared(args.obs, args.workers)
+        with shared:
+            if not args.raw:
+                clean_table(table)
+            run(table, nav_data, args.sat, args.out)
+            del table
+    else:
+        run(read_obs_table(args.obs, clean=not args.raw), nav_data, args.sat, args.out)
 
-print(f'Corrections have been saved to {output_file}')
 
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,12 @@
+import logging
+
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from gtime import GPS_EPOCH_DAYS, NS, days_from_civil
+
+# Debug/warning channel, e.g. logging.getLogger('rinex6').setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 # Constants/Macros
 NUMSYS = 6  # Number of systems
@@ -9,52 +16,71 @@ MAXPOSHEAD = 1024  # Max head line position
 MINFREQ_GLO = -7  # Min frequency number for GLONASS
 MAXFREQ_GLO = 13  # Max frequency number for GLONASS
 NINCOBS = 262144  # Incremental number of observation data
+NFREQ = 3  # Number of carrier frequencies
+MAXOBS = 64  # Max number of obs in an epoch
+MAXPRNGLO = 24  # Max satellite PRN number of GLONASS
+
+# Navigation system flags (rtklib.h)
+SYS_NONE = 0x00
+SYS_GPS = 0x01
+SYS_SBS = 0x02
+SYS_GLO = 0x04
+SYS_GAL = 0x08
+SYS_QZS = 0x10
+SYS_CMP = 0x20
+
+# Time systems (rtklib.h)
+TSYS_GPS = 0
+TSYS_UTC = 1
+TSYS_GLO = 2
+TSYS_GAL = 3
+TSYS_QZS = 4
+TSYS_CMP = 5
 
 # Satellite systems
 navsys = ['GPS', 'GLO', 'GAL', 'QZS', 'SBS', 'CMP']
 syscodes = 'GREJSC'  # Satellite system codes
+sysflags = [SYS_GPS, SYS_GLO, SYS_GAL, SYS_QZS, SYS_SBS, SYS_CMP]  # System flags in syscodes order
 obscodes = 'CLDS'  # Observation type codes
 frqcodes = '125678'  # Frequency codes
 
+# Frequency number (1:L1,2:L2,3:L5,4:L6,5:L7,6:L8) of the band digit of an obs code
+CODE_FRQS = {'1': 1, '2': 2, '5': 3, '6': 4, '7': 5, '8': 6}
+
+# Code priorities (rtkcmn.c codepris): attributes per system and frequency number,
+# highest priority first
+CODE_PRIS = {
+    SYS_GPS: {1: "CPYWMNSL", 2: "PYWCMNDSLX", 3: "IQX"},
+    SYS_GLO: {1: "PC", 2: "PC", 3: "IQX"},
+    SYS_GAL: {1: "CABXZ", 3: "IQX", 4: "ABCXZ", 5: "IQX", 6: "IQX"},
+    SYS_QZS: {1: "CSLXZ", 2: "SLX", 3: "IQX", 4: "SLX"},
+    SYS_SBS: {1: "C", 3: "IQX"},
+    SYS_CMP: {1: "IQX", 4: "IQX", 5: "IQX"},
+}
+
 # URA values (reference from IS-GPS-200D)
 ura_eph = [
     2.4, 3.4, 4.85, 6.85, 9.65, 13.65, 24.0, 48.0, 96.0, 192.0, 384.0, 768.0, 1536.0,
     3072.0, 6144.0, 0.0
 ]
 
-# Signal Index Type
+# Signal Index Type: per obs type of one system, small arrays instead of lists
 class SigInd:
+    __slots__ = ('n', 'frq', 'pos', 'pri', 'type', 'code', 'shift')
+
     def __init__(self):
         self.n = 0
-        self.frq = [0] * MAXOBSTYPE
-        self.pos = [-1] * MAXOBSTYPE
-        self.pri = [0] * MAXOBSTYPE
-        self.type = [0] * MAXOBSTYPE
-        self.code = [0] * MAXOBSTYPE
-        self.shift = [0.0] * MAXOBSTYPE
+        self.frq = np.zeros(MAXOBSTYPE, dtype=np.int8)  # signal frequency (1:L1,2:L2,...)
+        self.pos = np.full(MAXOBSTYPE, -1, dtype=np.int8)  # signal index in obs data (-1:no)
+        self.pri = np.zeros(MAXOBSTYPE, dtype=np.uint8)  # signal priority (15-0)
+        self.type = np.zeros(MAXOBSTYPE, dtype=np.uint8)  # type (0:C,1:L,2:D,3:S)
+        self.code = np.zeros(MAXOBSTYPE, dtype='U2')  # obs code ("1C", "2W", ...)
+        self.shift = np.zeros(MAXOBSTYPE)  # phase shift (cycle)
 
 # Set string without tail space
 def setstr(dst, src, n):
     dst[:n] = src[:n].rstrip()
 
-# Adjust time considering week handover
-def adjweek(t, t0):
-    tt = (t - t0).total_seconds()
-    if tt < -302400.0:
-        return t + timedelta(weeks=1)
-    if tt > 302400.0:
-        return t - timedelta(weeks=1)
-    return t
-
-# Adjust time considering day handover
-def adjday(t, t0):
-    tt = (t - t0).total_seconds()
-    if tt < -43200.0:
-        return t + timedelta(days=1)
-    if tt > 43200.0:
-        return t - timedelta(days=1)
-    return t
-
 # Time string for ver.3 (yyyymmdd hhmmss UTC)
 def timestr_rnx():
     now = datetime.utcnow().replace(microsecond=0)
@@ -121,125 +147,92 @@ def init_sta(sta):
     sta.del_ = [0.0, 0.0, 0.0]  # 'del' is a reserved keyword in Python
     sta.hgt = 0.0
 
+# ver.2 obs code -> ver.3 obs code (rinex.c convcode) as lookup data.
+# CONVCODE_FRQ: (ver >= 2.12, band char) -> {sys: band + attribute}, the obs type
+# letter (C/L/D/S) is kept. CONVCODE_EXACT: whole codes matched before the band rules.
+CONVCODE_FRQ = {
+    (False, '1'): {SYS_GPS: '1C', SYS_GLO: '1C', SYS_GAL: '1X', SYS_QZS: '1C', SYS_SBS: '1C'},
+    (True, '1'): {SYS_GPS: '1W', SYS_GLO: '1P', SYS_GAL: '1X', SYS_CMP: '1X'},  # L1PY,GLO L1P
+    (True, 'A'): {SYS_GPS: '1C', SYS_GLO: '1C', SYS_QZS: '1C', SYS_SBS: '1C'},  # L1C/A
+    (True, 'B'): {SYS_GPS: '1X', SYS_QZS: '1X'},  # GPS L1C
+    (True, 'C'): {SYS_GPS: '2X', SYS_QZS: '2X'},  # GPS L2C
+    (True, 'D'): {SYS_GLO: '2C'},  # GLO L2C/A
+}
+for _v212 in (False, True):
+    CONVCODE_FRQ[(_v212, '2')] = {SYS_GPS: '2W', SYS_GLO: '2P', SYS_QZS: '2X', SYS_CMP: '1X'}  # BDS B1
+    CONVCODE_FRQ[(_v212, '5')] = {SYS_GPS: '5X', SYS_GAL: '5X', SYS_QZS: '5X', SYS_SBS: '5X'}
+    CONVCODE_FRQ[(_v212, '6')] = {SYS_GAL: '6X', SYS_QZS: '6X', SYS_CMP: '6X'}  # BDS B3
+    CONVCODE_FRQ[(_v212, '7')] = {SYS_GAL: '7X', SYS_CMP: '7X'}  # BDS B2
+    CONVCODE_FRQ[(_v212, '8')] = {SYS_GAL: '8X'}
+
+CONVCODE_EXACT = {
+    (False, 'C1'): {SYS_GPS: 'C1C', SYS_GLO: 'C1C', SYS_GAL: 'C1X', SYS_QZS: 'C1C', SYS_SBS: 'C1C'},
+    (True, 'C1'): {},  # reject C1 for 2.12
+    (False, 'C2'): {SYS_GPS: 'C2X', SYS_GLO: 'C2C', SYS_QZS: 'C2X', SYS_CMP: 'C1X'},  # L2C
+    (True, 'C2'): {SYS_GPS: 'C2W', SYS_GLO: 'C2C', SYS_QZS: 'C2X', SYS_CMP: 'C1X'},  # L2P(Y)
+}
+for _v212 in (False, True):
+    CONVCODE_EXACT[(_v212, 'P1')] = {SYS_GPS: 'C1W', SYS_GLO: 'C1P'}  # ver.2.11 GPS L1PY,GLO L1P
+    CONVCODE_EXACT[(_v212, 'P2')] = {SYS_GPS: 'C2W', SYS_GLO: 'C2P'}  # ver.2.11 GPS L2PY,GLO L2P
+
+
+# Expanded table: (ver >= 2.12, sys, 2-char code) -> ver.3 code
+def build_convcode_table():
+    table = {}
+    for (v212, frq), codes in CONVCODE_FRQ.items():
+        for sys, code in codes.items():
+            for obs in obscodes + 'P':
+                table[(v212, sys, obs + frq)] = obs + code
+    for (v212, str_), codes in CONVCODE_EXACT.items():
+        for sys in (SYS_GPS, SYS_SBS, SYS_GLO, SYS_GAL, SYS_QZS, SYS_CMP):
+            table[(v212, sys, str_)] = codes.get(sys, "   ")
+    return table
+
+
+CONVCODE_TABLE = build_convcode_table()
+
+
+# Convert rinex obs type ver.2 -> ver.3, "   " if not supported
 def convcode(ver, sys, str):
-    type = "   "
-    
-    if str == "P1":  # ver.2.11 GPS L1PY,GLO L2P
-        if sys == SYS_GPS:
-            type = "{}1W".format('C')
-        elif sys == SYS_GLO:
-            type = "{}1P".format('C')
-    elif str == "P2":  # ver.2.11 GPS L2PY,GLO L2P
-        if sys == SYS_GPS:
-            type = "{}2W".format('C')
-        elif sys == SYS_GLO:
-            type = "{}2P".format('C')
-    elif str == "C1":  # ver.2.11 GPS L1C,GLO L1C/A
-        if ver >= 2.12:
-            pass  # reject C1 for 2.12
-        else:
-            if sys == SYS_GPS:
-                type = "{}1C".format('C')
-            elif sys == SYS_GLO:
-                type = "{}1C".format('C')
-            elif sys == SYS_GAL:
-                type = "{}1X".format('C')  # ver.2.12
-            elif sys == SYS_QZS:
-                type = "{}1C".format('C')
-            elif sys == SYS_SBS:
-                type = "{}1C".format('C')
-    elif str == "C2":
-        if sys == SYS_GPS:
-            if ver >= 2.12:
-                type = "{}2W".format('C')  # L2P(Y)
-            else:
-                type = "{}2X".format('C')  # L2C
-        elif sys == SYS_GLO:
-            type = "{}2C".format('C')
-        elif sys == SYS_QZS:
-            type = "{}2X".format('C')
-        elif sys == SYS_CMP:
-            type = "{}1X".format('C')  # ver.2.12 B1
-    elif ver >= 2.12 and str[1] == 'A':  # ver.2.12 L1C/A
-        if sys == SYS_GPS:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_GLO:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_SBS:
-            type = "{}1C".format(str[0])
-    elif ver >= 2.12 and str[1] == 'B':  # ver.2.12 GPS L1C
-        if sys == SYS_GPS:
-            type = "{}1X".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}1X".format(str[0])
-    elif ver >= 2.12 and str[1] == 'C':  # ver.2.12 GPS L2C
-        if sys == SYS_GPS:
-            type = "{}2X".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}2X".format(str[0])
-    elif ver >= 2.12 and str[1] == 'D':  # ver.2.12 GLO L2C/A
-        if sys == SYS_GLO:
-            type = "{}2C".format(str[0])
-    elif ver >= 2.12 and str[1] == '1':  # ver.2.12 GPS L1PY,GLO L1P
-        if sys == SYS_GPS:
-            type = "{}1W".format(str[0])
-        elif sys == SYS_GLO:
-            type = "{}1P".format(str[0])
-        elif sys == SYS_GAL:
-            type = "{}1X".format(str[0])  # tentative
-        elif sys == SYS_CMP:
-            type = "{}1X".format(str[0])  # extension
-    elif ver < 2.12 and str[1] == '1':
-        if sys == SYS_GPS:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_GLO:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_GAL:
-            type = "{}1X".format(str[0])  # tentative
-        elif sys == SYS_QZS:
-            type = "{}1C".format(str[0])
-        elif sys == SYS_SBS:
-            type = "{}1C".format(str[0])
-    elif str[1] == '2':
-        if sys == SYS_GPS:
-            type = "{}2W".format(str[0])
-        elif sys == SYS_GLO:
-            type = "{}2P".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}2X".format(str[0])
-        elif sys == SYS_CMP:
-            type = "{}1X".format(str[0])  # ver.2.12 B1
-    elif str[1] == '5':
-        if sys == SYS_GPS:
-            type = "{}5X".format(str[0])
-        elif sys == SYS_GAL:
-            type = "{}5X".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}5X".format(str[0])
-        elif sys == SYS_SBS:
-            type = "{}5X".format(str[0])
-    elif str[1] == '6':
-        if sys == SYS_GAL:
-            type = "{}6X".format(str[0])
-        elif sys == SYS_QZS:
-            type = "{}6X".format(str[0])
-        elif sys == SYS_CMP:
-            type = "{}6X".format(str[0])  # ver.2.12 B3
-    elif str[1] == '7':
-        if sys == SYS_GAL:
-            type = "{}7X".format(str[0])
-        elif sys == SYS_CMP:
-            type = "{}7X".format(str[0])  # ver.2.12 B2
-    elif str[1] == '8':
-        if sys == SYS_GAL:
-            type = "{}8X".format(str[0])
-    
-    print("convcode: ver={:.2f} sys={} type= {} -> {}".format(ver, sys, str, type))
-    return type
-  
-  def decode_obsh(fp, buff, ver, tsys, tobs, nav, sta):
+    return CONVCODE_TABLE.get((ver >= 2.12, sys, str), "   ")
+
+# Set signal index of the obs types tobs of one system
+def set_index(ver, sys, tobs, ind):
+    n = tobs.index('') if '' in tobs else len(tobs)
+    for i in range(n):
+        code = tobs[i][1:3]
+        frq = CODE_FRQS.get(code[:1], 0)
+        pris = CODE_PRIS.get(sys, {}).get(frq, "")
+        p = pris.find(code[1:2]) if len(code) == 2 else -1
+        ind.code[i] = code
+        ind.frq[i] = frq
+        ind.type[i] = max(obscodes.find(tobs[i][:1]), 0)
+        ind.pri[i] = 14 - p if p >= 0 else 0
+        ind.pos[i] = -1
+
+        # frequency index for beidou
+        if sys == SYS_CMP:
+            if ind.frq[i] == 5:
+                ind.frq[i] = 2  # B2
+            elif ind.frq[i] == 4:
+                ind.frq[i] = 3  # B3
+
+    # assign index for highest priority code
+    for i in range(NFREQ):
+        cand = [j for j in range(n) if ind.frq[j] == i + 1 and ind.pri[j]]
+        if not cand:
+            continue
+        k = max(cand, key=lambda j: (ind.pri[j], -j))
+        for j in range(n):
+            if ind.code[j] == ind.code[k]:
+                ind.pos[j] = i
+    for i in range(n):
+        if ind.code[i] and ind.pri[i] and ind.pos[i] < 0:
+            logger.debug("reject obs type: sys=%d obs=%s", sys, tobs[i])
+    ind.n = n
+
+# Decode obs header, returns time system (tsys)
+def decode_obsh(fp, buff, ver, tsys, tobs, nav, sta):
     # default codes for unknown code
     defcodes = [
         "CWX   ",  # GPS: L125___
@@ -253,8 +246,6 @@ def convcode(ver, sys, str):
     label = buff[60:]
     str4 = [""] * 4
 
-    print(f"decode_obsh: ver={ver:.2f}")
-    
     if "MARKER NAME" in label:
         if sta:
             sta.name = buff[:60].strip()
@@ -282,9 +273,9 @@ def convcode(ver, sys, str):
         if sta:
             for i in range(3):
                 deltas[i] = float(buff[i * 14:(i + 1) * 14].strip())
-            sta.del[2] = deltas[0]  # h
-            sta.del[0] = deltas[1]  # e
-            sta.del[1] = deltas[2]  # n
+            sta.del_[2] = deltas[0]  # h
+            sta.del_[0] = deltas[1]  # e
+            sta.del_[1] = deltas[2]  # n
     elif "ANTENNA: DELTA X/Y/Z" in label:  # opt ver.3
         pass
     elif "ANTENNA: PHASECENTER" in label:  # opt ver.3
@@ -300,8 +291,8 @@ def convcode(ver, sys, str):
     elif "SYS / # / OBS TYPES" in label:  # ver.3
         p = syscodes.find(buff[0])
         if p == -1:
-            print(f"invalid system code: sys={buff[0]}")
-            return
+            logger.warning("invalid system code: sys=%s", buff[0])
+            return tsys
         
         i = p
         n = int(buff[3:6].strip())
@@ -312,7 +303,7 @@ def convcode(ver, sys, str):
                 buff = fp.readline()
                 k = 7
             if nt < MAXOBSTYPE - 1:
-                tobs[i][nt] = buff[k:k + 3]
+                tobs[i][nt] = buff[k:k + 3].rstrip()
                 nt += 1
             j += 1
             k += 4
@@ -332,29 +323,31 @@ def convcode(ver, sys, str):
             if p == -1:
                 continue
             tobs[i][j] = tobs[i][j] + defcodes[i][p]
-            print(f"set default for unknown code: sys={buff[0]} code={tobs[i][j]}")
+            logger.debug("set default for unknown code: sys=%s code=%s", buff[0], tobs[i][j])
     elif "WAVELENGTH FACT L1/2" in label:  # opt ver.2
         pass
     elif "# / TYPES OF OBSERV" in label:  # ver.2
         n = int(buff[:6].strip())
-        j = nt = 0
-        while j < n:
+        nt = 0
+        j = 10
+        for _ in range(n):
             if j > 58:
                 buff = fp.readline()
+                if not buff:
+                    break
                 j = 10
-            if nt >= MAXOBSTYPE - 1:
-                continue
-            if ver <= 2.99:
-                str_ = buff[j:j + 2]
+            if nt < MAXOBSTYPE - 1 and ver <= 2.99:
+                str_ = buff[j:j + 2].rstrip()
                 tobs[0][nt] = convcode(ver, SYS_GPS, str_)
                 tobs[1][nt] = convcode(ver, SYS_GLO, str_)
                 tobs[2][nt] = convcode(ver, SYS_GAL, str_)
                 tobs[3][nt] = convcode(ver, SYS_QZS, str_)
                 tobs[4][nt] = convcode(ver, SYS_SBS, str_)
                 tobs[5][nt] = convcode(ver, SYS_CMP, str_)
-            nt += 1
+                nt += 1
             j += 6
-        tobs[0][nt] = ''
+        for i in range(NUMSYS):
+            tobs[i][nt] = ''
     elif "SIGNAL STRENGTH UNIT" in label:  # opt ver.3
         pass
     elif "INTERVAL" in label:  # opt
@@ -386,9 +379,10 @@ def convcode(ver, sys, str):
         if nav:
             p = buff[4:]
             for i in range(8):
-                prn, fcn = int(p[:2].strip()), int(p[2:4].strip())
-                if 1 <= prn <= MAXPRNGLO:
-                    nav.glo_fcn[prn - 1] = fcn + 8
+                if p[:1] == 'R' and p[1:3].strip() and p[4:6].strip():
+                    prn, fcn = int(p[1:3]), int(p[4:6])
+                    if 1 <= prn <= MAXPRNGLO:
+                        nav.glo_fcn[prn - 1] = fcn + 8
                 p = p[8:]
     elif "GLONASS COD/PHS/BIS" in label:  # ver.3.02
         if nav:
@@ -410,5 +404,214 @@ def convcode(ver, sys, str):
         pass
     elif "PRN / # OF OBS" in label:  # opt
         pass
+    return tsys
+
+# String to number, blank -> 0.0
+def str2num(s, i, n):
+    try:
+        return float(s[i:i + n].replace('D', 'E').replace('d', 'E'))
+    except ValueError:
+        return 0.0
+
+# String to gtime (int ns since the GPS epoch, see gtime.py), returns None on error
+def str2time(s, i, n):
+    try:
+        ep = [float(v) for v in s[i:i + n].split()]
+    except ValueError:
+        return None
+    if len(ep) < 6:
+        return None
+    if ep[0] < 100.0:
+        ep[0] += 2000.0 if ep[0] < 80.0 else 1900.0
+    year, month, day = int(ep[0]), int(ep[1]), int(ep[2])
+    if not (1 <= month <= 12 and 1 <= day <= 31 and 0.0 <= ep[3] < 24.0 and 0.0 <= ep[4] < 60.0):
+        return None
+    days = days_from_civil(year, month, day) - GPS_EPOCH_DAYS
+    return (days * 86400 + int(ep[3]) * 3600 + int(ep[4]) * 60) * NS + round(ep[5] * NS)
+
+# Satellite id ("G01", "G 1", " 1") to satellite code ("G01"), None if invalid
+def satid2code(id):
+    id = id.strip()
+    if not id:
+        return None
+    if id[0].isdigit():
+        sys, prn = 'G', id
+    else:
+        sys, prn = id[0], id[1:]
+    if sys not in syscodes:
+        return None
+    try:
+        prn = int(prn)
+    except ValueError:
+        return None
+    if sys == 'S' and prn >= 100:
+        prn -= 100
+    elif sys == 'J' and prn >= 193:
+        prn -= 192
+    return f"{sys}{prn:02d}"
+
+# Read rinex header, returns (ver, type, sys, tsys), None if no header
+def readrnxh(fp, tobs, nav, sta):
+    ver = 2.10
+    type = ' '
+    sys = SYS_GPS
+    tsys = TSYS_GPS
+    i = 0
+
+    for buff in iter(fp.readline, ''):
+        label = buff[60:]
+        if len(buff.rstrip('\r\n')) <= 60:
+            continue
+        elif "RINEX VERSION / TYPE" in label:
+            ver = str2num(buff, 0, 9)
+            type = buff[20]
+            # satellite system
+            c = buff[40]
+            if c in ' G':
+                sys, tsys = SYS_GPS, TSYS_GPS
+            elif c == 'R':
+                sys, tsys = SYS_GLO, TSYS_UTC
+            elif c == 'E':
+                sys, tsys = SYS_GAL, TSYS_GAL  # v.2.12
+            elif c == 'S':
+                sys, tsys = SYS_SBS, TSYS_GPS
+            elif c == 'J':
+                sys, tsys = SYS_QZS, TSYS_QZS  # v.3.02
+            elif c == 'C':
+                sys, tsys = SYS_CMP, TSYS_CMP  # v.2.12
+            elif c == 'M':
+                sys, tsys = SYS_NONE, TSYS_GPS  # mixed
+            else:
+                logger.warning("not supported satellite system: %s", c)
+            continue
+        elif "PGM / RUN BY / DATE" in label:
+            continue
+        elif "COMMENT" in label:  # opt
+            continue
+
+        # file type
+        if type == 'O':
+            tsys = decode_obsh(fp, buff, ver, tsys, tobs, nav, sta)
+        if "END OF HEADER" in label:
+            logger.debug("rinex header: ver=%.2f type=%s sys=%d tsys=%d", ver, type, sys, tsys)
+            return ver, type, sys, tsys
+
+        i += 1
+        if i >= MAXPOSHEAD and type == ' ':
+            break  # no rinex file
+    return None
+
+# Decode obs epoch, returns (n, time, flag, sats)
+def decode_obsepoch(fp, buff, ver):
+    sats = []
+    if ver <= 2.99:  # ver.2
+        n = int(str2num(buff, 29, 3))
+        if n <= 0:
+            return 0, None, 0, sats
+
+        # epoch flag: 3:new site,4:header info,5:external event
+        flag = int(str2num(buff, 28, 1))
+        if 3 <= flag <= 5:
+            return n, None, flag, sats
+
+        time = str2time(buff, 0, 26)
+        if time is None:
+            logger.warning("rinex obs invalid epoch: epoch=%s", buff[:26])
+            return 0, None, flag, sats
+        j = 32
+        for i in range(n):
+            if j >= 68:
+                buff = fp.readline()
+                if not buff:
+                    break
+                j = 32
+            if i < MAXOBS:
+                sats.append(satid2code(buff[j:j + 3]))
+            j += 3
+    else:  # ver.3
+        n = int(str2num(buff, 32, 3))
+        if n <= 0:
+            return 0, None, 0, sats
+
+        flag = int(str2num(buff, 31, 1))
+        if 3 <= flag <= 5:
+            return n, None, flag, sats
+
+        time = str2time(buff, 1, 28) if buff[0] == '>' else None
+        if time is None:
+            logger.warning("rinex obs invalid epoch: epoch=%s", buff[:29])
+            return 0, None, flag, sats
+    return n, time, flag, sats
+
+# Fields (..., 14) of ASCII codes that hold one number: blanks around one run
+# of digits with an optional leading sign and at most one decimal point
+def numeric_fields(value):
+    nonblank = value != ord(' ')
+    pos = np.arange(value.shape[-1])
+    first = np.argmax(nonblank, axis=-1)[..., None]
+    last = value.shape[-1] - 1 - np.argmax(nonblank[..., ::-1], axis=-1)[..., None]
+    inside = (pos >= first) & (pos <= last)
+    digit = (value >= ord('0')) & (value <= ord('9'))
+    point = value == ord('.')
+    sign = ((value == ord('-')) | (value == ord('+'))) & (pos == first)
+    return (np.all(np.where(inside, digit | point | sign, ~nonblank), axis=-1) &
+            digit.any(axis=-1) & (point.sum(axis=-1) <= 1))
+
+# Decode obs data of all satellites of an epoch in one pass.
+# recs holds one string per satellite with its 16-column obs fields
+# (value F14.3, LLI, signal strength); returns (val, lli, ssi) as
+# (nsat, ntobs) arrays, blank or non-numeric values -> nan
+def decode_obsdata(recs, ntobs):
+    width = 16 * ntobs
+    buff = ''.join([rec[:width].ljust(width) for rec in recs]).encode('latin-1', 'replace')
+    fields = np.frombuffer(buff, dtype=np.uint8).reshape(len(recs), ntobs, 16)
+
+    value = np.ascontiguousarray(fields[:, :, :14])
+    blank = (value == ord(' ')).all(axis=-1)
+    value[blank, 13] = ord('0')
+    try:
+        val = value.view('S14')[:, :, 0].astype(np.float64)
+    except ValueError:  # garbled fields, e.g. a truncated or corrupt line
+        bad = ~numeric_fields(value)
+        value[bad] = ord(' ')
+        value[bad, 13] = ord('0')
+        blank |= bad
+        val = value.view('S14')[:, :, 0].astype(np.float64)
+    val[blank] = np.nan
+
+    flags = fields[:, :, 14:16].astype(np.int16) - ord('0')
+    flags[(flags < 0) | (flags > 9)] = 0
+    lli = (flags[:, :, 0] & 3).astype(np.uint8)
+    ssi = flags[:, :, 1].astype(np.uint8)
+    return val, lli, ssi
+
+# Read rinex obs data body, yields (time, flag, sats, val, lli, ssi) per epoch
+def readrnxobsb(fp, ver, tobs):
+    ntobs = [tobs[i].index('') if '' in tobs[i] else MAXOBSTYPE for i in range(NUMSYS)]
+    nmax = max(max(ntobs), 1)
+
+    for buff in iter(fp.readline, ''):
+        # decode obs epoch
+        nsat, time, flag, sats = decode_obsepoch(fp, buff, ver)
+        if nsat <= 0:
+            continue
+        if 3 <= flag <= 5:  # skip event records
+            for _ in range(nsat):
+                fp.readline()
+            continue
 
+        recs = []
+        if ver <= 2.99:  # ver.2: 5 obs per line
+            nline = max((ntobs[0] + 4) // 5, 1)
+            for _ in range(nsat):
+                lines = [fp.readline().rstrip('\r\n')[:80].ljust(80) for _ in range(nline)]
+                recs.append(''.join(lines))
+        else:  # ver.3: one line per satellite
+            for _ in range(nsat):
+                line = fp.readline().rstrip('\r\n')
+                sats.append(satid2code(line[:3]))
+                recs.append(line[3:])
 
+        valid = [i for i, sat in enumerate(sats[:len(recs)]) if sat is not None]
+        val, lli, ssi = decode_obsdata([recs[i] for i in valid], nmax)
+        yield time, flag, [sats[i] for i in valid], val, lli, ssi
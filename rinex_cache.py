@@ -0,0 +1,348 @@
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the manifest is only guarded between threads
+    fcntl = None
+
+from rinex_nav import read_nav_tables
+from rinex_obs import read_obs_table
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # Default size bound of the cache directory
+CACHE_MANIFEST = 'manifest.json'
+CACHE_LOCK = 'manifest.lock'  # Lock file of manifest writes between processes
+TMP_PREFIX = '.tmp-'  # Files being written
+TMP_MAX_AGE = 3600.0  # Age after which prune_stale removes temporary files (s)
+MANIFEST_FLUSH = 30.0  # Max delay of last_used updates of cache hits (s)
+
+# Parsers of the cached table kinds
+CACHE_READERS = {
+    'obs': read_obs_table,
+    'nav': read_nav_tables,
+}
+
+# Version of the tables of each parser, part of the cache key: bump when a
+# parser changes its output so that NPZ files of older parsers are not used
+PARSER_VERSIONS = {
+    'obs': 2,
+    'nav': 1,
+}
+
+
+# Content hash of a source file
+def file_hash(file_path, blocksize=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# NPZ cache of parsed RINEX tables.
+# Entries are keyed by (kind, parser version, absolute path) and carry the size, mtime and content
+# hash of the source: a changed size or hash means a re-parse, a changed mtime with
+# the same hash only refreshes the entry. The directory is kept under max_bytes by
+# evicting the least recently used entries.
+# Threads of a process share one cache through self.lock; processes share the
+# directory through an OS lock on CACHE_LOCK (fcntl, not on Windows): every
+# manifest write re-reads manifest.json under it and merges in the entries
+# stored, touched and removed here since the last write. Files are written
+# under a unique temporary name, then renamed. Hits only update last_used in
+# memory; they are written at most every MANIFEST_FLUSH s (and by flush()).
+class RinexCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+        self.lock_path = os.path.join(cache_dir, CACHE_LOCK)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        self.locked = 0  # depth of file_lock() in this process
+        self.manifest = self.read_manifest()
+        self.stored = set()  # keys stored since the last write
+        self.touched = set()  # keys hit since the last write
+        self.removed = set()  # keys removed since the last write
+        self.written = time.monotonic()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    # Exclusive lock of the manifest between processes (reentrant, taken
+    # under self.lock)
+    @contextmanager
+    def file_lock(self):
+        with self.lock:
+            if self.locked:
+                self.locked += 1
+                try:
+                    yield
+                finally:
+                    self.locked -= 1
+                return
+            with open(self.lock_path, 'a') as file:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                self.locked = 1
+                try:
+                    yield
+                finally:
+                    self.locked = 0  # closing the file releases the lock
+
+    # Write a file through a unique temporary name in the cache directory
+    def replace_file(self, path, write, mode='w'):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=TMP_PREFIX, suffix=os.path.splitext(path)[1])
+        try:
+            with open(fd, mode) as file:
+                write(file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    # Merge the local changes into the manifest on disk and write it back;
+    # with max_bytes, least recently used entries are evicted first. Returns
+    # the evicted keys.
+    def write_manifest(self, max_bytes=None):
+        with self.file_lock():
+            manifest = self.read_manifest()
+            for key in self.removed:
+                manifest.pop(key, None)
+            for key in self.touched - self.stored:
+                entry, disk = self.manifest.get(key), manifest.get(key)
+                if entry is None or disk is None:
+                    continue
+                disk['last_used'] = max(disk['last_used'], entry['last_used'])
+                if disk['hash'] == entry['hash']:
+                    disk['mtime'] = entry['mtime']
+            for key in self.stored:
+                if key in self.manifest:
+                    manifest[key] = self.manifest[key]
+            self.manifest = manifest
+            self.stored, self.touched, self.removed = set(), set(), set()
+
+            removed = []
+            if max_bytes is not None:
+                entries = sorted(manifest.items(), key=lambda item: item[1]['last_used'])
+                total = sum(entry['bytes'] for _, entry in entries)
+                for key, entry in entries:
+                    if total <= max_bytes:
+                        break
+                    total -= entry['bytes']
+                    removed.append(key)
+                for key in removed:
+                    self.remove(key)
+                self.removed = set()
+            self.replace_file(self.manifest_path, lambda file: json.dump(manifest, file, indent=1))
+            self.written = time.monotonic()
+        return removed
+
+    # Write pending last_used updates of cache hits
+    def flush(self):
+        with self.lock:
+            if self.touched:
+                self.write_manifest()
+
+    def entry_path(self, entry):
+        return os.path.join(self.cache_dir, entry['name'])
+
+    # Cached tables of a source file, parsed and stored on a miss
+    def load(self, kind, file_path):
+        file_path = os.path.abspath(file_path)
+        key = f"{kind}:v{PARSER_VERSIONS[kind]}:{file_path}"
+        st = os.stat(file_path)
+        with self.lock:
+            entry = self.manifest.get(key)
+            if entry is None and time.monotonic() - self.written >= MANIFEST_FLUSH:
+                self.write_manifest()  # pick up entries stored by other processes
+                entry = self.manifest.get(key)
+            entry = dict(entry) if entry is not None else None
+
+        if entry is not None:
+            fresh = entry['size'] == st.st_size and entry['mtime'] == st.st_mtime
+            if not fresh and entry['size'] == st.st_size and entry['hash'] == file_hash(file_path):
+                fresh = True  # touched or copied, same content
+            if fresh:
+                try:
+                    with np.load(self.entry_path(entry)) as data:
+                        tables = {name: data[name] for name in data.files}
+                except OSError:  # evicted meanwhile
+                    tables = None
+                if tables is not None:
+                    self.touch(key, st)
+                    return tables
+
+        tables = CACHE_READERS[kind](file_path)
+        self.store(key, kind, file_path, st, tables)
+        return tables
+
+    # Record a hit: last_used (and a refreshed mtime) written in batches
+    def touch(self, key, st):
+        with self.lock:
+            entry = self.manifest.get(key)
+            if entry is None:
+                return
+            entry['last_used'] = time.time()
+            if entry['mtime'] != st.st_mtime:
+                entry['mtime'] = st.st_mtime
+            self.touched.add(key)
+            if time.monotonic() - self.written >= MANIFEST_FLUSH:
+                self.write_manifest()
+
+    def load_obs(self, file_path):
+        return self.load('obs', file_path)
+
+    def load_nav(self, file_path):
+        return self.load('nav', file_path)
+
+    def store(self, key, kind, file_path, st, tables):
+        name = hashlib.blake2b(key.encode(), digest_size=8).hexdigest() + '.npz'
+        path = os.path.join(self.cache_dir, name)
+        digest = file_hash(file_path)
+        self.replace_file(path, lambda file: np.savez(file, **tables), 'wb')
+        with self.file_lock():
+            self.manifest[key] = {
+                'kind': kind,
+                'file': file_path,
+                'name': name,
+                'size': st.st_size,
+                'mtime': st.st_mtime,
+                'hash': digest,
+                'bytes': os.path.getsize(path),
+                'last_used': time.time(),
+            }
+            self.stored.add(key)
+            self.removed.discard(key)
+            self.write_manifest(self.max_bytes)
+            old = [k for k in self.manifest if k != key and k.startswith(kind + ':v')
+                   and k.split(':', 2)[2] == file_path]
+            if old:
+                for k in old:
+                    self.remove(k)  # written by an older parser
+                self.write_manifest()
+
+    # Evict least recently used entries until the cache fits in max_bytes
+    def prune(self, max_bytes):
+        return self.write_manifest(max_bytes)
+
+    # Drop entries whose source file is gone, whose cache file is missing or
+    # that were written by another parser version, and cache files no entry
+    # refers to (entries lost by older versions, temporary files of writers
+    # that died)
+    def prune_stale(self):
+        current = {f"{kind}:v{version}:" for kind, version in PARSER_VERSIONS.items()}
+        with self.file_lock():
+            self.write_manifest()
+            removed = [key for key, entry in self.manifest.items()
+                       if not any(key.startswith(prefix) for prefix in current)
+                       or not os.path.exists(entry['file']) or not os.path.exists(self.entry_path(entry))]
+            for key in removed:
+                self.remove(key)
+            self.write_manifest()
+            names = {entry['name'] for entry in self.manifest.values()}
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.startswith(TMP_PREFIX):
+                    try:
+                        orphan = time.time() - os.path.getmtime(path) > TMP_MAX_AGE
+                    except OSError:
+                        continue
+                else:
+                    orphan = name.endswith('.npz') and name not in names
+                if orphan:
+                    removed.append(name)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        return removed
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.manifest.pop(key)
+            self.removed.add(key)
+            self.stored.discard(key)
+            self.touched.discard(key)
+        try:
+            os.remove(self.entry_path(entry))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.file_lock():
+            self.write_manifest()
+            for key in list(self.manifest):
+                self.remove(key)
+            self.write_manifest()
+
+    def total_bytes(self):
+        with self.lock:
+            return sum(entry['bytes'] for entry in self.manifest.values())
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RinexCache()
+            atexit.register(_default_cache.flush)
+    return _default_cache
+
+
+# Cached read_obs_table / read_nav_tables
+def load_obs(file_path):
+    return default_cache().load_obs(file_path)
+
+
+def load_nav(file_path):
+    return default_cache().load_nav(file_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the parsed RINEX cache")
+    parser.add_argument('--dir', default=CACHE_DIR, help="cache directory")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="list cache entries, most recently used first")
+    prune = sub.add_parser('prune', help="evict LRU entries and entries of deleted files")
+    prune.add_argument('--max-mb', type=float, default=CACHE_MAX_BYTES / 1024 ** 2)
+    sub.add_parser('clear', help="remove all entries")
+    args = parser.parse_args()
+
+    cache = RinexCache(args.dir)
+    if args.command == 'list':
+        entries = sorted(cache.manifest.values(), key=lambda entry: -entry['last_used'])
+        for entry in entries:
+            used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))
+            print(f"{entry['kind']:3s} {entry['bytes'] / 1024:10.1f} KB  {used}  {entry['file']}")
+        print(f"{len(entries)} entries, {cache.total_bytes() / 1024 ** 2:.1f} MB")
+    elif args.command == 'prune':
+        removed = cache.prune_stale() + cache.prune(int(args.max_mb * 1024 ** 2))
+        print(f"removed {len(removed)} entries, {cache.total_bytes() / 1024 ** 2:.1f} MB left")
+    elif args.command == 'clear':
+        cache.clear()
+        print("cache cleared")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,506 @@
+import gzip
+import io
+
+import numpy as np
+
+from rinex_writer import FIELD_LEN, FIELDS_PER_LINE_V2, SATS_PER_LINE_V2, format_obs_fields, lines_to_bytes
+
+GZIP_MAGIC = b'\x1f\x8b'
+LZW_MAGIC = b'\x1f\x9d'  # Unix compress (.Z)
+CRX_LABEL = b'CRINEX VERS   / TYPE'  # First header line of a Hatanaka compact RINEX file
+STREAM_CHUNK = 1 << 16  # Bytes per decoded chunk
+
+LZW_BITS_MASK = 0x1f  # Max code width in the .Z flags byte
+LZW_BLOCK_MODE = 0x80  # Code 256 clears the table
+LZW_CLEAR = 256
+LZW_INIT_BITS = 9
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+MAX_DIFF_ORDER = 9  # Max order of the CRX differences
+CRX_BLOCK_EPOCHS = 256  # Epochs decoded together
+CLOCK_DECIMALS = {1: 9, 3: 12}  # Receiver clock digits by CRX version (F12.9, F15.12)
+
+
+# Iterator of byte chunks -> raw stream, so that decoders written as generators
+# can be read through io.BufferedReader/io.TextIOWrapper
+class IterStream(io.RawIOBase):
+    def __init__(self, chunks, source=None):
+        self.chunks = iter(chunks)
+        self.source = source  # underlying file, closed with the stream
+        self.rest = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self.rest:
+            self.rest = next(self.chunks, None)
+            if self.rest is None:
+                self.rest = b''
+                return 0
+        n = min(len(buf), len(self.rest))
+        buf[:n] = self.rest[:n]
+        self.rest = self.rest[n:]
+        return n
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+        super().close()
+
+
+# Unix compress (.Z) decoder: LZW codes of 9 up to maxbits bits. Codes come in
+# groups of 8 (n_bits bytes); a change of code width or a table clear drops the
+# rest of the group (ncompress decompress()).
+def iter_unlzw(fp):
+    header = fp.read(3)
+    if header[:2] != LZW_MAGIC or len(header) < 3:
+        raise ValueError("not a .Z file")
+    maxbits = header[2] & LZW_BITS_MASK
+    block_mode = header[2] & LZW_BLOCK_MODE
+    maxmaxcode = 1 << maxbits
+
+    table = [bytes([i]) for i in range(256)] + ([b''] if block_mode else [])
+    n_bits = LZW_INIT_BITS
+    maxcode = (1 << n_bits) - 1
+    prev = None
+    left = 0  # codes left in the current group
+    out = bytearray()
+    while True:
+        if len(table) > maxcode and n_bits < maxbits:
+            n_bits += 1
+            maxcode = maxmaxcode if n_bits == maxbits else (1 << n_bits) - 1
+            left = 0
+        if left == 0:
+            group = fp.read(n_bits)
+            if not group:
+                break
+            value = int.from_bytes(group, 'little')
+            left = len(group) * 8 // n_bits
+            mask = (1 << n_bits) - 1
+        code = value & mask
+        value >>= n_bits
+        left -= 1
+
+        if code == LZW_CLEAR and block_mode:
+            del table[LZW_CLEAR + 1:]
+            n_bits = LZW_INIT_BITS
+            maxcode = (1 << n_bits) - 1
+            prev = None
+            left = 0
+            continue
+        if code < len(table):
+            entry = table[code]
+        elif code == len(table) and prev is not None:
+            entry = table[prev] + table[prev][:1]
+        else:
+            raise ValueError("corrupt .Z data")
+        out += entry
+        if prev is not None and len(table) < maxmaxcode:
+            table.append(table[prev] + entry[:1])
+        prev = code
+        if len(out) >= STREAM_CHUNK:
+            yield bytes(out)
+            out.clear()
+    if out:
+        yield bytes(out)
+
+
+# File contents after gzip/.Z decompression, as a buffered binary stream
+def open_decompressed(file_path):
+    fp = open(file_path, 'rb')
+    magic = fp.peek(2)[:2]
+    if magic == GZIP_MAGIC:
+        fp.close()
+        return gzip.open(file_path, 'rb')
+    if magic == LZW_MAGIC:
+        return io.BufferedReader(IterStream(iter_unlzw(fp), fp), STREAM_CHUNK)
+    return fp
+
+
+# Text diff of compact RINEX epoch lines and flags: ' ' keeps the old character,
+# '&' sets a blank, anything else replaces it
+def apply_text_diff(old, diff):
+    if len(diff) > len(old):
+        old = old.ljust(len(diff))
+    chars = list(old)
+    for i, c in enumerate(diff):
+        if c != ' ':
+            chars[i] = ' ' if c == '&' else c
+    return ''.join(chars)
+
+
+# Fixed point integer (value * 10^decimals) -> right aligned decimal string,
+# without the leading zero of values below 1 (as crx2rnx prints clock offsets)
+def format_fixed(value, decimals, width):
+    sign = '-' if value < 0 else ''
+    ip, fr = divmod(abs(value), 10 ** decimals)
+    return f"{sign}{ip or ''}.{fr:0{decimals}d}".rjust(width)
+
+
+# Arc of differences of one value (receiver clock): "k&v" starts an arc of
+# order k, later values are differences of rising order up to k
+class DiffArc:
+    def __init__(self):
+        self.order = -1  # no value
+        self.count = 0
+        self.d = [0] * (MAX_DIFF_ORDER + 1)
+
+    def update(self, token):
+        if not token:
+            self.order = -1
+            return None
+        if '&' in token:
+            k, v = token.split('&')
+            self.order, self.count = int(k), 0
+            self.d = [int(v)] + [0] * MAX_DIFF_ORDER
+        elif self.order < 0:
+            raise ValueError("compact RINEX difference without initial value")
+        else:
+            self.count = min(self.count + 1, self.order)
+            self.d[self.count] = int(token)
+            for j in range(self.count - 1, -1, -1):
+                self.d[j] += self.d[j + 1]
+        return self.d[0]
+
+
+# Differencing state carried from one block of epochs to the next: differences
+# of every (satellite, obs type) cell and flags of every satellite of the last
+# epoch; cells of other satellites have order -1
+class CrxState:
+    def __init__(self, ntype):
+        self.ntype = ntype
+        self.ids = {}  # satellite -> id
+        self.d = np.zeros((0, MAX_DIFF_ORDER + 1), dtype=np.int64)  # differences, order 0 = value
+        self.count = np.zeros(0, dtype=np.int64)  # differences received since the arc start
+        self.order = np.zeros(0, dtype=np.int64)  # arc order, -1: no value
+        self.flags = np.zeros((0, 2 * ntype), dtype=np.uint8)  # LLI, SSI characters
+        self.present = np.zeros(0, dtype=bool)  # satellite in the last epoch
+
+    # Ids of satellites, new ones get blank state
+    def sat_ids(self, sats):
+        ids = np.array([self.ids.setdefault(sat, len(self.ids)) for sat in sats], dtype=np.int64)
+        grow = len(self.ids) - len(self.present)
+        if grow > 0:
+            ncell = grow * self.ntype
+            self.d = np.concatenate([self.d, np.zeros((ncell, MAX_DIFF_ORDER + 1), dtype=np.int64)])
+            self.count = np.concatenate([self.count, np.zeros(ncell, dtype=np.int64)])
+            self.order = np.concatenate([self.order, np.full(ncell, -1, dtype=np.int64)])
+            self.flags = np.concatenate([self.flags, np.full((grow, 2 * self.ntype), ord(' '), dtype=np.uint8)])
+            self.present = np.concatenate([self.present, np.zeros(grow, dtype=bool)])
+        return ids
+
+
+# Data lines of (satellite, line) rows -> tokens (row x obs type) and flag diffs
+def split_data_lines(sats, lines, ntypes, ntype):
+    tokens, flag_diffs = [], []
+    for sat, line in zip(sats, lines):
+        n = ntypes(sat)
+        parts = line.split(' ', n)
+        flag_diffs.append(parts[n] if len(parts) > n else '')
+        tokens += parts[:n]
+        tokens += [''] * (ntype - min(len(parts), n))
+    return tokens, flag_diffs
+
+
+# Data tokens -> kind (0: no value, 1: arc start "k&v", 2: difference), arc
+# order k and value. The tokens are joined into one byte buffer and cut into
+# digit segments at ' ' and '&'; the value of every segment is the sum of its
+# digits times powers of ten.
+def parse_crx_tokens(tokens):
+    buf = np.frombuffer((' '.join(tokens) + ' ').encode('latin-1'), dtype=np.uint8)
+    amp = buf == ord('&')
+    sep_mask = (buf == ord(' ')) | amp
+    sep = np.flatnonzero(sep_mask)  # end of every segment
+    seg_start = np.concatenate([[0], sep[:-1] + 1])
+    seg = np.cumsum(sep_mask) - sep_mask  # segment of every character
+    exponent = sep[seg] - 1 - np.arange(len(buf))
+    digit = (buf >= ord('0')) & (buf <= ord('9'))
+    contrib = np.where(digit, (buf - ord('0')).astype(np.int64) * _POW10[np.clip(exponent, 0, 18)], 0)
+    value = np.add.reduceat(contrib, seg_start)
+    negative = np.add.reduceat((buf == ord('-')).astype(np.int64), seg_start) > 0
+    value = np.where(negative, -value, value)
+
+    # the last segment of every token ends with ' ', a "k&" segment before it ends with '&'
+    amp_end = amp[sep]
+    last = np.flatnonzero(~amp_end)
+    prev = np.maximum(last - 1, 0)
+    init = (last > 0) & amp_end[prev]
+    empty = (sep[last] == seg_start[last]) & ~init
+    kind = np.where(init, 1, np.where(empty, 0, 2))
+    return kind, np.where(init, value[prev], 0), value[last]
+
+
+# Segment-wise cumulative sum, segments given by the index of their first element
+def segment_cumsum(x, first):
+    cs = np.cumsum(x)
+    return cs - np.concatenate([[0], cs])[first]
+
+
+# Observation values of a block of epochs from the tokens of its data lines.
+# Every (satellite, obs type) cell is an arc of differences: "k&v" starts an arc
+# of order k, the next tokens are differences of order 1, 2, ... k, k, ...
+# The cells of the block are sorted by arc; the first differences of an arc
+# (order rising) are added in a short loop over their position, the rest of
+# every arc is rebuilt with k segment-wise cumulative sums.
+# Returns values (fixed point * 1000) and presence, both (row x obs type).
+def decode_crx_values(state, sid, epoch, tokens, last_epoch):
+    ntype = state.ntype
+    kind, korder, value = parse_crx_tokens(tokens)
+
+    # cells sorted by (cell, epoch); arcs break at a new cell, a missing epoch,
+    # an arc start or an empty cell
+    cell = (sid[:, None] * ntype + np.arange(ntype)).reshape(-1)
+    srt = np.argsort(cell, kind='stable')
+    c, e, kd, y, ko = cell[srt], np.repeat(epoch, ntype)[srt], kind[srt], value[srt], korder[srt]
+    n = len(c)
+    new_cell = np.ones(n, dtype=bool)
+    new_cell[1:] = (c[1:] != c[:-1]) | (e[1:] != e[:-1] + 1)
+    carried = new_cell & (e == 0) & (kd == 2) & (state.order[c] >= 0)  # continues the last block
+    start = new_cell | (kd != 2)
+    first = np.flatnonzero(start)
+    arc = np.cumsum(start) - 1
+    a_cell, a_kind, a_carried = c[first], kd[first], carried[first]
+    a_order = np.where(a_kind == 1, ko[first], np.where(a_carried, state.order[a_cell], -1))
+
+    # differences before the first one of the arc: initial value or carried state
+    d = np.zeros((len(first), MAX_DIFF_ORDER + 1), dtype=np.int64)
+    d[a_carried] = state.d[a_cell[a_carried]]
+    d[a_kind == 1, 0] = y[first[a_kind == 1]]
+    offset = np.where(a_carried, state.count[a_cell] + 1, 0)
+    q = np.arange(n) - first[arc]
+    count = np.minimum(offset[arc] + q, a_order[arc])
+    valid = a_order[arc] >= 0
+    diff = valid & ~start | carried
+    out = np.zeros(n, dtype=np.int64)
+    out[start & (kd == 1)] = y[start & (kd == 1)]
+
+    warm = diff & (count < a_order[arc])
+    for qq in np.unique(q[warm]):
+        rows = np.flatnonzero(warm & (q == qq))
+        ai, cc = arc[rows], count[rows]
+        d[ai, cc] = y[rows]
+        for j in range(int(cc.max()) - 1, -1, -1):
+            m = cc > j
+            d[ai[m], j] += d[ai[m], j + 1]
+        out[rows] = d[ai, 0]
+
+    steady = diff & ~warm
+    for k in np.unique(a_order[arc[steady]]):
+        rows = np.flatnonzero(steady & (a_order[arc] == k))
+        ai = arc[rows]
+        seg = np.concatenate([[True], ai[1:] != ai[:-1]])
+        seg_first = np.flatnonzero(seg)
+        seg_last = np.append(seg_first[1:], len(rows)) - 1
+        seg_index = np.cumsum(seg) - 1
+        level = y[rows]
+        d[ai[seg_last], k] = level[seg_last]
+        for j in range(k - 1, -1, -1):
+            level = d[ai, j] + segment_cumsum(level, seg_first[seg_index])
+            d[ai[seg_last], j] = level[seg_last]
+        out[rows] = level
+
+    # state of the cells of the last epoch for the next block
+    last = np.append(first[1:], n) - 1
+    keep = (e[last] == last_epoch) & valid[last] & (kd[last] != 0)
+    state.order[:] = -1
+    state.d[a_cell[keep]] = d[keep]
+    state.count[a_cell[keep]] = count[last[keep]]
+    state.order[a_cell[keep]] = a_order[keep]
+
+    values = np.empty(n, dtype=np.int64)
+    present = np.empty(n, dtype=bool)
+    values[srt] = out
+    present[srt] = valid & (kd != 0)
+    return values.reshape(-1, ntype), present.reshape(-1, ntype)
+
+
+# LLI/SSI characters of a block: the text diffs of a satellite are forward
+# filled along its run of consecutive epochs, starting from the carried flags
+# (or blanks); flags of missing values are blank
+def decode_crx_flags(state, sid, epoch, flag_diffs, present, last_epoch):
+    width = 2 * state.ntype
+    diffs = np.frombuffer(''.join([f[:width].ljust(width) for f in flag_diffs]).encode('latin-1'),
+                          dtype=np.uint8).reshape(-1, width)
+    srt = np.argsort(sid, kind='stable')
+    s, e = sid[srt], epoch[srt]
+    n = len(s)
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = (s[1:] != s[:-1]) | (e[1:] != e[:-1] + 1)
+    run_first = np.maximum.accumulate(np.where(new_run, np.arange(n), 0))
+    carried = (e[run_first] == 0) & state.present[s[run_first]]
+
+    # a missing value clears its flags, as if the diff were '&'
+    mask = np.repeat(present[srt], 2, axis=1)
+    diff = np.where(mask, diffs[srt], ord('&'))
+    given = diff != ord(' ')
+    pos = np.maximum.accumulate(np.where(given, np.arange(n)[:, None], -1), axis=0)
+    set_in_run = pos >= run_first[:, None]
+    base = np.where(carried[:, None], state.flags[s[run_first]], ord(' '))
+    value = np.where(diff == ord('&'), ord(' '), diff)
+    flags_sorted = np.where(set_in_run, value[np.maximum(pos, 0), np.arange(width)], base).astype(np.uint8)
+
+    flags = np.empty_like(flags_sorted)
+    flags[srt] = flags_sorted
+    last = epoch == last_epoch
+    state.present[:] = False
+    state.present[sid[last]] = True
+    state.flags[sid[last]] = flags[last]
+    return flags
+
+
+# RINEX text of a block of epochs: epoch header lines (heads) followed by the
+# observation lines of their satellites, scattered into one character matrix
+def rinex_block(ver, heads, epoch_sats, values, present, flags, ntypes):
+    nrow, ntype = values.shape
+    obs = np.where(present, values / 1000.0, np.nan)
+    fields = format_obs_fields(obs, 0, 0, blank_zero=False)
+    fields[..., 14:] = flags.reshape(nrow, ntype, 2)
+    sats = [sat for sats in epoch_sats for sat in sats]
+    if ver <= 2.99:
+        per_sat = max((ntype + FIELDS_PER_LINE_V2 - 1) // FIELDS_PER_LINE_V2, 1)
+        pad = np.full((nrow, per_sat * FIELDS_PER_LINE_V2 - ntype, FIELD_LEN), ord(' '), dtype=np.uint8)
+        body = np.concatenate([fields, pad], axis=1).reshape(nrow * per_sat, FIELDS_PER_LINE_V2 * FIELD_LEN)
+    else:
+        per_sat = 1
+        width = np.array([ntypes(sat) for sat in sats], dtype=np.int64)[:, None] * FIELD_LEN
+        body = fields.reshape(nrow, ntype * FIELD_LEN)
+        body[np.arange(ntype * FIELD_LEN) >= width] = ord(' ')
+        ids = np.frombuffer(''.join(sats).encode('latin-1'), dtype=np.uint8).reshape(nrow, 3)
+        body = np.concatenate([ids, body], axis=1)
+
+    head_lines = [head.split('\n') for head in heads]
+    nhead = np.array([len(lines) for lines in head_lines], dtype=np.int64)
+    nsat = np.array([len(sats) for sats in epoch_sats], dtype=np.int64)
+    head_lines = [line for lines in head_lines for line in lines]
+    width = max(body.shape[1], max(len(line) for line in head_lines))
+    start = np.concatenate([[0], np.cumsum(nhead + nsat * per_sat)])
+    chars = np.full((start[-1], width), ord(' '), dtype=np.uint8)
+    head_rows = (start[:-1, None] + np.arange(nhead.max()))[np.arange(nhead.max()) < nhead[:, None]]
+    chars[head_rows] = np.frombuffer(''.join([line.ljust(width) for line in head_lines]).encode('latin-1'),
+                                     dtype=np.uint8).reshape(-1, width)
+    epoch = np.repeat(np.arange(len(nsat)), nsat)
+    index = np.arange(nrow) - np.repeat(np.concatenate([[0], np.cumsum(nsat)])[:-1], nsat)
+    rows = (start[epoch] + nhead[epoch] + index * per_sat)[:, None] + np.arange(per_sat)
+    chars[rows.reshape(-1), :body.shape[1]] = body
+    return lines_to_bytes(chars)
+
+
+# Decode a block of epochs: heads, satellites and data lines of every epoch
+def decode_crx_block(state, ver, heads, epoch_sats, data, ntypes):
+    sats = [sat for sats in epoch_sats for sat in sats]
+    if not sats:
+        return ('\n'.join(heads) + '\n').encode('latin-1')
+    sid = state.sat_ids(sats)
+    epoch = np.repeat(np.arange(len(epoch_sats)), [len(sats) for sats in epoch_sats])
+    last_epoch = len(epoch_sats) - 1
+    tokens, flag_diffs = split_data_lines(sats, data, ntypes, state.ntype)
+    values, present = decode_crx_values(state, sid, epoch, tokens, last_epoch)
+    flags = decode_crx_flags(state, sid, epoch, flag_diffs, present, last_epoch)
+    return rinex_block(ver, heads, epoch_sats, values, present, flags, ntypes)
+
+
+# Number of obs types of each system from the RINEX header lines
+def header_obs_types(lines, ver):
+    ntypes = {}
+    for line in lines:
+        label = line[60:].rstrip()
+        if ver <= 2.99 and label == '# / TYPES OF OBSERV' and line[:6].strip():
+            ntypes[' '] = int(line[:6])
+        elif ver > 2.99 and label == 'SYS / # / OBS TYPES' and line[0] != ' ':
+            ntypes[line[0]] = int(line[3:6])
+    return ntypes
+
+
+# Hatanaka compact RINEX (CRX 1.0 / 3.0) -> RINEX text, one chunk per block of
+# epochs (crx2rnx). lines: iterator of the compact RINEX text lines.
+# bench_compress.check compares the output with crx2rnx on data/compress.
+def iter_crx2rnx(lines):
+    lines = (line.rstrip('\r\n') for line in lines)
+    first = next(lines, '')
+    if first[60:80] != CRX_LABEL.decode():
+        raise ValueError("not a compact RINEX file")
+    crx_ver = int(float(first[:9]))
+    next(lines)  # CRINEX PROG / DATE
+
+    header = []
+    for line in lines:
+        header.append(line)
+        if line[60:73] == 'END OF HEADER':
+            break
+    ver = float(header[0][:9])
+    counts = header_obs_types(header, ver)
+    yield ('\n'.join(header) + '\n').encode('latin-1')
+
+    if ver <= 2.99:
+        ntypes = lambda sat: counts[' ']
+        flag_col, sats_col, epoch_len, init_char = 28, 32, 32, '&'
+    else:
+        ntypes = lambda sat: counts.get(sat[0], 0)
+        flag_col, sats_col, epoch_len, init_char = 31, 41, 35, '>'
+    decimals = CLOCK_DECIMALS.get(crx_ver, 9)
+    state = CrxState(max(list(counts.values()) + [1]))
+    clock = DiffArc()
+    epoch = ''
+    heads, epoch_sats, data = [], [], []
+
+    for line in lines:
+        if line.startswith(init_char):
+            new = line if init_char == '>' else ' ' + line[1:]
+        else:
+            new = apply_text_diff(epoch, line)
+        nsat = int(new[flag_col + 1:flag_col + 4])
+
+        # event records: the epoch line and nsat header lines, as they are
+        if new[flag_col] in '2345':
+            if heads:
+                yield decode_crx_block(state, ver, heads, epoch_sats, data, ntypes)
+                heads, epoch_sats, data = [], [], []
+            special = [new[:epoch_len].rstrip()] + [next(lines) for _ in range(nsat)]
+            yield ('\n'.join(special) + '\n').encode('latin-1')
+            continue
+        epoch = new
+        clk = clock.update(next(lines).strip())
+        sat_list = epoch[sats_col:]
+        sats = [sat_list[3 * i:3 * i + 3] for i in range(nsat)]
+        data += [next(lines) for _ in range(nsat)]
+
+        if ver <= 2.99:
+            head = epoch[:epoch_len] + ''.join(sats[:SATS_PER_LINE_V2])
+            if clk is not None:
+                head = head.ljust(68) + format_fixed(clk, decimals, 12)
+            for i in range(SATS_PER_LINE_V2, nsat, SATS_PER_LINE_V2):
+                head += '\n' + ' ' * 32 + ''.join(sats[i:i + SATS_PER_LINE_V2])
+        else:
+            head = epoch[:epoch_len]
+            if clk is not None:
+                head += ' ' * 6 + format_fixed(clk, decimals, 15)
+        heads.append(head)
+        epoch_sats.append(sats)
+        if len(heads) == CRX_BLOCK_EPOCHS:
+            yield decode_crx_block(state, ver, heads, epoch_sats, data, ntypes)
+            heads, epoch_sats, data = [], [], []
+    if heads:
+        yield decode_crx_block(state, ver, heads, epoch_sats, data, ntypes)
+
+
+# File contents as RINEX bytes: gzip/.Z decompressed and compact RINEX decoded
+def open_rinex_binary(file_path):
+    fp = open_decompressed(file_path)
+    if fp.peek(80)[60:80] != CRX_LABEL:
+        return fp
+    text = io.TextIOWrapper(fp, encoding='latin-1')
+    return io.BufferedReader(IterStream(iter_crx2rnx(text), text), STREAM_CHUNK)
+
+
+# RINEX file (plain, .gz, .Z, compact RINEX or compressed compact RINEX) as a text stream
+def open_rinex(file_path):
+    return io.TextIOWrapper(open_rinex_binary(file_path), encoding='latin-1')
+
+
+# True if the file has to go through decoding (no byte offsets/mmap access)
+def is_encoded(file_path):
+    with open(file_path, 'rb') as fp:
+        head = fp.read(80)
+    return head[:2] in (GZIP_MAGIC, LZW_MAGIC) or head[60:80] == CRX_LABEL
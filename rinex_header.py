@@ -0,0 +1,24 @@
+# Header record formats (label -> format tuple of the 60-column data part), shared by
+# rinex.RinexRecord.required_records and the RINEX writers
+HEADER_FORMATS = {
+    'RINEX VERSION / TYPE': ('%9.2f', '%11s', '%1s', '%19s', '%1s', '%19s'),
+    'PGM / RUN BY / DATE': ('%-20s', '%-20s', '%-20s'),
+    'MARKER NAME': ('%-60s',),
+    'MARKER NUMBER': ('%-20s',),
+    'OBSERVER / AGENCY': ('%-20s', '%-40s'),
+    'REC # / TYPE / VERS': ('%-20s', '%-20s', '%-20s'),
+    'ANT # / TYPE': ('%-20s', '%-20s'),
+    'ANTENNA: DELTA H/E/N': ('%14.4f', '%14.4f', '%14.4f'),
+    'APPROX POSITION XYZ': ('%14.4f', '%14.4f', '%14.4f'),
+    'TIME OF FIRST OBS': ('%6i', '%6i', '%6i', '%6i', '%6i', '%13.7f', '%8s'),
+    'TIME OF LAST OBS': ('%6i', '%6i', '%6i', '%6i', '%6i', '%13.7f', '%8s'),
+    'INTERVAL': ('%10.3f',),
+    'COMMENT': ('%-60s',),
+}
+
+
+# One header line: values formatted with the label's format tuple, cut or padded
+# to 60 columns, followed by the label
+def format_header_line(label, values):
+    body = ''.join([fmt % value for fmt, value in zip(HEADER_FORMATS[label], values)])
+    return f"{body[:60]:<60}{label}\n"
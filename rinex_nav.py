@@ -0,0 +1,198 @@
+import numpy as np
+
+from rinex_compress import open_rinex_binary
+
+# Field names of one GPS ephemeris (same order as rinex_reader3.parse_nav_rinex_body)
+NAV_FIELDS = [
+    "satellite", "epoch", "sv_clock_bias", "sv_clock_drift", "sv_clock_drift_rate",
+    "IODC", "crs", "delta_n", "M0",
+    "cuc", "e", "cus", "sqrtA",
+    "toe", "cic", "omega0", "cis",
+    "i0", "crc", "omega", "omega_dot",
+    "idot", "L2_code", "GPS_week", "L2_P_flag",
+    "SV_accuracy", "SV_health", "TGD", "IODC_clock",
+    "trans_time"
+]
+
+NAV_LINE_LEN = 80  # Broadcast orbit line length
+NAV_FIELD_LEN = 19  # Width of one D19.12 field
+
+# Broadcast orbit fields shared by the Keplerian systems, data[0..19] in rinex.c order.
+# data[3] keeps the reader name "IODC" (IODE/IODnav/AODE/IODEC depending on system).
+KEPLER_FIELDS = NAV_FIELDS[2:22]
+
+# Per-system record layout: names of data[0], data[1], ... (None: spare slot),
+# the line count of a record follows from the number of slots
+NAV_LAYOUTS = {
+    "G": KEPLER_FIELDS + ["L2_code", "GPS_week", "L2_P_flag", "SV_accuracy", "SV_health", "TGD",
+                          "IODC_clock", "trans_time", "fit_interval"],
+    "J": KEPLER_FIELDS + ["L2_code", "GPS_week", "L2_P_flag", "SV_accuracy", "SV_health", "TGD",
+                          "IODC_clock", "trans_time", "fit_interval"],
+    "E": KEPLER_FIELDS + ["data_sources", "GAL_week", None, "SISA", "SV_health", "BGD_E5a",
+                          "BGD_E5b", "trans_time"],
+    "C": KEPLER_FIELDS + [None, "BDT_week", None, "SV_accuracy", "SV_health", "TGD1",
+                          "TGD2", "trans_time", "AODC"],
+    "I": KEPLER_FIELDS + [None, "IRN_week", None, "SV_accuracy", "SV_health", "TGD",
+                          None, "trans_time"],
+    "R": ["sv_clock_bias", "sv_relative_freq_bias", "message_frame_time",
+          "X", "X_velocity", "X_acceleration", "health",
+          "Y", "Y_velocity", "Y_acceleration", "freq_num",
+          "Z", "Z_velocity", "Z_acceleration", "age_of_oper_info"],
+    "S": ["sv_clock_bias", "sv_clock_drift", "trans_time",
+          "X", "X_velocity", "X_acceleration", "health",
+          "Y", "Y_velocity", "Y_acceleration", "URA",
+          "Z", "Z_velocity", "Z_acceleration", "IODN"],
+}
+
+# Extra GLONASS line from ver.3.05 on
+GLO_305_FIELDS = ["status_flags", "L1L2_delay", "URAI", "health_flags"]
+
+# Satellite system of ver.2 NAV files by file type
+NAV_V2_SYSTEMS = {"N": "G", "G": "R", "H": "S"}
+
+# ver.4 messages decoded with the ver.3 layouts
+NAV_V4_MESSAGES = [b"LNAV", b"INAV", b"FNAV", b"FDMA", b"D1", b"D2", b"SBAS"]
+
+# Byte translation applied to the whole body: tabs -> blank
+NAV_CHAR_MAP = bytes.maketrans(b"\t", b" ")
+
+
+# Split a NAV RINEX file into (version, file type, satellite system, body bytes)
+def split_nav_rinex(data):
+    end = data.find(b"END OF HEADER")
+    if end < 0:
+        raise ValueError("END OF HEADER not found")
+    version = float(data[:9])
+    file_type = data[20:21].decode()
+    sys_code = data[40:41].decode()
+    body = data.find(b"\n", end)
+    return version, file_type, sys_code, data[body + 1:] if body >= 0 else b""
+
+
+# Record line count and field names for a satellite system
+def nav_layout(sys, version):
+    fields = NAV_LAYOUTS[sys]
+    if sys == "R" and version >= 3.05:
+        fields = fields + GLO_305_FIELDS
+    # the first line holds 3 values after the epoch, every other line 4:
+    # 1 + ceil((len(fields) - 3) / 4) lines
+    return 1 + len(fields) // 4, fields
+
+
+def nav_dtype(fields):
+    return np.dtype([("satellite", "U3"), ("epoch", "U19")] +
+                    [(name, np.float64) for name in fields if name is not None])
+
+
+# Pack body lines into an (n, 80) byte matrix
+def nav_char_matrix(body):
+    lines = b"".join([line[:NAV_LINE_LEN].ljust(NAV_LINE_LEN) for line in body.splitlines()])
+    chars = np.frombuffer(lines.translate(NAV_CHAR_MAP), dtype=np.uint8).reshape(-1, NAV_LINE_LEN)
+    return chars[(chars != ord(" ")).any(axis=1)]
+
+
+# Convert a (..., 19) byte block into floats (D exponents allowed), blank fields -> nan
+def nav_fields_to_float(fields):
+    fields = np.ascontiguousarray(fields)
+    fields[(fields == ord("D")) | (fields == ord("d"))] = ord("E")
+    blank = (fields == ord(" ")).all(axis=-1)
+    fields[blank, 0] = ord("0")
+    values = fields.view("S%d" % NAV_FIELD_LEN)[..., 0].astype(np.float64)
+    values[blank] = np.nan
+    return values
+
+
+# Cut one record of `nlines` lines out of the char matrix for every record start.
+# Lines at or past `ends` (start of the next record) are left blank.
+# Returns the (n, nlines * 4) data values (slot 0 is the epoch, left as nan)
+# and the (n, nlines, 80) record lines.
+def nav_record_values(chars, starts, ends, nlines, sp):
+    rows = starts[:, None] + np.arange(nlines)
+    present = rows < ends[:, None]
+    records = chars[np.minimum(rows, len(chars) - 1)]
+    records[~present] = ord(" ")
+
+    fields = records[:, :, sp:sp + 4 * NAV_FIELD_LEN].reshape(len(starts), nlines, 4, NAV_FIELD_LEN)
+    fields = fields.copy()
+    fields[:, 0, 0, :] = ord(" ")  # toc field is decoded separately
+    values = nav_fields_to_float(fields).reshape(len(starts), nlines * 4)
+    return values, records
+
+
+# Record start/end lines and system of every ephemeris in the char matrix
+def nav_record_bounds(chars, version, file_type, sys_code):
+    if version >= 4.0:  # ver.4: "> EPH G01 LNAV" before every record
+        heads = np.flatnonzero(chars[:, 0] == ord(">"))
+        ends = np.append(heads[1:], len(chars))
+        message = np.char.strip(np.ascontiguousarray(chars[heads, 10:14]).view("S4")[:, 0])
+        eph = (chars[heads, 2] == ord("E")) & (chars[heads, 3] == ord("P")) & (chars[heads, 4] == ord("H"))
+        keep = eph & np.isin(message, NAV_V4_MESSAGES)
+        starts, ends = heads[keep] + 1, ends[keep]
+        return starts, ends, chars[starts, 0], 4
+
+    if version >= 3.0 or sys_code in ("E", "J"):  # ver.3: "G01 yyyy mm dd hh mm ss"
+        starts = np.flatnonzero(chars[:, 0] != ord(" "))
+        systems = chars[starts, 0]
+        sp = 4
+    else:  # ver.2: "pp yy mm dd hh mm ss.s"
+        starts = np.flatnonzero(chars[:, 1] != ord(" "))
+        systems = np.full(len(starts), ord(NAV_V2_SYSTEMS.get(file_type, "G")), dtype=np.uint8)
+        sp = 3
+    return starts, np.append(starts[1:], len(chars)), systems, sp
+
+
+# Decode all records of one system into a structured table
+def nav_table(chars, starts, ends, sys, version, sp):
+    nlines, fields = nav_layout(sys, version)
+    values, records = nav_record_values(chars, starts, ends, nlines, sp)
+
+    table = np.zeros(len(starts), dtype=nav_dtype(fields))
+    first = records[:, 0, :]
+    if sp == 4:
+        satellite = first[:, :3].copy()
+        satellite[satellite == ord(" ")] = ord("0")  # "G 1" -> "G01"
+        table["satellite"] = satellite.view("S3")[:, 0].astype("U3")
+    else:
+        prn = np.ascontiguousarray(first[:, :2]).view("S2")[:, 0].astype(np.int64)
+        table["satellite"] = np.char.mod(sys + "%02d", prn)
+    epoch = np.ascontiguousarray(first[:, sp:sp + NAV_FIELD_LEN]).view("S%d" % NAV_FIELD_LEN)[:, 0]
+    table["epoch"] = np.char.strip(epoch.astype("U%d" % NAV_FIELD_LEN))
+
+    for i, name in enumerate(fields):
+        if name is not None:
+            table[name] = values[:, i + 1]
+    return table
+
+
+# NAV RINEX 2/3/4 reader: one structured table per satellite system ("G", "R", "E", ...).
+# The record length of each system is known from NAV_LAYOUTS, so every record is cut
+# out of the file in one slice instead of classifying its lines one by one.
+def read_nav_tables(file_path):
+    with open_rinex_binary(file_path) as file:
+        version, file_type, sys_code, body = split_nav_rinex(file.read())
+
+    chars = nav_char_matrix(body)
+    starts, ends, systems, sp = nav_record_bounds(chars, version, file_type, sys_code)
+
+    tables = {}
+    for code in np.unique(systems):
+        sys = chr(code)
+        if sys not in NAV_LAYOUTS:
+            continue
+        sel = systems == code
+        tables[sys] = nav_table(chars, starts[sel], ends[sel], sys, version, sp)
+    return tables
+
+
+# NAV RINEX body parser: one structured row per GPS ephemeris
+def parse_nav_rinex_body(file_path):
+    tables = read_nav_tables(file_path)
+    if "G" not in tables:
+        return np.zeros(0, dtype=nav_dtype(NAV_LAYOUTS["G"]))
+    return tables["G"]
+
+
+# Structured rows -> list of dicts, as returned by the rinex_reader scripts
+def nav_records_to_dicts(observations):
+    names = observations.dtype.names
+    return [dict(zip(names, row.tolist())) for row in observations]
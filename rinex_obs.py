@@ -0,0 +1,440 @@
+import io
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gtime import as_gtime, epoch2gtime, gtime2datetime64
+from rinex_compress import is_encoded, open_rinex
+from rinex6 import (MAXOBSTYPE, NFREQ, NINCOBS, NUMSYS, TSYS_GPS, syscodes, sysflags,
+                    SigInd, Sta, readrnxh, readrnxobsb, set_index)
+
+
+# Decoded OBS RINEX header
+class ObsHeader:
+    def __init__(self):
+        self.ver = 2.10
+        self.type = ' '
+        self.sys = None
+        self.tsys = TSYS_GPS
+        self.tobs = [[''] * MAXOBSTYPE for _ in range(NUMSYS)]
+        self.sta = Sta()
+
+    # Observation types of a system ("G", "R", ...), column order of ObsEpoch.obs
+    def obs_types(self, sys):
+        tobs = self.tobs[syscodes.index(sys)]
+        return tobs[:tobs.index('')] if '' in tobs else tobs
+
+
+# One observation epoch: time is a gtime (int ns GPST), obs/lli/ssi are
+# (satellite x obs type) arrays, columns follow header.obs_types() of each
+# satellite's system
+class ObsEpoch:
+    def __init__(self, time, flag, sats, obs, lli, ssi):
+        self.time = time
+        self.flag = flag
+        self.sats = sats
+        self.obs = obs
+        self.lli = lli
+        self.ssi = ssi
+
+    # Column of one observation type (e.g. "C1C") for all satellites of a system
+    def select(self, header, sys, obs_type):
+        rows = self.sats.astype('U1') == sys
+        col = header.obs_types(sys).index(obs_type)
+        return self.sats[rows], self.obs[rows, col]
+
+
+# Read the header of an open OBS RINEX file, leaves fp at the first epoch
+def read_obs_header(fp):
+    header = ObsHeader()
+    result = readrnxh(fp, header.tobs, None, header.sta)
+    if result is None:
+        raise ValueError("not a RINEX file")
+    header.ver, header.type, header.sys, header.tsys = result
+    if header.type != 'O':
+        raise ValueError(f"not an observation file: type={header.type}")
+    return header
+
+
+# Epoch generator over an open OBS RINEX file positioned after the header
+def iter_obs_body(fp, header):
+    for time, flag, sats, val, lli, ssi in readrnxobsb(fp, header.ver, header.tobs):
+        yield ObsEpoch(time, flag, np.array(sats, dtype='U3'), val, lli, ssi)
+
+
+# Stream an OBS RINEX file one epoch at a time: memory use does not grow with
+# the file size and the first epoch is available after reading only the header.
+# gzip, .Z and compact RINEX (Hatanaka) files are decoded on the fly.
+def iter_obs_epochs(file_path):
+    with open_rinex(file_path) as fp:
+        header = read_obs_header(fp)
+        yield header
+        yield from iter_obs_body(fp, header)
+
+
+# Header plus epoch generator, e.g.
+#   header, epochs = open_obs_rinex(path)
+#   for epoch in epochs: ...
+# clean: epochs pass the cycle slip/outlier filter (slips.clean_epochs)
+def open_obs_rinex(file_path, clean=False):
+    epochs = iter_obs_epochs(file_path)
+    header = next(epochs)
+    if clean:
+        from slips import clean_epochs
+        epochs = clean_epochs(header, epochs)
+    return header, epochs
+
+
+
+# Row-oriented column buffer that grows in fixed chunks of NINCOBS rows
+# (rinex.c addobsdata) instead of appending one object per epoch; the chunks are
+# joined once by arrays(). Chunks are allocated empty (pages are only committed
+# when written) and only the rows used are written: columns not given to
+# append() get their fill value there.
+class ChunkedColumns:
+    def __init__(self, columns, chunk=NINCOBS):
+        self.columns = columns  # {name: (dtype, row shape, fill value)}
+        self.chunk = chunk
+        self.chunks = []
+        self.n = 0  # rows used in the last chunk
+
+    def new_chunk(self):
+        self.chunks.append({name: np.empty((self.chunk,) + shape, dtype=dtype)
+                            for name, (dtype, shape, fill) in self.columns.items()})
+        self.n = 0
+
+    # Append len(rows) rows, values are arrays or scalars per column
+    def append(self, nrows, **values):
+        done = 0
+        while done < nrows:
+            if not self.chunks or self.n == self.chunk:
+                self.new_chunk()
+            m = min(nrows - done, self.chunk - self.n)
+            chunk = self.chunks[-1]
+            for name, (dtype, shape, fill) in self.columns.items():
+                if name not in values:
+                    chunk[name][self.n:self.n + m] = fill
+                    continue
+                value = np.asarray(values[name])
+                chunk[name][self.n:self.n + m] = value[done:done + m] if value.ndim else value
+            self.n += m
+            done += m
+
+    def __len__(self):
+        return max(len(self.chunks) - 1, 0) * self.chunk + (self.n if self.chunks else 0)
+
+    def arrays(self):
+        if not self.chunks:
+            return {name: np.full((0,) + shape, fill, dtype=dtype)
+                    for name, (dtype, shape, fill) in self.columns.items()}
+        return {name: np.concatenate([chunk[name] for chunk in self.chunks[:-1]] +
+                                     [self.chunks[-1][name][:self.n]])
+                for name in self.columns}
+
+
+# Columns of a sequence of epochs, one row per (epoch, satellite):
+# time (gtime), sat and obs/lli/ssi (row x obs type)
+def epoch_rows(header, epochs):
+    ntobs = max([len(header.obs_types(sys)) for sys in syscodes] + [1])
+    rows = ChunkedColumns({
+        'time': (np.int64, (), 0),
+        'sat': ('U3', (), ''),
+        'obs': (np.float64, (ntobs,), np.nan),
+        'lli': (np.uint8, (ntobs,), 0),
+        'ssi': (np.uint8, (ntobs,), 0),
+    })
+    for epoch in epochs:
+        k = min(epoch.obs.shape[1], ntobs)
+        rows.append(len(epoch.sats), time=epoch.time, sat=epoch.sats,
+                    obs=epoch.obs[:, :k], lli=epoch.lli[:, :k], ssi=epoch.ssi[:, :k])
+    return rows.arrays()
+
+
+# Epoch rows -> table: datetime64 times, version and obs type names added
+def obs_table(header, rows):
+    table = dict(rows)
+    table['time'] = gtime2datetime64(table['time'])
+    table['ver'] = np.float64(header.ver)
+    for sys in syscodes:
+        table['types_' + sys] = np.array(header.obs_types(sys), dtype='U3')
+    return table
+
+
+# Whole OBS file as columns, one row per (epoch, satellite):
+# time, sat, obs/lli/ssi (row x obs type) and types_<sys> (obs type names)
+def read_obs_table(file_path, clean=False):
+    header, epochs = open_obs_rinex(file_path, clean)
+    return obs_table(header, epoch_rows(header, epochs))
+
+
+# Observation store in the layout of rinex.c obsd_t: per row time (gtime), sat and
+# P/L/D/S (pseudorange, carrier phase, doppler, signal strength) plus LLI for NFREQ
+# frequencies. The obs type kept for each frequency is the highest priority code
+# of the header (set_index); missing values are nan.
+class ObsStore:
+    KINDS = 'PLDS'  # type index of SigInd: 0:C -> P, 1:L, 2:D, 3:S
+
+    def __init__(self, header, chunk=NINCOBS):
+        self.header = header
+        # (4, NFREQ) column of every (kind, frequency) per system, -1: none
+        self.cols = {}
+        for i, sys in enumerate(syscodes):
+            ind = SigInd()
+            set_index(header.ver, sysflags[i], header.tobs[i], ind)
+            cols = np.full((len(self.KINDS), NFREQ), -1, dtype=np.int64)
+            for j in range(ind.n):
+                if ind.pos[j] >= 0:
+                    cols[ind.type[j], ind.pos[j]] = j
+            self.cols[sys] = cols
+        self.rows = ChunkedColumns({
+            'time': (np.int64, (), 0),
+            'sat': ('U3', (), ''),
+            'data': (np.float64, (len(self.KINDS), NFREQ), np.nan),
+            'lli': (np.uint8, (NFREQ,), 0),
+        }, chunk)
+
+    def add_epoch(self, epoch):
+        nsat = len(epoch.sats)
+        data = np.full((nsat, len(self.KINDS), NFREQ), np.nan)
+        lli = np.zeros((nsat, NFREQ), dtype=np.uint8)
+        systems = epoch.sats.astype('U1')
+        for sys in np.unique(systems):
+            if sys not in self.cols:
+                continue
+            rows = np.flatnonzero(systems == sys)
+            cols = self.cols[sys]
+            have = cols >= 0
+            data[rows] = np.where(have, epoch.obs[rows][:, np.maximum(cols, 0)], np.nan)
+            phase = cols[1]
+            lli[rows] = np.where(phase >= 0, epoch.lli[rows][:, np.maximum(phase, 0)], 0)
+        self.rows.append(nsat, time=epoch.time, sat=epoch.sats, data=data, lli=lli)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Joined columns: time, sat, P, L, D, S (row x NFREQ) and lli
+    def arrays(self):
+        arrays = self.rows.arrays()
+        data = arrays.pop('data')
+        for k, kind in enumerate(self.KINDS):
+            arrays[kind] = data[:, k]
+        return arrays
+
+
+# Read an OBS file into an ObsStore
+def read_obs_store(file_path, chunk=NINCOBS):
+    header, epochs = open_obs_rinex(file_path)
+    store = ObsStore(header, chunk)
+    for epoch in epochs:
+        store.add_epoch(epoch)
+    return store
+
+
+INDEX_SUFFIX = '.idx.npz'  # Epoch index sidecar next to the OBS file
+INDEX_CHUNK = 1 << 24  # Bytes scanned per pass while looking for epoch lines
+
+# Epoch line columns: (year, month, day, hour, minute, second) slices
+EPOCH_COLS_V2 = [(1, 3), (4, 6), (7, 9), (10, 12), (13, 15), (15, 26)]
+EPOCH_COLS_V3 = [(2, 6), (7, 9), (10, 12), (13, 15), (16, 18), (18, 29)]
+# Epoch line columns: epoch flag, number of satellites slice
+EPOCH_NSAT_V2 = (28, 29, 32)
+EPOCH_NSAT_V3 = (31, 32, 35)
+
+
+# Byte offsets of the epoch header lines in a mapped OBS file. Only the epoch
+# lines of observation data (epoch flag other than 3-5, as readrnxobsb) whose
+# time fields are numeric are kept: event records have blank or no times.
+def scan_epoch_lines(buf, body, ver):
+    flag_col, _, end_col = EPOCH_NSAT_V2 if ver <= 2.99 else EPOCH_NSAT_V3
+    starts = []
+    for pos in range(body, len(buf), INDEX_CHUNK):
+        chunk = buf[pos:pos + INDEX_CHUNK]
+        lines = np.flatnonzero(chunk == ord('\n')) + pos + 1
+        starts.append(lines[lines < len(buf) - end_col])
+    starts = np.concatenate([np.array([body])] + starts)
+    starts = starts[starts < len(buf) - end_col]
+
+    if ver <= 2.99:  # ver.2: " yy mm dd hh mm ss.sssssss  f nnn"
+        is_digit = lambda c: (c >= ord('0')) & (c <= ord('9'))
+        epoch = (is_digit(buf[starts + 2]) & (buf[starts + 3] == ord(' ')) &
+                 (buf[starts + 18] == ord('.')) & (buf[starts + 26] == ord(' ')) &
+                 is_digit(buf[starts + 28]))
+    else:  # ver.3: "> yyyy mm dd hh mm ss.sssssss  f nnn"
+        epoch = buf[starts] == ord('>')
+    starts = starts[epoch]
+    flag = buf[starts + flag_col]
+    starts = starts[((flag < ord('3')) | (flag > ord('5'))) & numeric_times(buf, starts, ver)]
+    return starts
+
+
+# Epoch lines at `starts` whose time fields hold a number (digits, blanks and
+# at most a decimal point, at least one digit)
+def numeric_times(buf, starts, ver):
+    ok = np.ones(len(starts), dtype=bool)
+    for a, b in EPOCH_COLS_V2 if ver <= 2.99 else EPOCH_COLS_V3:
+        field = buf[starts[:, None] + np.arange(a, b)]
+        digit = (field >= ord('0')) & (field <= ord('9'))
+        point = field == ord('.')
+        ok &= np.all(digit | point | (field == ord(' ')), axis=1) & digit.any(axis=1) & (point.sum(axis=1) <= 1)
+    return ok
+
+
+# Epoch times (datetime64[ns]) decoded from the epoch lines at `starts`
+def decode_epoch_times(buf, starts, ver):
+    cols = EPOCH_COLS_V2 if ver <= 2.99 else EPOCH_COLS_V3
+    ep = np.empty((len(starts), 6))
+    for k, (a, b) in enumerate(cols):
+        field = np.ascontiguousarray(buf[starts[:, None] + np.arange(a, b)])
+        ep[:, k] = field.view('S%d' % (b - a))[:, 0].astype(np.float64)
+    return gtime2datetime64(epoch2gtime(ep))
+
+
+# Satellite rows of the epochs at `starts` (number of satellites of the epoch
+# line, 0 for event records)
+def decode_epoch_rows(buf, starts, ver):
+    flag_col, a, b = EPOCH_NSAT_V2 if ver <= 2.99 else EPOCH_NSAT_V3
+    field = np.ascontiguousarray(buf[starts[:, None] + np.arange(a, b)])
+    field[(field < ord('0')) | (field > ord('9'))] = ord('0')
+    nsat = field.view('S%d' % (b - a))[:, 0].astype(np.int64)
+    flag = buf[starts + flag_col]
+    return np.where((flag >= ord('3')) & (flag <= ord('5')), 0, nsat)
+
+
+# Satellite rows of every epoch of a plain OBS file from its epoch index
+def epoch_row_counts(file_path, offsets):
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                rows = decode_epoch_rows(buf, offsets, float(mm[:9]))
+            finally:
+                del buf  # the map cannot be closed while exported
+    return rows
+
+
+# Scan an OBS RINEX file through mmap and save a sidecar with the byte offset
+# and time of every epoch, and whether the times are in order
+def build_epoch_index(file_path, save=True):
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                ver = float(mm[:9])
+                end = mm.find(b'END OF HEADER')
+                if end < 0:
+                    raise ValueError("END OF HEADER not found")
+                body = mm.find(b'\n', end) + 1
+                offsets = scan_epoch_lines(buf, body, ver)
+                times = decode_epoch_times(buf, offsets, ver)
+            finally:
+                del buf  # the map cannot be closed while exported
+
+    st = os.stat(file_path)
+    index = {'offsets': offsets, 'times': times, 'ordered': bool(np.all(times[1:] >= times[:-1])),
+             'size': st.st_size, 'mtime': st.st_mtime}
+    if save:
+        np.savez(file_path + INDEX_SUFFIX, **index)
+    return index
+
+
+# Load the epoch index of a file, rebuilding it if missing or out of date
+def load_epoch_index(file_path):
+    st = os.stat(file_path)
+    try:
+        with np.load(file_path + INDEX_SUFFIX) as data:
+            if int(data['size']) == st.st_size and float(data['mtime']) == st.st_mtime and 'ordered' in data:
+                return {key: data[key] for key in data.files}
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_epoch_index(file_path)
+
+
+# Decode only the epochs with t0 <= time <= t1 (datetime or datetime64),
+# seeking straight to the first one through the epoch index. Compressed and
+# compact RINEX files have no byte offsets to seek to and are streamed instead,
+# as are files whose epochs are out of time order.
+def read_epochs(file_path, t0, t1):
+    if is_encoded(file_path):
+        return stream_epochs(file_path, t0, t1)
+    index = load_epoch_index(file_path)
+    if not index['ordered']:
+        return stream_epochs(file_path, t0, t1, ordered=False)
+    t0, t1 = np.datetime64(t0, 'ns'), np.datetime64(t1, 'ns')
+    i0 = np.searchsorted(index['times'], t0, side='left')
+    i1 = np.searchsorted(index['times'], t1, side='right')
+    t1 = as_gtime(t1)
+    if i0 >= i1:
+        return []
+
+    epochs = []
+    with open(file_path, 'r', encoding='latin-1') as fp:
+        header = read_obs_header(fp)
+        fp.seek(int(index['offsets'][i0]))
+        for epoch in iter_obs_body(fp, header):
+            if epoch.time > t1:
+                break
+            epochs.append(epoch)
+    return epochs
+
+
+# Epochs with t0 <= time <= t1 decoded front to back, up to the first epoch
+# after t1 if the file is in time order, else through the whole file
+def stream_epochs(file_path, t0, t1, ordered=True):
+    t0, t1 = as_gtime(np.datetime64(t0, 'ns')), as_gtime(np.datetime64(t1, 'ns'))
+    header, epochs = open_obs_rinex(file_path)
+    selected = []
+    for epoch in epochs:
+        if epoch.time > t1:
+            if ordered:
+                break
+            continue
+        if epoch.time >= t0:
+            selected.append(epoch)
+    epochs.close()
+    return selected
+
+
+# Byte ranges [start, end) of about equal size covering the epochs of a plain
+# OBS file, every one starting at an epoch line of the epoch index
+def split_epoch_ranges(file_path, nrange):
+    index = load_epoch_index(file_path)
+    offsets, size = index['offsets'], int(index['size'])
+    if len(offsets) == 0:
+        return []
+    targets = np.linspace(offsets[0], size, nrange + 1)[1:-1]
+    cuts = offsets[np.minimum(np.searchsorted(offsets, targets), len(offsets) - 1)]
+    bounds = np.unique(np.concatenate([offsets[:1], cuts, [size]]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+# Epoch rows of the byte range [start, end) of an OBS file, decoded with the
+# header read once by the caller (run in the worker processes)
+def read_obs_range(file_path, header, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    fp = io.StringIO(data.decode('latin-1'), newline=None)
+    return epoch_rows(header, iter_obs_body(fp, header))
+
+
+# read_obs_table of one large file split at epoch lines into nrange byte ranges
+# (default: one per worker) that are parsed in worker processes and joined in
+# file order. Compressed and compact RINEX files are read sequentially.
+def read_obs_table_parallel(file_path, workers=None, nrange=None):
+    if is_encoded(file_path):
+        return read_obs_table(file_path)
+    workers = workers or os.cpu_count() or 1
+    header, epochs = open_obs_rinex(file_path)
+    epochs.close()
+    ranges = split_epoch_ranges(file_path, nrange or workers)
+    if workers == 1 or len(ranges) <= 1:
+        parts = [read_obs_range(file_path, header, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            futures = [pool.submit(read_obs_range, file_path, header, start, end) for start, end in ranges]
+            parts = [future.result() for future in futures]
+    if not parts:
+        return obs_table(header, epoch_rows(header, []))
+    return obs_table(header, {name: np.concatenate([part[name] for part in parts]) for name in parts[0]})
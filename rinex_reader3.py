@@ -119,7 +119,8 @@ def main(input_path, header_output_path, body_output_path):
     print(f"Observations written to {body_output_path}")
 
 
-input_path = r"C:\RTKApp\data\navigation\07590920.05n"
-header_output_path = r"C:\RTKApp\output\output_header_07590920.txt"
-body_output_path = r"C:\RTKApp\output\output_body_07590920.txt"
-main(input_path, header_output_path, body_output_path)
+if __name__ == '__main__':
+    input_path = r"C:\RTKApp\data\navigation\07590920.05n"
+    header_output_path = r"C:\RTKApp\output\output_header_07590920.txt"
+    body_output_path = r"C:\RTKApp\output\output_body_07590920.txt"
+    main(input_path, header_output_path, body_output_path)
@@ -0,0 +1,149 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gtime import GPS_EPOCH
+from rinex_compress import is_encoded
+from rinex_obs import epoch_row_counts, iter_obs_body, load_epoch_index, open_obs_rinex, split_epoch_ranges
+from rinex6 import syscodes
+
+GPS_EPOCH_NS = GPS_EPOCH.astype(np.int64)  # GPS epoch in ns since 1970
+
+
+# Columns in shared memory blocks, one block per column. The creator owns the
+# blocks (close() unlinks them); other processes attach through the picklable
+# descriptor {name: (block name, dtype, shape)} and get views without a copy.
+class SharedColumns:
+    def __init__(self, descriptor, blocks):
+        self.descriptor = descriptor
+        self.blocks = blocks
+        self.owner = False
+        self.arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[name].buf)
+                       for name, (_, dtype, shape) in descriptor.items()}
+
+    # New blocks for {name: (dtype, row shape, fill value)} columns of nrows rows
+    @classmethod
+    def create(cls, columns, nrows):
+        descriptor, blocks = {}, {}
+        try:
+            for name, (dtype, shape, fill) in columns.items():
+                dtype = np.dtype(dtype)
+                shape = (nrows,) + shape
+                size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+                blocks[name] = shared_memory.SharedMemory(create=True, size=size)
+                descriptor[name] = (blocks[name].name, dtype.str, shape)
+        except Exception:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+            raise
+        shared = cls(descriptor, blocks)
+        shared.owner = True
+        for name, (_, _, fill) in columns.items():
+            shared.arrays[name][...] = fill
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        return cls(descriptor, {name: shared_memory.SharedMemory(name=block)
+                                for name, (block, _, _) in descriptor.items()})
+
+    # Views must not be used after close()
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Decode the epochs of the byte range [start, end) of an OBS file straight into
+# rows row0.. of the shared columns (run in the worker processes); returns the
+# number of rows written
+def read_obs_range_shared(file_path, header, start, end, descriptor, row0, nrows):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    fp = io.StringIO(data.decode('latin-1'), newline=None)
+    shared = SharedColumns.attach(descriptor)
+    try:
+        cols = shared.arrays
+        ntobs = cols['obs'].shape[1]
+        row = row0
+        for epoch in iter_obs_body(fp, header):
+            n = len(epoch.sats)
+            if row + n > row0 + nrows:
+                raise ValueError(f"more satellite rows than the epoch lines give at byte {start}")
+            k = min(epoch.obs.shape[1], ntobs)
+            cols['time'][row:row + n] = epoch.time
+            cols['sat'][row:row + n] = epoch.sats
+            cols['obs'][row:row + n, :k] = epoch.obs[:, :k]
+            cols['lli'][row:row + n, :k] = epoch.lli[:, :k]
+            cols['ssi'][row:row + n, :k] = epoch.ssi[:, :k]
+            row += n
+        return row - row0
+    finally:
+        shared.close()
+
+
+# OBS table of read_obs_table_parallel with the columns in shared memory: the
+# satellite rows of every byte range are counted from its epoch lines, the
+# workers write their rows in place and return only their row count, so the
+# table arrives in the parent without pickling or a second copy. Ranges with
+# fewer rows than counted (invalid satellites) are compacted with one copy.
+# Returns (table, shared columns); close() the shared columns when done.
+def read_obs_table_shared(file_path, workers=None, nrange=None):
+    if is_encoded(file_path):
+        raise ValueError("shared memory reading needs a plain RINEX file")
+    workers = workers or os.cpu_count() or 1
+    header, epochs = open_obs_rinex(file_path)
+    epochs.close()
+    ntobs = max([len(header.obs_types(sys)) for sys in syscodes] + [1])
+
+    offsets = load_epoch_index(file_path)['offsets']
+    rows = epoch_row_counts(file_path, offsets)
+    ranges = split_epoch_ranges(file_path, nrange or workers)
+    first = np.searchsorted(offsets, [start for start, _ in ranges])
+    row0 = np.concatenate([[0], np.cumsum(rows)])[first]
+    nrows = np.diff(np.append(row0, rows.sum()))
+
+    shared = SharedColumns.create({
+        'time': (np.int64, (), 0),
+        'sat': ('U3', (), ''),
+        'obs': (np.float64, (ntobs,), np.nan),
+        'lli': (np.uint8, (ntobs,), 0),
+        'ssi': (np.uint8, (ntobs,), 0),
+    }, int(rows.sum()))
+    try:
+        tasks = [(file_path, header, start, end, shared.descriptor, int(r0), int(n))
+                 for (start, end), r0, n in zip(ranges, row0, nrows)]
+        if workers == 1 or len(tasks) <= 1:
+            written = [read_obs_range_shared(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = [pool.submit(read_obs_range_shared, *task) for task in tasks]
+                written = [future.result() for future in futures]
+    except Exception:
+        shared.close()
+        raise
+
+    table = dict(shared.arrays)
+    if np.any(np.array(written) != nrows):
+        keep = np.concatenate([np.arange(r0, r0 + n) for r0, n in zip(row0, written)]).astype(np.int64)
+        table = {name: values[keep] for name, values in table.items()}
+    table['time'] += GPS_EPOCH_NS  # gtime -> datetime64, in place
+    table['time'] = table['time'].view('M8[ns]')
+    table['ver'] = np.float64(header.ver)
+    for sys in syscodes:
+        table['types_' + sys] = np.array(header.obs_types(sys), dtype='U3')
+    return table, shared
@@ -0,0 +1,177 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from rinex_obs import iter_obs_body, read_obs_header
+
+POLL_INTERVAL = 0.02  # Seconds between stat() polls of the watched files
+
+# inotify event masks (sys/inotify.h)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+IN_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (+ name)
+
+
+class IncompleteEpoch(Exception):
+    pass
+
+
+# Complete lines appended to a file as a readline() source for the RINEX
+# decoders. Running out of lines raises IncompleteEpoch, as the epoch (or header)
+# being read is still being written; nbytes is the size of the lines read so far.
+class AppendedLines:
+    def __init__(self, data):
+        self.lines = data.decode('latin-1').split('\n')[:-1]
+        self.pos = 0
+        self.nbytes = 0
+
+    def readline(self):
+        if self.pos == len(self.lines):
+            raise IncompleteEpoch
+        line = self.lines[self.pos]
+        self.pos += 1
+        self.nbytes += len(line) + 1
+        return line + '\n'
+
+
+# RINEX control (rinex.c rnxctr_t) of a growing OBS file: header state and byte
+# offset after the last complete epoch, so that every poll decodes only the
+# epochs appended since. A file replaced or cut short (new inode, smaller size)
+# is read again from its header.
+class RnxCtr:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.subscribers = []
+        self.reset()
+
+    def reset(self):
+        self.header = None
+        self.offset = 0  # byte offset of the next epoch
+        self.file_id = None  # (st_dev, st_ino)
+        self.time = None  # time of the last epoch (gtime)
+
+    # callback(rnxctr, epoch) is called for every new epoch
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    # Decode the epochs appended since the last poll and hand them to the
+    # subscribers; returns the new epochs ([] if none, or no file yet)
+    def poll(self):
+        try:
+            file = open(self.file_path, 'rb')
+        except FileNotFoundError:
+            return []
+        with file:
+            st = os.fstat(file.fileno())
+            if (st.st_dev, st.st_ino) != self.file_id or st.st_size < self.offset:
+                self.reset()
+                self.file_id = (st.st_dev, st.st_ino)
+            if st.st_size == self.offset:
+                return []
+            file.seek(self.offset)
+            data = file.read()
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return []
+
+        lines = AppendedLines(data)
+        if self.header is None:
+            try:
+                self.header = read_obs_header(lines)
+            except IncompleteEpoch:
+                return []
+
+        epochs, done = [], lines.nbytes
+        try:
+            for epoch in iter_obs_body(lines, self.header):
+                epochs.append(epoch)
+                done = lines.nbytes
+        except IncompleteEpoch:
+            pass
+        self.offset += done
+        return self.emit(epochs)
+
+    def emit(self, epochs):
+        for epoch in epochs:
+            self.time = epoch.time
+            for callback in self.subscribers:
+                callback(self, epoch)
+        return epochs
+
+
+# Poll the files every interval seconds (stat() only while nothing changes)
+# until stop() returns True; works on any file system
+def watch_poll(ctrs, interval=POLL_INTERVAL, stop=lambda: False):
+    sizes = {}
+    while not stop():
+        for ctr in ctrs:
+            try:
+                st = os.stat(ctr.file_path)
+            except FileNotFoundError:
+                continue
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+            if sizes.get(ctr.file_path) != key:
+                sizes[ctr.file_path] = key
+                ctr.poll()
+        time.sleep(interval)
+
+
+# inotify_init1/inotify_add_watch of libc, None where not available (non Linux)
+def load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc if hasattr(libc, 'inotify_init1') else None
+    except OSError:
+        return None
+
+
+# Poll the files when the kernel reports a write to them (inotify on their
+# directories, so that files created or moved in later are seen as well);
+# falls back to watch_poll where inotify is not available. stop() is checked
+# at least every interval seconds.
+def watch_inotify(ctrs, interval=0.5, stop=lambda: False):
+    libc = load_inotify()
+    if libc is None:
+        return watch_poll(ctrs, POLL_INTERVAL, stop)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        return watch_poll(ctrs, POLL_INTERVAL, stop)
+    try:
+        dirs, by_name = {}, {}
+        for ctr in ctrs:
+            path = os.path.abspath(ctr.file_path)
+            dir_name = os.path.dirname(path)
+            if dir_name not in dirs:
+                wd = libc.inotify_add_watch(fd, dir_name.encode(), IN_WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), dir_name)
+                dirs[dir_name] = wd
+            by_name.setdefault((dirs[dir_name], os.path.basename(path)), []).append(ctr)
+            ctr.poll()
+
+        while not stop():
+            if not select.select([fd], [], [], interval)[0]:
+                continue
+            buf = os.read(fd, 65536)
+            changed = []
+            pos = 0
+            while pos < len(buf):
+                wd, mask, cookie, size = IN_EVENT.unpack_from(buf, pos)
+                name = buf[pos + IN_EVENT.size:pos + IN_EVENT.size + size].rstrip(b'\0').decode()
+                pos += IN_EVENT.size + size
+                for ctr in by_name.get((wd, name), []):
+                    if ctr not in changed:
+                        changed.append(ctr)
+            for ctr in changed:
+                ctr.poll()
+    finally:
+        os.close(fd)
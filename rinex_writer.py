@@ -0,0 +1,299 @@
+import numpy as np
+
+from gtime import NS, as_gtime, gtime2epoch
+from rinex6 import (CONVCODE_TABLE, SYS_CMP, SYS_GAL, SYS_GLO, SYS_GPS, SYS_NONE, SYS_QZS,
+                    SYS_SBS, TSYS_CMP, TSYS_GAL, TSYS_GPS, TSYS_QZS, TSYS_UTC, MAXOBS,
+                    syscodes, sysflags, timestr_rnx)
+from rinex_header import format_header_line
+
+PGM = 'rinex_writer'
+FIELD_LEN = 16  # F14.3 value, LLI, signal strength
+MAX_VALUE = 1e9  # Values out of (-1e9, 1e9) are written blank (rinex.c outrnxobsf)
+BLOCK_ROWS = 1 << 13  # Rows formatted and written per block (whole epochs)
+
+SYS_CHARS = {SYS_GPS: 'G', SYS_GLO: 'R', SYS_GAL: 'E', SYS_SBS: 'S', SYS_QZS: 'J',
+             SYS_CMP: 'C', SYS_NONE: 'M'}
+TSYS_NAMES = {TSYS_GPS: 'GPS', TSYS_UTC: 'GLO', TSYS_GAL: 'GAL', TSYS_QZS: 'QZS', TSYS_CMP: 'BDT'}
+
+EPOCH_LEN_V2 = 32  # " yy mm dd hh mm ss.sssssss  f nnn", satellites follow
+EPOCH_LEN_V3 = 35  # "> yyyy mm dd hh mm ss.sssssss  f nnn"
+SATS_PER_LINE_V2 = 12
+FIELDS_PER_LINE_V2 = 5
+LINE_LEN_V2 = FIELDS_PER_LINE_V2 * FIELD_LEN
+
+_POW10 = 10 ** np.arange(10, dtype=np.int64)
+
+
+# Lookup tables of the two 8 byte words of an obs field. Every entry holds its
+# characters at their place in the word and zero bytes elsewhere, so that a
+# field is put together by OR-ing one entry of each table.
+def _word_table(strings, start):
+    table = np.zeros((len(strings), 8), dtype=np.uint8)
+    for i, text in enumerate(strings):
+        table[i, start:start + len(text)] = np.frombuffer(text.encode(), dtype=np.uint8)
+    return table.view(np.uint64)[:, 0]
+
+
+# 0-999 zero padded, 1000-1999 blank padded, 2000 all blank
+_GROUPS = [f"{n:03d}" for n in range(1000)] + [f"{n:3d}" for n in range(1000)] + ['   ']
+BLANK_GROUP = 2000
+WORD0_TOP = _word_table([' ' + text for text in _GROUPS], 0)  # bytes 0-3
+WORD0_MID = _word_table(_GROUPS, 4)  # bytes 4-6
+WORD0_LOW = _word_table([text[0] for text in _GROUPS], 7)  # byte 7
+WORD1_LOW = _word_table([text[1:] for text in _GROUPS], 0)  # bytes 8-9
+WORD1_FRAC = _word_table([f".{n:03d}" for n in range(1000)], 2)  # bytes 10-13
+WORD1_LLI = _word_table([' '] + [str(n % 10) for n in range(1, 256)], 6)  # byte 14
+WORD1_SSI = _word_table([' '] + [str(n % 10) for n in range(1, 256)], 7)  # byte 15
+WORD0_BLANK = _word_table([' ' * 8], 0)[0]
+WORD1_BLANK = _word_table([' ' * 6], 0)[0]
+
+
+# Observation fields (n, m) -> (n, m, 16) characters: F14.3 value (blank for
+# nan/out of range and for 0 if blank_zero), LLI and signal strength digits
+# (blank for 0).
+# The value is split into groups of three digits that are looked up in the
+# WORD tables, so every field takes a handful of integer gathers.
+def format_obs_fields(obs, lli, ssi, blank_zero=True):
+    a = np.abs(obs)
+    blank = ~(a < MAX_VALUE)
+    if blank_zero:
+        blank |= a == 0.0
+    value = np.rint(np.where(blank, 0.0, a) * 1000.0).astype(np.int64)
+    ip = value // 1000
+    fr = value - ip * 1000
+    ip = ip.astype(np.int32)
+    high = ip // 1000
+    low = ip - high * 1000
+    top = high // 1000
+    mid = high - top * 1000
+
+    top_i = np.where(top > 0, top + 1000, BLANK_GROUP)
+    mid_i = np.where(top > 0, mid, np.where(mid > 0, mid + 1000, BLANK_GROUP))
+    low_i = np.where(high > 0, low, low + 1000)
+    word0 = WORD0_TOP[top_i]
+    word0 |= WORD0_MID[mid_i]
+    word0 |= WORD0_LOW[low_i]
+    word1 = WORD1_LOW[low_i]
+    word1 |= WORD1_FRAC[fr]
+    words = np.empty(obs.shape + (2,), dtype=np.uint64)
+    words[..., 0] = np.where(blank, WORD0_BLANK, word0)
+    words[..., 1] = np.where(blank, WORD1_BLANK, word1) | WORD1_LLI[lli] | WORD1_SSI[ssi]
+    chars = words.view(np.uint8)
+
+    r, c = np.nonzero((obs < 0.0) & ~blank)
+    if len(r):
+        ndig = np.maximum(np.searchsorted(_POW10, ip[r, c], side='right'), 1)
+        chars[r, c, 9 - ndig] = ord('-')
+    return chars
+
+
+# Character lines (n, width) -> bytes with trailing blanks removed and '\n' after
+# every line
+def lines_to_bytes(chars):
+    n, width = chars.shape
+    nonblank = chars != ord(' ')
+    length = np.where(nonblank.any(axis=1), width - np.argmax(nonblank[:, ::-1], axis=1), 0)
+    out = np.concatenate([chars, np.full((n, 1), ord(' '), dtype=np.uint8)], axis=1)
+    out[np.arange(n), length] = ord('\n')
+    return out[np.arange(width + 1) <= length[:, None]].tobytes()
+
+
+# Non-negative integers (n,) -> (n, width) right aligned digits, blank or zero padded
+def int_chars(values, width, zero_pad=False):
+    values = np.asarray(values, dtype=np.int64)[:, None]
+    scale = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    chars = (values // scale % 10 + ord('0')).astype(np.uint8)
+    if not zero_pad:
+        chars[(values < scale) & (scale > 1)] = ord(' ')
+    return chars
+
+
+def const_chars(n, text):
+    return np.broadcast_to(np.frombuffer(text.encode(), dtype=np.uint8), (n, len(text)))
+
+
+# Epoch line start (n, EPOCH_LEN_V2/V3) of times t (gtime) with nsat satellites,
+# epoch flag 0 ("{:02d} {:2d} {:2d} {:2d} {:2d}{:11.7f}  0{:3d}")
+def epoch_chars(t, nsat, ver):
+    n = len(t)
+    ep = gtime2epoch(t).astype(np.int64)
+    sec = (t % (60 * NS) + 50) // 100  # 1e-7 s
+    if ver <= 2.99:
+        year = [const_chars(n, ' '), int_chars(ep[:, 0] % 100, 2, zero_pad=True)]
+    else:
+        year = [const_chars(n, '> '), int_chars(ep[:, 0], 4, zero_pad=True)]
+    parts = year
+    for k in range(1, 5):
+        parts += [const_chars(n, ' '), int_chars(ep[:, k], 2)]
+    parts += [int_chars(sec // 10 ** 7, 3), const_chars(n, '.'), int_chars(sec % 10 ** 7, 7, zero_pad=True),
+              const_chars(n, '  0'), int_chars(nsat, 3)]
+    return np.concatenate(parts, axis=1)
+
+
+# ver.2 obs codes of the header columns, recovered from the ver.3 codes set by
+# convcode for each system
+def obs_types_v2(header):
+    v212 = header.ver >= 2.12
+    reverse = {}
+    for (ver_bucket, sys, code2), code3 in CONVCODE_TABLE.items():
+        if ver_bucket == v212:
+            reverse.setdefault((sys, code3), code2)
+    n = len(header.obs_types('G'))
+    types = []
+    for j in range(n):
+        code = '  '
+        for i, sys in enumerate(sysflags):
+            code3 = header.tobs[i][j]
+            if code3.strip() and (sys, code3) in reverse:
+                code = reverse[(sys, code3)]
+                break
+        types.append(code)
+    return types
+
+
+# RINEX observation writer (rinex.c outrnxobsh/outrnxobsb) in the version of the
+# header (ObsHeader). Epochs are formatted as whole blocks: all obs fields of a
+# block are converted to characters in one array operation and written with a
+# single write call.
+class ObsWriter:
+    def __init__(self, fp, header):
+        self.fp = fp
+        self.header = header
+        self.ver = header.ver
+        if self.ver <= 2.99:
+            self.types = {sys: obs_types_v2(header) for sys in syscodes}
+        else:
+            self.types = {sys: header.obs_types(sys) for sys in syscodes}
+
+    def write_header(self, t_first, t_last=None, interval=None, comments=()):
+        header = self.header
+        sta = header.sta
+        tsys = TSYS_NAMES.get(header.tsys, 'GPS')
+        lines = [format_header_line('RINEX VERSION / TYPE',
+                                    (self.ver, '', 'O', '', SYS_CHARS.get(header.sys, 'M'), '')),
+                 format_header_line('PGM / RUN BY / DATE', (PGM, '', timestr_rnx()))]
+        lines += [format_header_line('COMMENT', (comment,)) for comment in comments]
+        lines += [format_header_line('MARKER NAME', (sta.name,)),
+                  format_header_line('MARKER NUMBER', (sta.marker,)),
+                  format_header_line('OBSERVER / AGENCY', ('', '')),
+                  format_header_line('REC # / TYPE / VERS', (sta.recsno, sta.rectype, sta.recver)),
+                  format_header_line('ANT # / TYPE', (sta.antsno, sta.antdes)),
+                  format_header_line('APPROX POSITION XYZ', tuple(sta.pos)),
+                  format_header_line('ANTENNA: DELTA H/E/N', (sta.del_[2], sta.del_[0], sta.del_[1]))]
+        if self.ver <= 2.99:
+            lines.append(f"{1:6d}{1:6d}{'':48s}WAVELENGTH FACT L1/2\n")
+            lines += self.obs_type_lines_v2()
+        else:
+            lines += self.obs_type_lines_v3()
+        if interval:
+            lines.append(format_header_line('INTERVAL', (interval,)))
+        for label, t in (('TIME OF FIRST OBS', t_first), ('TIME OF LAST OBS', t_last)):
+            if t is not None:
+                ep = gtime2epoch(as_gtime(t)).tolist()
+                lines.append(format_header_line(label, tuple(int(x) for x in ep[:5]) + (ep[5], tsys)))
+        lines.append(f"{'':60s}END OF HEADER\n")
+        self.fp.write(''.join(lines).encode('latin-1', 'replace'))
+
+    def obs_type_lines_v2(self):
+        types = self.types['G']
+        lines = []
+        for i in range(0, max(len(types), 1), 9):
+            head = f"{len(types):6d}" if i == 0 else ' ' * 6
+            body = ''.join([f"{code:>6s}" for code in types[i:i + 9]])
+            lines.append(f"{head + body:<60s}# / TYPES OF OBSERV\n")
+        return lines
+
+    def obs_type_lines_v3(self):
+        lines = []
+        for sys in syscodes:
+            types = self.types[sys]
+            for i in range(0, len(types), 13):
+                head = f"{sys}  {len(types):3d}" if i == 0 else ' ' * 6
+                body = ''.join([f" {code:3s}" for code in types[i:i + 13]])
+                lines.append(f"{head + body:<60s}SYS / # / OBS TYPES\n")
+        return lines
+
+    # Write epochs given as rows (epoch, satellite) grouped by time: time
+    # (gtime or datetime64), sat and obs/lli/ssi in the header column order.
+    # Satellites after the first MAXOBS of an epoch are dropped (rinex.c).
+    def write_rows(self, time, sat, obs, lli, ssi):
+        time = as_gtime(time)
+        starts = np.flatnonzero(np.concatenate([[True], time[1:] != time[:-1]]))
+        index = np.arange(len(time)) - np.repeat(starts, np.diff(np.append(starts, len(time))))
+        if (index >= MAXOBS).any():
+            keep = index < MAXOBS
+            time, sat, obs, lli, ssi = time[keep], sat[keep], obs[keep], lli[keep], ssi[keep]
+            starts = np.flatnonzero(np.concatenate([[True], time[1:] != time[:-1]]))
+        bounds = np.append(starts, len(time))
+        i = 0
+        while i < len(starts):
+            # whole epochs up to BLOCK_ROWS rows
+            j = max(np.searchsorted(bounds, bounds[i] + BLOCK_ROWS, side='right') - 1, i + 1)
+            j = min(j, len(starts))
+            a, b = bounds[i], bounds[j]
+            self.write_block(time[a:b], sat[a:b], obs[a:b], lli[a:b], ssi[a:b], bounds[i:j + 1] - a)
+            i = j
+
+    # Epoch lines and observation lines of a block are scattered into a single
+    # character matrix, which is stripped and written at once
+    def write_block(self, time, sat, obs, lli, ssi, bounds):
+        fields = format_obs_fields(obs, lli, ssi)
+        n, m = obs.shape
+        nsat = np.diff(bounds)
+        ne = len(nsat)
+        epoch = np.repeat(np.arange(ne), nsat)
+        index = np.arange(n) - bounds[epoch]
+        ids = np.ascontiguousarray(sat, dtype='U3').view(np.uint32).reshape(n, 3).astype(np.uint8)
+        head = epoch_chars(time[bounds[:-1]], nsat, self.ver)
+
+        if self.ver <= 2.99:
+            # epoch line with up to 12 satellites per line, then every satellite
+            # on nline lines of 5 fields
+            nline = max((m + FIELDS_PER_LINE_V2 - 1) // FIELDS_PER_LINE_V2, 1)
+            nhead = (nsat + SATS_PER_LINE_V2 - 1) // SATS_PER_LINE_V2
+            start = np.concatenate([[0], np.cumsum(nhead + nsat * nline)])
+            lines = np.full((start[-1], LINE_LEN_V2), ord(' '), dtype=np.uint8)
+            lines[start[:-1], :EPOCH_LEN_V2] = head
+            row = (start[epoch] + index // SATS_PER_LINE_V2)[:, None]
+            col = (EPOCH_LEN_V2 + 3 * (index % SATS_PER_LINE_V2))[:, None] + np.arange(3)
+            lines[row, col] = ids
+            row = (start[epoch] + nhead[epoch] + index * nline)[:, None] + np.arange(nline)
+            lines[row.reshape(-1), :] = np.concatenate(
+                [fields, np.full((n, nline * FIELDS_PER_LINE_V2 - m, FIELD_LEN), ord(' '), dtype=np.uint8)],
+                axis=1).reshape(n * nline, LINE_LEN_V2)
+        else:
+            # fields beyond the obs types of the satellite system are left blank
+            body = fields.reshape(n, m * FIELD_LEN)
+            width = np.zeros(n, dtype=np.int64)
+            for sys in syscodes:
+                width[ids[:, 0] == ord(sys)] = len(self.types[sys]) * FIELD_LEN
+            if (width < m * FIELD_LEN).any():
+                body[np.arange(m * FIELD_LEN) >= width[:, None]] = ord(' ')
+            lines = np.full((ne + n, max(3 + m * FIELD_LEN, EPOCH_LEN_V3)), ord(' '), dtype=np.uint8)
+            lines[bounds[:-1] + np.arange(ne), :EPOCH_LEN_V3] = head
+            row = np.arange(n) + epoch + 1
+            lines[row, :3] = ids
+            lines[row, 3:3 + m * FIELD_LEN] = body
+        self.fp.write(lines_to_bytes(lines))
+
+    def write_epoch(self, epoch):
+        n = len(epoch.sats)
+        self.write_rows(np.full(n, epoch.time, dtype=np.int64), epoch.sats, epoch.obs, epoch.lli, epoch.ssi)
+
+
+# Rows of an obs table (rinex_obs.read_obs_table) on a time grid of `interval` seconds
+def decimate_table(table, interval):
+    t = as_gtime(table['time'])
+    keep = t % int(round(interval * 1e9)) == 0
+    return {key: value[keep] if key in ('time', 'sat', 'obs', 'lli', 'ssi') else value
+            for key, value in table.items()}
+
+
+# Write an obs table (rinex_obs.read_obs_table) with the header it was read with
+def write_obs_table(file_path, header, table, interval=None, comments=()):
+    time = table['time']
+    with open(file_path, 'wb') as fp:
+        writer = ObsWriter(fp, header)
+        writer.write_header(time[0] if len(time) else None, time[-1] if len(time) else None,
+                            interval, comments)
+        writer.write_rows(time, table['sat'], table['obs'], table['lli'], table['ssi'])
@@ -0,0 +1,458 @@
+import math
+
+import numpy as np
+
+from gtime import NS, datetime2gtime, gtime2datetime64
+from satpos import CLIGHT, BroadcastOrbits, as_gps_seconds
+from geometry import azel, ecef2pos, enu_matrix
+from spp import EL_MASK, OMGE, solve_spp
+
+FREQ_L1 = 1.57542e9  # GPS L1, QZSS L1, Galileo E1 (Hz)
+FREQ_B1I = 1.561098e9  # BeiDou B1I (Hz)
+WAVELENGTHS = {'G': CLIGHT / FREQ_L1, 'J': CLIGHT / FREQ_L1, 'E': CLIGHT / FREQ_L1, 'C': CLIGHT / FREQ_B1I}
+
+# Code/phase signal pairs of each system, in order of preference; the first
+# pair present in both files is used for all satellites of the system, so
+# every single difference is between the same signal (GLONASS FDMA excluded)
+RTK_SIGNALS = {
+    'G': [('C1C', 'L1C'), ('C1W', 'L1W'), ('C1X', 'L1X')],
+    'J': [('C1C', 'L1C'), ('C1X', 'L1X')],
+    'E': [('C1C', 'L1C'), ('C1X', 'L1X')],
+    'C': [('C2I', 'L2I'), ('C1I', 'L1I')],
+}
+
+# Processing options (rtkpos.c prcopt_default)
+ERR_PHASE = 0.003  # Phase error terms a, b of a + b / sin(el) (m)
+ERR_RATIO = 100.0  # Code/phase error ratio
+MAX_AGE = 30.0  # Max age of the base observations (s)
+MAX_OUT = 5  # Outage epochs after which an ambiguity is reset
+VAR_POS = 30.0 ** 2  # Initial variance of the rover position (m^2)
+VAR_BIAS = 30.0 ** 2  # Initial variance of a single difference ambiguity (cycle^2)
+PRN_BIAS = 1e-4  # Process noise of the ambiguities (cycle/sqrt(s))
+THRES_AR = 3.0  # Ratio test threshold of the integer ambiguity validation
+MIN_FIX = 4  # Min double difference ambiguities to try a fix
+LAMBDA_CAND = 2  # Integer candidates of the LAMBDA search
+LOOPMAX = 10000  # Max iterations of the LAMBDA search
+
+# Solution status (rtklib.h SOLQ_*)
+SOLQ_NONE = 0
+SOLQ_FIX = 1
+SOLQ_FLOAT = 2
+
+
+# LD factorization Q = L' D L (lambda.c LD). The LAMBDA steps work on
+# Python lists: the matrices are small and every step touches a few
+# elements, where NumPy call overhead would dominate.
+def ld(Q):
+    n = len(Q)
+    A = Q.tolist()
+    L = [[0.0] * n for _ in range(n)]
+    D = [0.0] * n
+    for i in range(n - 1, -1, -1):
+        D[i] = A[i][i]
+        if D[i] <= 0.0:
+            raise np.linalg.LinAlgError("LD factorization error")
+        a = math.sqrt(D[i])
+        Li, Ai = L[i], A[i]
+        for j in range(i + 1):
+            Li[j] = Ai[j] / a
+        for j in range(i):
+            Aj, lij = A[j], Li[j]
+            for k in range(j + 1):
+                Aj[k] -= Li[k] * lij
+        lii = Li[i]
+        for j in range(i + 1):
+            Li[j] /= lii
+    return L, D
+
+
+# Integer gauss transformation (lambda.c gauss)
+def gauss(L, Z, i, j):
+    mu = math.floor(L[i][j] + 0.5)
+    if mu != 0.0:
+        for k in range(i, len(L)):
+            L[k][j] -= mu * L[k][i]
+        for row in Z:
+            row[j] -= mu * row[i]
+
+
+# Permutation (lambda.c perm)
+def perm(L, D, j, delta, Z):
+    eta = D[j] / delta
+    lam = D[j + 1] * L[j + 1][j] / delta
+    D[j] = eta * D[j + 1]
+    D[j + 1] = delta
+    Lj, Lj1 = L[j], L[j + 1]
+    for k in range(j):
+        a0, a1 = Lj[k], Lj1[k]
+        Lj[k] = -Lj1[j] * a0 + a1
+        Lj1[k] = eta * a0 + lam * a1
+    Lj1[j] = lam
+    for row in L[j + 2:]:
+        row[j], row[j + 1] = row[j + 1], row[j]
+    for row in Z:
+        row[j], row[j + 1] = row[j + 1], row[j]
+
+
+# LAMBDA reduction z = Z' a, Qz = Z' Q Z = L' D L (lambda.c reduction)
+def reduction(L, D, Z):
+    n = len(D)
+    j = k = n - 2
+    while j >= 0:
+        if j <= k:
+            for i in range(j + 1, n):
+                gauss(L, Z, i, j)
+        delta = D[j] + L[j + 1][j] ** 2 * D[j + 1]
+        if delta + 1e-6 < D[j + 1]:  # compared considering numerical error
+            perm(L, D, j, delta, Z)
+            k, j = j, n - 2
+        else:
+            j -= 1
+
+
+# Modified LAMBDA search of the m best integer vectors (lambda.c search);
+# returns (n, m) candidates and their squared residual norms, sorted
+def search(L, D, zs, m):
+    n = len(D)
+    zs = zs.tolist()
+    S = [[0.0] * n for _ in range(n)]
+    dist, zb, z, step = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+    zn, s = [], []
+    maxdist, imax = 1e99, 0
+
+    k = n - 1
+    zb[k] = zs[k]
+    z[k] = math.floor(zb[k] + 0.5)
+    y = zb[k] - z[k]
+    step[k] = -1.0 if y <= 0.0 else 1.0
+    for _ in range(LOOPMAX):
+        newdist = dist[k] + y * y / D[k]
+        if newdist < maxdist:
+            if k != 0:
+                k -= 1
+                dist[k] = newdist
+                dz = z[k + 1] - zb[k + 1]
+                Sk, Sk1, Lk1 = S[k], S[k + 1], L[k + 1]
+                for i in range(k + 1):
+                    Sk[i] = Sk1[i] + dz * Lk1[i]
+                zb[k] = zs[k] + Sk[k]
+                z[k] = math.floor(zb[k] + 0.5)
+                y = zb[k] - z[k]
+                step[k] = -1.0 if y <= 0.0 else 1.0
+            else:
+                if len(s) < m:
+                    if not s or newdist > s[imax]:
+                        imax = len(s)
+                    zn.append(z[:])
+                    s.append(newdist)
+                else:
+                    if newdist < s[imax]:
+                        zn[imax] = z[:]
+                        s[imax] = newdist
+                        imax = int(np.argmax(s))
+                    maxdist = s[imax]
+                z[0] += step[0]
+                y = zb[0] - z[0]
+                step[0] = -step[0] - (-1.0 if step[0] <= 0.0 else 1.0)
+        else:
+            if k == n - 1:
+                break
+            k += 1
+            z[k] += step[k]
+            y = zb[k] - z[k]
+            step[k] = -step[k] - (-1.0 if step[k] <= 0.0 else 1.0)
+    else:
+        raise RuntimeError("LAMBDA search loop count overflow")
+    order = np.argsort(s, kind='stable')
+    return np.array(zn).T[:, order], np.array(s)[order]
+
+
+# Integer least-squares estimation of float ambiguities a with covariance Q
+# (lambda.c lambda): returns the m best integer vectors (n, m) and the squared
+# residual norm of each
+def lambda_search(a, Q, m=LAMBDA_CAND):
+    L, D = ld(Q)
+    Z = np.eye(len(a)).tolist()
+    reduction(L, D, Z)
+    Z = np.array(Z)
+    E, s = search(L, D, Z.T @ a, m)
+    return np.linalg.solve(Z.T, E), s
+
+
+# Code/phase pair of each system present in the obs types of all tables
+def select_signals(*tables):
+    signals = {}
+    for sys, pairs in RTK_SIGNALS.items():
+        for pair in pairs:
+            if all(obs_type in table['types_' + sys] for table in tables for obs_type in pair):
+                signals[sys] = pair
+                break
+    return signals
+
+
+# Code (m), phase (cycles), phase LLI and wavelength of every row of an obs
+# table for the signal of its system, nan where missing
+def rtk_observations(table, signals):
+    sys = table['sat'].astype('U1')
+    P = np.full(len(sys), np.nan)
+    L = np.full(len(sys), np.nan)
+    lli = np.zeros(len(sys), dtype=np.uint8)
+    lam = np.full(len(sys), np.nan)
+    for code, (code_type, phase_type) in signals.items():
+        rows = sys == code
+        types = list(table['types_' + code])
+        P[rows] = table['obs'][rows, types.index(code_type)]
+        L[rows] = table['obs'][rows, types.index(phase_type)]
+        lli[rows] = table['lli'][rows, types.index(phase_type)]
+        lam[rows] = WAVELENGTHS[code]
+    P[~(P > 0.0)] = np.nan
+    L[L == 0.0] = np.nan
+    return P, L, lli, lam
+
+
+# Zero-difference code/phase residuals (m) of obs rows seen from receiver
+# positions rr (rows x 3): observation - (range + sagnac - satellite clock);
+# the receiver clock is left in and cancels in the double differences.
+# Returns yP, yL, line-of-sight unit vectors and elevations of every row.
+def zero_diff(time, sat, P, L, lam, rr, orbits):
+    good = ~np.isnan(P)
+    t_tx = as_gps_seconds(time) - np.where(good, P, 0.0) / CLIGHT
+    dts = orbits.clock_bias(sat, t_tx)
+    rs = orbits.positions(sat, t_tx - np.nan_to_num(dts))
+    d = rs - rr
+    r = np.linalg.norm(d, axis=-1)
+    los = d / r[:, None]
+    r += OMGE * (rs[:, 0] * rr[:, 1] - rs[:, 1] * rr[:, 0]) / CLIGHT
+    lat, lon, _ = ecef2pos(rr)
+    _, el = azel(los, enu_matrix(lat, lon))
+    model = r - CLIGHT * dts
+    return P - model, L * lam - model, los, el
+
+
+# Epoch positions with gaps (nan) filled from the previous, else the next
+# valid epoch
+def fill_positions(pos):
+    ok = ~np.isnan(pos[:, 0])
+    if not ok.any():
+        raise ValueError("no rover position to linearize around")
+    idx = np.maximum.accumulate(np.where(ok, np.arange(len(ok)), -1))
+    idx[idx < 0] = np.flatnonzero(ok)[0]
+    return pos[idx]
+
+
+# Double-difference inputs of all epochs as (epoch, satellite) grids: the base
+# and rover zero differences are scattered on the rover epochs and the
+# satellite columns, base epochs matched by time (latest not after the rover
+# epoch, at most max_age old), single differenced, and differenced again
+# against a reference satellite per epoch and system (highest elevation).
+# x0: rover positions to linearize around at times x0_time (gtime, sorted),
+# covering all rover epochs; returned 'time' holds the epochs of the grids
+def double_differences(rover, base, orbits, base_pos, x0, x0_time, el_mask=EL_MASK, max_age=MAX_AGE):
+    signals = select_signals(rover, base)
+    if not signals:
+        raise ValueError("no common code/phase signal in the rover and base files")
+    sats = np.unique(np.concatenate([rover['sat'], base['sat']]))
+    sats = sats[np.isin(sats.astype('U1'), list(signals))]
+
+    grids = {}
+    for name, table in (('rover', rover), ('base', base)):
+        keep = np.isin(table['sat'], sats)
+        time, sat = table['time'][keep], table['sat'][keep]
+        P, L, lli, lam = (values[keep] for values in rtk_observations(table, signals))
+        times, ep = np.unique(datetime2gtime(time), return_inverse=True)
+        col = np.searchsorted(sats, sat)
+        if name == 'rover':
+            rr = x0[np.searchsorted(x0_time, times)][ep]
+        else:
+            rr = np.broadcast_to(np.asarray(base_pos, dtype=np.float64), (len(sat), 3))
+        yP, yL, los, el = zero_diff(time, sat, P, L, lam, rr, orbits)
+        grid = {'time': times}
+        for key, values, fill in (('P', yP, np.nan), ('L', yL, np.nan), ('lli', lli, 0),
+                                  ('los', los, 0.0), ('el', el, np.nan)):
+            shape = (len(times), len(sats)) + np.shape(values)[1:]
+            grid[key] = np.full(shape, fill, dtype=np.asarray(values).dtype)
+            grid[key][ep, col] = values
+        grids[name] = grid
+    rov, bas = grids['rover'], grids['base']
+
+    ib = np.searchsorted(bas['time'], rov['time'], side='right') - 1
+    age = (rov['time'] - bas['time'][np.maximum(ib, 0)]) / NS
+    matched = (ib >= 0) & (age <= max_age)
+    ib = np.maximum(ib, 0)
+
+    # single differences rover - base
+    sdP = rov['P'] - bas['P'][ib]
+    sdL = rov['L'] - bas['L'][ib]
+    el = rov['el']
+    valid = matched[:, None] & ~np.isnan(sdP) & ~np.isnan(sdL) & (el >= el_mask)
+    slip = ((rov['lli'] | bas['lli'][ib]) & 1).astype(bool)
+
+    # reference satellite per epoch and system, as a column per satellite
+    sys = sats.astype('U1')
+    ref = np.full(valid.shape, -1)
+    for code in signals:
+        cols = np.flatnonzero(sys == code)
+        if len(cols) == 0:
+            continue
+        score = np.where(valid[:, cols], el[:, cols], -np.inf)
+        best = cols[np.argmax(score, axis=1)]
+        best[~np.isfinite(score.max(axis=1))] = -1
+        ref[:, cols] = best[:, None]
+    dd = valid & (ref >= 0) & (ref != np.arange(len(sats)))
+    r = np.maximum(ref, 0)
+    e = np.arange(len(ref))[:, None]
+
+    var = ERR_PHASE ** 2 + (ERR_PHASE / np.sin(np.where(valid, el, np.pi / 2))) ** 2
+    return {
+        'time': rov['time'],
+        'sats': sats,
+        'lam': np.array([WAVELENGTHS[code] for code in sys]),
+        'valid': valid,
+        'slip': slip,
+        'sdP': sdP,
+        'sdL': sdL,
+        'ref': ref,
+        'dd': dd,
+        'ddP': sdP - sdP[e, r],
+        'ddL': sdL - sdL[e, r],
+        'ddH': -(rov['los'] - rov['los'][e, r]),
+        'var': 2.0 * var,  # single difference phase variance (rover + base)
+        'age': age,
+    }
+
+
+# Double-difference RTK of a rover OBS table against a base OBS table with the
+# base at base_pos (ECEF): single-frequency code and phase of RTK_SIGNALS,
+# short baseline (atmosphere cancels). The differences of all epochs are
+# formed at once around the rover SPP positions (linearization error below
+# 1e-6 m); an extended Kalman filter then runs over the epochs on the rover
+# position and the single difference ambiguities (cycles) of the satellites in
+# view, updated on the double differences, with position reset to the SPP
+# solution every epoch (kinematic) or estimated once (static). With ar, the
+# double difference ambiguities are resolved by LAMBDA and validated by the
+# ratio test (continuous mode: the float state is not constrained by fixes).
+# Returns time, pos (fixed where fixed, else float), pos_float, status
+# (SOLQ_*), ratio, nsat and the number of double differences per epoch.
+def solve_rtk(rover, base, orbits, base_pos, mode='kinematic', ar=True, el_mask=EL_MASK, max_age=MAX_AGE):
+    spp = solve_spp(rover, orbits)
+    times = np.unique(datetime2gtime(rover['time']))
+    x0 = np.full((len(times), 3), np.nan)
+    idx = np.searchsorted(times, datetime2gtime(spp['time']))
+    x0[idx[spp['ok']]] = spp['pos'][spp['ok']]
+    x0 = fill_positions(x0)
+    dd = double_differences(rover, base, orbits, base_pos, x0, times, el_mask, max_age)
+    x0 = x0[np.searchsorted(times, dd['time'])]  # on the epochs of the differences
+
+    ne, ns = dd['valid'].shape
+    lam = dd['lam']
+    x = np.zeros(3 + ns)
+    P = np.zeros((3 + ns, 3 + ns))
+    last = np.full(ns, -MAX_OUT - 2)  # last epoch of each ambiguity
+    t_last = None
+    out = {
+        'time': gtime2datetime64(dd['time']),
+        'pos': np.full((ne, 3), np.nan),
+        'pos_float': np.full((ne, 3), np.nan),
+        'status': np.zeros(ne, dtype=np.int64),
+        'ratio': np.zeros(ne),
+        'nsat': np.zeros(ne, dtype=np.int64),
+        'ndd': np.zeros(ne, dtype=np.int64),
+    }
+    for e in range(ne):
+        t = dd['time'][e] / NS
+        dt = 0.0 if t_last is None else t - t_last
+        t_last = t
+
+        # position: reset to SPP (kinematic) or initialized once (static)
+        if mode == 'kinematic' or P[0, 0] == 0.0:
+            x[:3] = x0[e]
+            P[:3, :] = 0.0
+            P[:, :3] = 0.0
+            P[:3, :3] = np.eye(3) * VAR_POS
+
+        # ambiguities: reset after a slip or an outage, random walk otherwise
+        vis = np.flatnonzero(dd['valid'][e])
+        reset = vis[dd['slip'][e, vis] | (e - last[vis] > MAX_OUT)]
+        a = 3 + reset
+        P[a, :] = 0.0
+        P[:, a] = 0.0
+        P[a, a] = VAR_BIAS
+        x[a] = (dd['sdL'][e, reset] - dd['sdP'][e, reset]) / lam[reset]
+        keep = 3 + vis[np.isin(vis, reset, invert=True)]
+        P[keep, keep] += PRN_BIAS ** 2 * abs(dt)
+        last[vis] = e
+
+        js = np.flatnonzero(dd['dd'][e])
+        m = len(js)
+        out['ndd'][e] = m
+        out['nsat'][e] = len(vis)
+        if m < 3:
+            continue
+        refs = dd['ref'][e, js]
+        active = np.union1d(js, refs)
+        ix = np.concatenate([[0, 1, 2], 3 + active])
+        cj = 3 + np.searchsorted(active, js)
+        cr = 3 + np.searchsorted(active, refs)
+
+        # measurement model of the m phase and m code double differences
+        Hp = dd['ddH'][e, js]
+        H = np.zeros((2 * m, len(ix)))
+        H[:m, :3] = Hp
+        H[m:, :3] = Hp
+        rows = np.arange(m)
+        H[rows, cj] = lam[js]
+        H[rows, cr] = -lam[refs]
+        dx = x[:3] - x0[e]
+        v = np.concatenate([dd['ddL'][e, js] - Hp @ dx - lam[js] * x[3 + js] + lam[refs] * x[3 + refs],
+                            dd['ddP'][e, js] - Hp @ dx])
+        var_j, var_r = dd['var'][e, js], dd['var'][e, refs]
+        R = np.diag(var_j) + var_r[:, None] * (refs[:, None] == refs[None, :])
+        R = np.block([[R, np.zeros((m, m))], [np.zeros((m, m)), R * ERR_RATIO ** 2]])
+
+        # Kalman filter update on the active states
+        Pa = P[np.ix_(ix, ix)]
+        PHt = Pa @ H.T
+        K = np.linalg.solve(H @ PHt + R, PHt.T).T
+        x[ix] += K @ v
+        P[np.ix_(ix, ix)] = Pa - K @ PHt.T
+        out['pos_float'][e] = out['pos'][e] = x[:3]
+        out['status'][e] = SOLQ_FLOAT
+
+        # integer ambiguity resolution of the double differences
+        if ar and m >= MIN_FIX:
+            D = np.zeros((m, len(ix)))
+            D[rows, cj] = 1.0
+            D[rows, cr] = -1.0
+            Pa = P[np.ix_(ix, ix)]
+            b = D @ x[ix]
+            Qb = D @ Pa @ D.T
+            Qab = Pa[:3] @ D.T
+            try:
+                F, s = lambda_search(b, Qb)
+            except (np.linalg.LinAlgError, RuntimeError):
+                continue
+            ratio = min(s[1] / s[0], 999.9) if s[0] > 0.0 else 0.0
+            out['ratio'][e] = ratio
+            if ratio >= THRES_AR:
+                out['pos'][e] = x[:3] - Qab @ np.linalg.solve(Qb, b - F[:, 0])
+                out['status'][e] = SOLQ_FIX
+    return out
+
+
+# RTK of rover/base OBS files and a NAV file through the parsed table cache;
+# the base position defaults to the APPROX POSITION XYZ of the base header.
+# clean: slips and outliers of both files are marked first (slips.clean_table)
+def solve_rtk_files(rover_path, base_path, nav_path, base_pos=None, clean=True, **kwargs):
+    from rinex_cache import load_nav, load_obs
+    from rinex_obs import open_obs_rinex
+    from slips import clean_table
+    if base_pos is None:
+        header, epochs = open_obs_rinex(base_path)
+        epochs.close()
+        base_pos = np.array(header.sta.pos, dtype=np.float64)
+    if not np.any(base_pos):
+        raise ValueError("base position unknown")
+    rover, base = load_obs(rover_path), load_obs(base_path)
+    if clean:
+        rover, base = clean_table(rover), clean_table(base)
+    return solve_rtk(rover, base, BroadcastOrbits(load_nav(nav_path)), base_pos, **kwargs)
@@ -0,0 +1,336 @@
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+from gtime import NS, datetime2gtime, str2gtime
+from rinex_nav import read_nav_tables
+
+WEEK_SEC = 604800.0  # Seconds per week
+BDT_WEEK = 1356  # BDT week 0 in GPS weeks
+BDT_GPST = 14.0  # GPST - BDT (s)
+CLIGHT = 299792458.0  # Speed of light (m/s)
+
+# Keplerian systems: gravitational constant, earth rotation rate,
+# week field and max age of ephemeris (s)
+MU = {'G': 3.9860050e14, 'J': 3.9860050e14, 'E': 3.986004418e14, 'C': 3.986004418e14}
+OMGE = {'G': 7.2921151467e-5, 'J': 7.2921151467e-5, 'E': 7.2921151467e-5, 'C': 7.292115e-5}
+WEEK_FIELDS = {'G': 'GPS_week', 'J': 'GPS_week', 'E': 'GAL_week', 'C': 'BDT_week'}
+MAX_DTOE = {'G': 7200.0, 'J': 7200.0, 'E': 14400.0, 'C': 21600.0}
+# Group delay applied to single frequency ranges (GPS/QZS L1, GAL E1-E5a, BDS B1)
+TGD_FIELDS = {'G': 'TGD', 'J': 'TGD', 'E': 'BGD_E5a', 'C': 'TGD1'}
+
+# Orbit fields taken from the NAV tables
+ORBIT_FIELDS = ['sv_clock_bias', 'sv_clock_drift', 'sv_clock_drift_rate',
+                'IODC', 'crs', 'delta_n', 'M0', 'cuc', 'e', 'cus', 'sqrtA', 'toe',
+                'cic', 'omega0', 'cis', 'i0', 'crc', 'omega', 'omega_dot', 'idot']
+
+# Issue of data (IODE, IODnav, AODE: data[3], reader name "IODC") and fit
+# interval (h) of the Keplerian systems; without a fit interval the validity
+# window is +-MAX_DTOE
+IODE_FIELD = 'IODC'
+FIT_FIELDS = {'G': 'fit_interval', 'J': 'fit_interval'}
+MIN_FIT_HOURS = 4.0  # Smaller values are flags (ver.2 "0: 4 hours"), not hours
+
+KEPLER_ITER = 30  # Max iterations of Kepler's equation
+RTOL_KEPLER = 1e-13  # Tolerance of Kepler's equation
+SIN_5 = -0.0871557427476582  # sin(-5 deg), BeiDou GEO
+COS_5 = 0.9961946980917456  # cos(-5 deg), BeiDou GEO
+SAT_KEY = 1e10  # Key spacing between satellites in the toe lookup (s)
+
+
+# Per-row constant from a {system: value} table
+def per_system(sys, values):
+    out = np.zeros(len(sys))
+    for code, value in values.items():
+        out[sys == code] = value
+    return out
+
+
+# datetime64 (GPST) -> seconds since the GPS epoch
+def gps_seconds(times):
+    return datetime2gtime(times) / NS
+
+
+# GPS seconds from datetime64 or already numeric times
+def as_gps_seconds(times):
+    times = np.asarray(times)
+    return gps_seconds(times) if times.dtype.kind == 'M' else times.astype(np.float64)
+
+
+# NAV epoch strings ("yyyy mm dd hh mm ss" or ver.2 "yy mm dd hh mm ss.s") -> GPS seconds
+def epoch_seconds(epochs):
+    return str2gtime(epochs) / NS
+
+
+# NAV tables of one system from several files joined, fields common to all of
+# them kept (e.g. GLONASS ver.3.05 extra fields)
+def join_tables(tables):
+    if len(tables) == 1:
+        return tables[0]
+    names = [name for name in tables[0].dtype.names if all(name in table.dtype.names for table in tables)]
+    if all(table.dtype.names == tuple(names) for table in tables):
+        return np.concatenate(tables)
+    return np.concatenate([repack_fields(table[names]) for table in tables])
+
+
+# Broadcast ephemerides of any number of NAV files (rinex.c add_eph + uniqeph).
+# Tables are added as they are read and joined on the first query after, so a
+# daily file plus many hourly files cost one sort. Ephemerides of the Keplerian
+# systems (GPS, Galileo, BeiDou, QZSS) are deduplicated by (sat, toe, IODE),
+# keeping the first transmitted, and sorted by (satellite, toe), so that the
+# ephemeris for any (sat, time) pair is found by binary search; every ephemeris
+# is valid within +-fit interval/2 (+-MAX_DTOE without one) of its toe.
+# GLONASS/SBAS records are deduplicated by (sat, epoch).
+class EphemerisStore:
+    def __init__(self, tables=None):
+        self.pending = {}  # sys -> tables not joined yet
+        self.tables = {}  # sys -> joined, deduplicated table
+        self.version = 0  # builds so far
+        self.build_kepler()
+        if tables is not None:
+            self.add(tables)
+
+    # Add the tables of one NAV file (read_nav_tables)
+    def add(self, tables):
+        for sys, table in tables.items():
+            if len(table):
+                self.pending.setdefault(sys, []).append(table)
+        return self
+
+    def add_file(self, file_path):
+        return self.add(read_nav_tables(file_path))
+
+    def build(self):
+        if not self.pending:
+            return
+        for sys, tables in self.pending.items():
+            if sys in self.tables:
+                tables = [self.tables[sys]] + tables
+            self.tables[sys] = self.unique(sys, join_tables(tables))
+        self.pending = {}
+        self.build_kepler()
+        self.version += 1
+
+    # Table without duplicates, sorted by satellite and toe (epoch)
+    def unique(self, sys, table):
+        sat = table['satellite']
+        if sys in MU:
+            toe = self.toe_seconds(sys, table)
+            ttr = toe - table['toe'] + table['trans_time']
+            order = np.lexsort((ttr, table[IODE_FIELD], toe, sat))
+            keys = [sat[order], toe[order], table[IODE_FIELD][order]]
+        else:
+            toc = epoch_seconds(table['epoch'])
+            order = np.lexsort((toc, sat))
+            keys = [sat[order], toc[order]]
+        dup = np.zeros(len(order), dtype=bool)
+        dup[1:] = np.logical_and.reduce([key[1:] == key[:-1] for key in keys])
+        return table[order[~dup]]
+
+    # toe as GPS seconds
+    @staticmethod
+    def toe_seconds(sys, table):
+        week = table[WEEK_FIELDS[sys]]
+        if sys == 'C':  # bdt -> gpst
+            return (week + BDT_WEEK) * WEEK_SEC + table['toe'] + BDT_GPST
+        return week * WEEK_SEC + table['toe']
+
+    # Flat arrays of the Keplerian ephemerides sorted by (satellite, toe)
+    def build_kepler(self):
+        sats, toes, tocs, tgds, windows = [], [], [], [], []
+        fields = {name: [] for name in ORBIT_FIELDS}
+        for sys, table in self.tables.items():
+            if sys not in MU:
+                continue
+            toc = epoch_seconds(table['epoch'])
+            if sys == 'C':
+                toc += BDT_GPST
+            window = np.full(len(table), MAX_DTOE[sys])
+            if sys in FIT_FIELDS:
+                fit = np.nan_to_num(table[FIT_FIELDS[sys]])
+                window = np.where(fit >= MIN_FIT_HOURS, fit * 1800.0, window)
+            sats.append(table['satellite'])
+            toes.append(self.toe_seconds(sys, table))
+            tocs.append(toc)
+            tgds.append(np.nan_to_num(table[TGD_FIELDS[sys]]))
+            windows.append(window)
+            for name in ORBIT_FIELDS:
+                fields[name].append(table[name])
+
+        join = lambda arrays, dtype=np.float64: np.concatenate(arrays) if arrays else np.zeros(0, dtype)
+        sat = join(sats, 'U3')
+        toe = join(toes)
+        self.sat_names, sat_index = np.unique(sat, return_inverse=True)
+        order = np.lexsort((toe, sat_index))
+
+        self.sat_index = sat_index[order]
+        self.toe_abs = toe[order]
+        self.toc = join(tocs)[order]
+        self.tgd = join(tgds)[order]
+        self.window = join(windows)[order]
+        self.keys = self.sat_index * SAT_KEY + self.toe_abs
+        self.sys = sat[order].astype('U1')
+        self.fields = {name: join(fields[name])[order] for name in ORBIT_FIELDS}
+        # ephemerides of satellite i: sat_start[i]:sat_start[i + 1]
+        self.sat_start = np.searchsorted(self.sat_index, np.arange(len(self.sat_names) + 1))
+        self.mu = per_system(self.sys, MU)
+        self.omge = per_system(self.sys, OMGE)
+        prn = np.array([int(name[1:]) for name in self.sat_names], dtype=int)[self.sat_index]
+        self.geo = (self.sys == 'C') & ((prn <= 5) | (prn >= 59))  # BeiDou GEO
+
+    # Index of the ephemeris with the nearest toe among those valid at t for
+    # each (sat, t), -1 if none (rinex.c/ephemeris.c seleph)
+    def select(self, sats, t):
+        self.build()
+        sats = np.asarray(sats)
+        t = np.asarray(t, dtype=np.float64)
+        if len(self.sat_names) == 0:
+            return np.full(np.broadcast(sats, t).shape, -1)
+        pos = np.searchsorted(self.sat_names, sats)
+        pos = np.minimum(pos, len(self.sat_names) - 1)
+        known = self.sat_names[pos] == sats
+
+        i = np.searchsorted(self.keys, pos * SAT_KEY + t)
+        lo = np.clip(i - 1, 0, len(self.keys) - 1)
+        hi = np.clip(i, 0, len(self.keys) - 1)
+        dlo = np.abs(t - self.toe_abs[lo])
+        dhi = np.abs(t - self.toe_abs[hi])
+        dlo = np.where((self.sat_index[lo] == pos) & (dlo <= self.window[lo]), dlo, np.inf)
+        dhi = np.where((self.sat_index[hi] == pos) & (dhi <= self.window[hi]), dhi, np.inf)
+        idx = np.where(dhi < dlo, hi, lo)
+        return np.where(known & (np.minimum(dlo, dhi) < np.inf), idx, -1)
+
+    def __len__(self):
+        self.build()
+        return sum(len(table) for table in self.tables.values())
+
+
+# Satellite positions and clocks from broadcast ephemerides of the Keplerian
+# systems: tables of read_nav_tables or an EphemerisStore of several NAV files
+class BroadcastOrbits:
+    def __init__(self, tables):
+        self.store = tables if isinstance(tables, EphemerisStore) else EphemerisStore(tables)
+        self.version = -1
+        self.update()
+
+    # Ephemeris arrays of the store, taken again after NAV tables were added to it
+    def update(self):
+        store = self.store
+        store.build()
+        if self.version == store.version:
+            return
+        self.version = store.version
+        self.sat_names, self.sat_index, self.sys = store.sat_names, store.sat_index, store.sys
+        self.toe_abs, self.toc, self.tgd, self.fields = store.toe_abs, store.toc, store.tgd, store.fields
+        self.mu, self.omge, self.geo = store.mu, store.omge, store.geo
+
+    # Index of the ephemeris for each (sat, t), -1 if none
+    def select(self, sats, t):
+        self.update()
+        return self.store.select(sats, t)
+
+    # (sats, t, ephemeris index) broadcast together, t in GPS seconds
+    def lookup(self, sats, t):
+        sats, t = np.broadcast_arrays(np.asarray(sats), as_gps_seconds(t))
+        return sats, t, self.select(sats, t)
+
+    # ECEF positions (..., 3) of satellites sats at times t (GPS seconds or
+    # datetime64, broadcastable arrays), nan where no ephemeris is available
+    def positions(self, sats, t):
+        sats, t, idx = self.lookup(sats, t)
+        ok = idx >= 0
+        rs = np.full(t.shape + (3,), np.nan)
+        if ok.any():
+            rs[ok] = self.eph2pos(t[ok], idx[ok])
+        return rs
+
+    # Positions for every satellite at every epoch: (nsat, ntime, 3)
+    def positions_grid(self, sats, times):
+        return self.positions(np.asarray(sats)[:, None], as_gps_seconds(times)[None, :])
+
+    # Satellite clock offsets (s) of sats at times t (broadcastable arrays):
+    # polynomial + relativistic correction (rel) - group delay (tgd),
+    # nan where no ephemeris is available
+    def clock_bias(self, sats, t, rel=True, tgd=True):
+        sats, t, idx = self.lookup(sats, t)
+        ok = idx >= 0
+        dts = np.full(t.shape, np.nan)
+        if ok.any():
+            dts[ok] = self.eph2clk(t[ok], idx[ok], rel, tgd)
+        return dts
+
+    # Clock offsets for every satellite at every epoch: (nsat, ntime)
+    def clock_grid(self, sats, times, rel=True, tgd=True):
+        return self.clock_bias(np.asarray(sats)[:, None], as_gps_seconds(times)[None, :], rel, tgd)
+
+    # Eccentric anomaly at time t of every ephemeris idx
+    def eccentric_anomaly(self, t, idx):
+        A = self.fields['sqrtA'][idx] ** 2
+        e = self.fields['e'][idx]
+        tk = t - self.toe_abs[idx]
+        M = self.fields['M0'][idx] + (np.sqrt(self.mu[idx] / A ** 3) + self.fields['delta_n'][idx]) * tk
+
+        # Kepler's equation by Newton iterations, converged elements are left as is
+        E = M.copy()
+        for _ in range(KEPLER_ITER):
+            dE = (E - e * np.sin(E) - M) / (1.0 - e * np.cos(E))
+            E -= dE
+            if np.abs(dE).max() < RTOL_KEPLER:
+                break
+        return E
+
+    # Broadcast clock -> satellite clock offset, all (t, ephemeris) pairs at once
+    def eph2clk(self, t, idx, rel=True, tgd=True):
+        af0 = self.fields['sv_clock_bias'][idx]
+        af1 = self.fields['sv_clock_drift'][idx]
+        af2 = self.fields['sv_clock_drift_rate'][idx]
+        dt = t - self.toc[idx]
+        for _ in range(2):  # t is the signal time, refer it to the satellite clock
+            dt = t - self.toc[idx] - (af0 + af1 * dt + af2 * dt * dt)
+        dts = af0 + af1 * dt + af2 * dt * dt
+
+        if rel:
+            A = self.fields['sqrtA'][idx] ** 2
+            e = self.fields['e'][idx]
+            E = self.eccentric_anomaly(t, idx)
+            dts -= 2.0 * np.sqrt(self.mu[idx] * A) * e * np.sin(E) / CLIGHT ** 2
+        if tgd:
+            dts -= self.tgd[idx]
+        return dts
+
+    # Broadcast orbit -> ECEF position, all (t, ephemeris) pairs at once
+    def eph2pos(self, t, idx):
+        f = {name: values[idx] for name, values in self.fields.items()}
+        omge = self.omge[idx]
+        tk = t - self.toe_abs[idx]
+
+        A = f['sqrtA'] ** 2
+        e = f['e']
+        E = self.eccentric_anomaly(t, idx)
+        sinE, cosE = np.sin(E), np.cos(E)
+
+        u = np.arctan2(np.sqrt(1.0 - e * e) * sinE, cosE - e) + f['omega']
+        r = A * (1.0 - e * cosE)
+        i = f['i0'] + f['idot'] * tk
+        sin2u, cos2u = np.sin(2.0 * u), np.cos(2.0 * u)
+        u += f['cus'] * sin2u + f['cuc'] * cos2u
+        r += f['crs'] * sin2u + f['crc'] * cos2u
+        i += f['cis'] * sin2u + f['cic'] * cos2u
+        x, y = r * np.cos(u), r * np.sin(u)
+        cosi = np.cos(i)
+
+        rs = np.empty(t.shape + (3,))
+        geo = self.geo[idx]
+        O = f['omega0'] + (f['omega_dot'] - omge) * tk - omge * f['toe']
+        O = np.where(geo, f['omega0'] + f['omega_dot'] * tk - omge * f['toe'], O)
+        sinO, cosO = np.sin(O), np.cos(O)
+        rs[:, 0] = x * cosO - y * cosi * sinO
+        rs[:, 1] = x * sinO + y * cosi * cosO
+        rs[:, 2] = y * np.sin(i)
+
+        if geo.any():
+            xg, yg, zg = rs[geo, 0], rs[geo, 1], rs[geo, 2]
+            sino, coso = np.sin(omge[geo] * tk[geo]), np.cos(omge[geo] * tk[geo])
+            rs[geo, 0] = xg * coso + yg * sino * COS_5 + zg * sino * SIN_5
+            rs[geo, 1] = -xg * sino + yg * coso * COS_5 + zg * coso * SIN_5
+            rs[geo, 2] = -yg * SIN_5 + zg * COS_5
+        return rs
@@ -0,0 +1,308 @@
+import numpy as np
+
+from gtime import NS
+from satpos import CLIGHT
+
+# Carrier frequencies (Hz) by system and RINEX 3 band; GLONASS (FDMA) is not
+# checked as its frequencies depend on the channel of every satellite
+FREQS = {
+    'G': {'1': 1.57542e9, '2': 1.22760e9, '5': 1.17645e9},
+    'J': {'1': 1.57542e9, '2': 1.22760e9, '5': 1.17645e9, '6': 1.27875e9},
+    'E': {'1': 1.57542e9, '5': 1.17645e9, '7': 1.20714e9, '8': 1.191795e9, '6': 1.27875e9},
+    'C': {'1': 1.57542e9, '2': 1.561098e9, '5': 1.17645e9, '7': 1.20714e9, '6': 1.26852e9, '8': 1.191795e9},
+}
+B1I_V302 = ('L1I', 'L1Q')  # BeiDou B1I phases named "1I/1Q" in ver.3.02
+
+# Band pairs of the geometry-free / Melbourne-Wubbena combinations, in order
+# of preference
+DUAL_BANDS = {
+    'G': [('1', '2'), ('1', '5')],
+    'J': [('1', '2'), ('1', '5')],
+    'E': [('1', '5'), ('1', '7'), ('1', '8')],
+    'C': [('2', '7'), ('2', '6'), ('1', '7'), ('1', '5')],
+}
+
+GF_THRES = 0.05  # Geometry-free jump between consecutive epochs (m) (rtkpos.c thresslip)
+GF_RATE = 0.001  # Ionosphere change allowed per second between epochs (m/s)
+MW_K = 5.0  # Melbourne-Wubbena deviation from the window mean in sigmas
+MW_THRES = 1.5  # Min Melbourne-Wubbena deviation (wide-lane cycles)
+MW_WINDOW = 60  # Melbourne-Wubbena samples of the rolling window
+MW_MIN_N = 10  # Window samples before the Melbourne-Wubbena test is applied
+MAX_GAP = 180.0  # Longer gaps start a new arc (s)
+SLIP_BLOCK = 256  # Epochs per vectorized block of the streaming filter
+SAT_GROW = 64  # Satellite rows added at a time
+
+
+# Observation type of a band: first phase of the band whose code of the same
+# tracking mode is present, as (phase, code) names or None
+def band_types(types, band):
+    for name in types:
+        if name[:2] == 'L' + band and 'C' + name[1:] in types:
+            return name, 'C' + name[1:]
+    return None
+
+
+def frequency(sys, phase_type):
+    if sys == 'C' and phase_type in B1I_V302:
+        return FREQS['C']['2']
+    return FREQS[sys][phase_type[1]]
+
+
+# Columns (L1, L2, C1, C2) of the obs arrays and frequencies (f1, f2) of the
+# dual-frequency pair of each system, obs_types: {sys: obs type names}
+def dual_frequency_columns(obs_types):
+    pairs = {}
+    for sys, bands in DUAL_BANDS.items():
+        types = list(obs_types.get(sys, []))
+        for b1, b2 in bands:
+            t1, t2 = band_types(types, b1), band_types(types, b2)
+            if t1 and t2:
+                cols = [types.index(t1[0]), types.index(t2[0]), types.index(t1[1]), types.index(t2[1])]
+                pairs[sys] = (cols, frequency(sys, t1[0]), frequency(sys, t2[0]))
+                break
+    return pairs
+
+
+# Index of the last True row at or before each row (per column), -1 if none
+def last_true(mask):
+    idx = np.where(mask, np.arange(len(mask))[:, None], -1)
+    return np.maximum.accumulate(idx, axis=0)
+
+
+# Index of the first True row at or after each row (per column), n if none
+def next_true(mask):
+    n = len(mask)
+    idx = np.where(mask, np.arange(n)[:, None], n)
+    return np.minimum.accumulate(idx[::-1], axis=0)[::-1]
+
+
+# Cycle slip and outlier detection on dual-frequency phase/code with the
+# geometry-free (GF = L1 - L2, m) and Melbourne-Wubbena (MW, wide-lane
+# cycles) combinations. Per satellite arc, an epoch is a candidate when GF
+# jumps from the previous epoch by more than GF_THRES (+ GF_RATE per second of
+# gap) or MW leaves the mean of the last MW_WINDOW samples of the arc by more
+# than MW_K sigmas (MW_THRES at least). The next epoch decides: back at the old
+# level -> outlier (the four values are set to nan), otherwise -> slip (LLI
+# bit 0 set on both phases, new arc). LLI slips in the file and gaps over
+# MAX_GAP also start new arcs.
+#
+# Epochs are processed in blocks as (epoch, satellite) arrays: the window sums
+# of MW are differences of cumulative sums bounded by the arc starts, and the
+# first event of every satellite is resolved per pass until none is left. The
+# last MW_WINDOW samples, GF and time of every arc are carried from block to
+# block as head rows; the last epoch of a block is held back as the lookahead
+# of the block before it.
+class SlipDetector:
+    def __init__(self, obs_types, block=SLIP_BLOCK):
+        self.pairs = dual_frequency_columns(obs_types)
+        self.block = block
+        self.sats = {}  # satellite -> row of the arc state
+        self.hist = np.zeros((0, MW_WINDOW))  # last MW samples of the arc, nan: none
+        self.gf = np.zeros(0)
+        self.time = np.zeros(0)
+        self.nslip = 0
+        self.noutlier = 0
+
+    # Rows of satellites, new ones appended (obs_stats.ObsStats.rows)
+    def rows(self, sats):
+        for sat in sats:
+            if sat not in self.sats:
+                self.sats[sat] = len(self.sats)
+        if len(self.sats) > len(self.gf):
+            grow = max(len(self.sats) - len(self.gf), SAT_GROW)
+            self.hist = np.vstack([self.hist, np.full((grow, MW_WINDOW), np.nan)])
+            self.gf = np.concatenate([self.gf, np.zeros(grow)])
+            self.time = np.concatenate([self.time, np.zeros(grow)])
+        return np.array([self.sats[sat] for sat in sats], dtype=np.int64)
+
+    # GF (m), MW (cycles) and LLI slip flag of every row
+    def combinations(self, sat, obs, lli):
+        sys = sat.astype('U1')
+        gf = np.full(len(sat), np.nan)
+        mw = np.full(len(sat), np.nan)
+        slip = np.zeros(len(sat), dtype=bool)
+        for code, (c, f1, f2) in self.pairs.items():
+            rows = np.flatnonzero(sys == code)
+            L1, L2, P1, P2 = (obs[rows, i] for i in c)
+            gf[rows] = CLIGHT / f1 * L1 - CLIGHT / f2 * L2
+            mw[rows] = (L1 - L2) - (f1 * P1 + f2 * P2) / (f1 + f2) / (CLIGHT / (f1 - f2))
+            slip[rows] = ((lli[rows, c[0]] | lli[rows, c[1]]) & 1).astype(bool)
+        return gf, mw, slip
+
+    # Slip and outlier rows of whole epochs of rows (time gtime, sat, obs,
+    # lli) sorted by time; unless final, the last epoch is only the lookahead
+    # and the state is advanced to the epoch before it
+    def detect(self, time, sat, obs, lli, final=False):
+        gf_row, mw_row, lli_row = self.combinations(sat, obs, lli)
+        use = ~np.isnan(gf_row) & ~np.isnan(mw_row)
+        if not use.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        times, ep = np.unique(time, return_inverse=True)
+        names, col = np.unique(sat[use], return_inverse=True)
+        state = self.rows(names.tolist())
+        h = MW_WINDOW  # head rows: arc state before the block
+        ne, nc = h + len(times), len(names)
+        cs = np.arange(nc)
+
+        rowid = np.full((ne, nc), -1)
+        G = np.zeros((ne, nc))
+        M = np.zeros((ne, nc))
+        V = np.zeros((ne, nc), dtype=bool)
+        start = np.zeros((ne, nc), dtype=bool)
+        e = h + ep.reshape(-1)[use]
+        rowid[e, col] = np.flatnonzero(use)
+        G[e, col] = gf_row[use]
+        M[e, col] = mw_row[use]
+        V[e, col] = True
+        start[e, col] = lli_row[use]
+        M[:h] = self.hist[state].T
+        V[:h] = ~np.isnan(M[:h])
+        M[:h][~V[:h]] = 0.0
+        G[:h] = self.gf[state]
+        T = np.empty((ne, nc))
+        T[:h] = self.time[state]
+        T[h:] = (times / NS)[:, None]
+
+        # arc starts: first epoch of a satellite, LLI slip, gap
+        prev = np.vstack([np.full((1, nc), -1), last_true(V)[:-1]])
+        first = V & (prev < 0)
+        gap = V & (prev >= 0) & (T - T[np.maximum(prev, 0), cs] > MAX_GAP)
+        start |= first | gap
+        start[:h] = False
+        slips = np.zeros((ne, nc), dtype=bool)
+        outliers = np.zeros((ne, nc), dtype=bool)
+        rows = np.arange(ne)[:, None]
+        zero = np.zeros((1, nc))
+
+        while True:
+            # MW statistics of the window before every epoch
+            X = np.where(V, M, 0.0)
+            Cn, Cs, Cq = (np.vstack([zero, np.cumsum(C, axis=0)]) for C in (V, X, X * X))
+            base = last_true(start)  # row of the arc start
+            lo = np.maximum(np.maximum(base, rows - h), 0)
+            n = Cn[rows, cs] - Cn[lo, cs]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = (Cs[rows, cs] - Cs[lo, cs]) / n
+                sd = np.sqrt(np.maximum((Cq[rows, cs] - Cq[lo, cs]) / n - mean ** 2, 0.0))
+            mw_thres = np.where(n >= MW_MIN_N, np.maximum(MW_K * sd, MW_THRES), np.inf)
+
+            prev = np.vstack([np.full((1, nc), -1), last_true(V)[:-1]])
+            p = np.maximum(prev, 0)
+            nxt = np.vstack([next_true(V)[1:], np.full((1, nc), ne)])
+            q = np.minimum(nxt, ne - 1)
+            gf_thres = GF_THRES + GF_RATE * (T - T[p, cs])
+            cand = V & ~start & (prev >= base) & ((np.abs(G - G[p, cs]) > gf_thres) | (np.abs(M - mean) > mw_thres))
+            cand[:h] = False
+            if not cand.any():
+                break
+
+            # first candidate of every satellite: outlier if the next epoch is
+            # back at the old level, otherwise slip
+            c = np.flatnonzero(cand.any(axis=0))
+            r = np.argmax(cand[:, c], axis=0)
+            k, pk = q[r, c], p[r, c]
+            back = ((nxt[r, c] < ne) & ~start[k, c] &
+                    (np.abs(G[k, c] - G[pk, c]) <= GF_THRES + GF_RATE * (T[k, c] - T[pk, c])) &
+                    (np.abs(M[k, c] - mean[r, c]) <= np.minimum(mw_thres[r, c], MW_K * MW_THRES)))
+            outliers[r[back], c[back]] = True
+            V[r[back], c[back]] = False
+            slips[r[~back], c[~back]] = True
+            start[r[~back], c[~back]] = True
+
+        # advance the state to the last emitted epoch: GF and time of the last
+        # sample, last MW_WINDOW samples of the arc
+        last = ne - 1 if final else ne - 2
+        arc = V[:last + 1] & (rows[:last + 1] >= last_true(start[:last + 1])[-1])
+        seen = last_true(arc)[-1]
+        self.gf[state] = G[seen, cs]
+        self.time[state] = T[seen, cs]
+        rank = np.cumsum(arc[::-1], axis=0)[::-1]  # 1: last sample
+        rr, cc = np.nonzero(arc & (rank <= h))
+        hist = np.full((nc, h), np.nan)
+        hist[cc, h - rank[rr, cc]] = M[rr, cc]
+        self.hist[state] = hist
+
+        emit = np.zeros((ne, nc), dtype=bool)
+        emit[h:last + 1] = True
+        slip_rows = rowid[slips & emit]
+        outlier_rows = rowid[outliers & emit]
+        self.nslip += len(slip_rows)
+        self.noutlier += len(outlier_rows)
+        return slip_rows, outlier_rows
+
+    # Mark slip rows (LLI bit 0 of both phases) and outlier rows (phases and
+    # codes -> nan) in obs/lli arrays
+    def mark(self, sat, obs, lli, slip_rows, outlier_rows):
+        for rows, slip in ((slip_rows, True), (outlier_rows, False)):
+            cols = np.zeros((len(rows), 4), dtype=np.int64)
+            sys = sat[rows].astype('U1')
+            for code, (c, _, _) in self.pairs.items():
+                cols[sys == code] = c
+            if slip:
+                lli[rows[:, None], cols[:, :2]] |= 1
+            else:
+                obs[rows[:, None], cols] = np.nan
+
+    # Streaming filter over ObsEpoch objects: epochs come out in order with
+    # slips and outliers marked in place, SLIP_BLOCK epochs behind the input
+    def filter(self, epochs):
+        block = []
+        for epoch in epochs:
+            block.append(epoch)
+            if len(block) > self.block:
+                self.process_epochs(block, final=False)
+                yield from block[:-1]
+                block = block[-1:]
+        if block:
+            self.process_epochs(block, final=True)
+            yield from block
+
+    def process_epochs(self, block, final):
+        counts = [len(epoch.sats) for epoch in block]
+        if sum(counts) == 0:
+            return
+        time = np.repeat([epoch.time for epoch in block], counts)
+        sat = np.concatenate([epoch.sats for epoch in block])
+        obs = np.concatenate([epoch.obs for epoch in block])
+        lli = np.concatenate([epoch.lli for epoch in block])
+        slip_rows, outlier_rows = self.detect(time, sat, obs, lli, final)
+        if len(slip_rows) == 0 and len(outlier_rows) == 0:
+            return
+        self.mark(sat, obs, lli, slip_rows, outlier_rows)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        for i in np.unique(np.searchsorted(offsets, np.concatenate([slip_rows, outlier_rows]), side='right') - 1):
+            block[i].obs = obs[offsets[i]:offsets[i + 1]]
+            block[i].lli = lli[offsets[i]:offsets[i + 1]]
+
+    # Mark slips and outliers in place in OBS table columns (rows sorted by
+    # time), block by block as the streaming filter does
+    def clean_table(self, table):
+        time = table['time'].astype('M8[ns]').astype(np.int64)
+        bounds = np.flatnonzero(np.concatenate([[True], time[1:] != time[:-1], [True]]))
+        nep = len(bounds) - 1
+        for first in range(0, max(nep - 1, 1), self.block):
+            last = min(first + self.block, nep - 1)  # lookahead epoch, emitted by the next block
+            final = last == nep - 1
+            rows = slice(bounds[first], bounds[last + 1])
+            slip_rows, outlier_rows = self.detect(time[rows], table['sat'][rows], table['obs'][rows],
+                                                  table['lli'][rows], final)
+            self.mark(table['sat'][rows], table['obs'][rows], table['lli'][rows], slip_rows, outlier_rows)
+        return table
+
+
+def header_obs_types(header):
+    return {sys: header.obs_types(sys) for sys in DUAL_BANDS}
+
+
+# Streaming filter of an epoch generator, e.g.
+#   header, epochs = open_obs_rinex(path)
+#   for epoch in clean_epochs(header, epochs): ...
+def clean_epochs(header, epochs, block=SLIP_BLOCK):
+    return SlipDetector(header_obs_types(header), block).filter(epochs)
+
+
+# Mark slips and outliers in place in an OBS table (read_obs_table,
+# read_obs_table_shared)
+def clean_table(table, block=SLIP_BLOCK):
+    types = {sys: table['types_' + sys] for sys in DUAL_BANDS}
+    return SlipDetector(types, block).clean_table(table)
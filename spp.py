@@ -0,0 +1,166 @@
+import numpy as np
+
+from atmosphere import klobuchar, read_ion_params, saastamoinen
+from geometry import azel, ecef2pos, enu_matrix
+from satpos import CLIGHT, BroadcastOrbits, as_gps_seconds
+
+OMGE = 7.2921151467e-5  # Earth angular velocity (IS-GPS) (rad/s)
+
+# Receiver clock parameter of each system (QZSS shares the GPS clock)
+CLOCK_GROUPS = {'G': 0, 'J': 0, 'E': 1, 'C': 2}
+NCLOCK = 3
+
+# Code observations used for positioning, in order of preference
+CODE_PRIORITY = {
+    'G': ['C1C', 'C1W', 'C1P', 'C1X'],
+    'J': ['C1C', 'C1X'],
+    'E': ['C1C', 'C1X', 'C1B'],
+    'C': ['C2I', 'C1I', 'C2X', 'C1X'],
+}
+
+MAX_ITER = 10  # Max Gauss-Newton iterations
+CONV_TOL = 1e-4  # Position update at convergence (m)
+EL_MASK = np.deg2rad(10.0)  # Elevation mask (rad)
+MIN_RADIUS = 1e6  # Below this the position is still the initial guess (m)
+ION_SCALE = {'C': (1.57542e9 / 1.561098e9) ** 2}  # Klobuchar L1 delay -> code frequency (BeiDou B1I)
+
+
+# Code pseudorange of every row of an obs table (see rinex_obs.read_obs_table),
+# first available type of CODE_PRIORITY, nan if none
+def pseudoranges(table):
+    sys = table['sat'].astype('U1')
+    P = np.full(len(sys), np.nan)
+    for code, priority in CODE_PRIORITY.items():
+        types = list(table['types_' + code])
+        rows = sys == code
+        for obs_type in priority:
+            if obs_type not in types:
+                continue
+            value = table['obs'][:, types.index(obs_type)]
+            fill = rows & np.isnan(P) & (value > 0.0)
+            P[fill] = value[fill]
+    return P
+
+
+# Scatter rows into an (epoch, slot) grid: returns the epoch times,
+# the epoch and slot of every row and the number of slots
+def epoch_grid(time, rows):
+    times, ep = np.unique(time, return_inverse=True)
+    ep = ep.reshape(-1)
+    rows = rows[np.argsort(ep[rows], kind='stable')]
+    e = ep[rows]
+    slot = np.arange(len(rows)) - np.searchsorted(e, e)
+    return times, rows, e, slot, int(slot.max()) + 1 if len(rows) else 0
+
+
+# Code-based single point positioning of all epochs of an obs table.
+# Every epoch is an independent least-squares problem; the Gauss-Newton steps of
+# all epochs are taken together on (epoch, satellite) arrays and solved as one
+# batch of normal equations. Unknowns: position and one receiver clock per
+# CLOCK_GROUPS entry; a clock without satellites in an epoch is held at zero.
+# ion: Klobuchar coefficients (atmosphere.read_ion_params), None for no
+# ionospheric correction; tropo: Saastamoinen tropospheric correction. Both
+# use the azimuth/elevation grid of the elevation mask.
+# Returns time, pos (ECEF, m), clk (m), nsat, rms (m) and ok per epoch.
+def solve_spp(table, orbits, max_iter=MAX_ITER, el_mask=EL_MASK, ion=None, tropo=False):
+    sat = table['sat']
+    sys = sat.astype('U1')
+    P = pseudoranges(table)
+    t_rx = as_gps_seconds(table['time'])
+
+    # signal transmission time, satellite clock and position
+    good = ~np.isnan(P) & np.isin(sys, list(CLOCK_GROUPS))
+    t_tx = t_rx - np.where(good, P, 0.0) / CLIGHT
+    dts = orbits.clock_bias(sat, t_tx)
+    rs = orbits.positions(sat, t_tx - np.nan_to_num(dts))
+    good &= ~np.isnan(dts) & ~np.isnan(rs[:, 0])
+
+    times, rows, e, s, nslot = epoch_grid(table['time'], np.flatnonzero(good))
+    ne = len(times)
+    Pg = np.zeros((ne, nslot))
+    dtsg = np.zeros((ne, nslot))
+    rsg = np.zeros((ne, nslot, 3))
+    group = np.zeros((ne, nslot, NCLOCK))
+    valid = np.zeros((ne, nslot), dtype=bool)
+    Pg[e, s] = P[rows]
+    dtsg[e, s] = dts[rows]
+    rsg[e, s] = rs[rows]
+    group[e, s, [CLOCK_GROUPS[code] for code in sys[rows]]] = 1.0
+    valid[e, s] = True
+    ion_scale = np.ones((ne, nslot))
+    for code, scale in ION_SCALE.items():
+        ion_scale[e[sys[rows] == code], s[sys[rows] == code]] = scale
+
+    x = np.zeros((ne, 3 + NCLOCK))
+    solvable = np.zeros(ne, dtype=bool)
+    used = valid
+    converged = False
+    for _ in range(max_iter):
+        d = rsg - x[:, None, :3]
+        r = np.linalg.norm(d, axis=-1)
+        los = d / np.where(r > 0.0, r, 1.0)[..., None]
+        r += OMGE * (rsg[..., 0] * x[:, None, 1] - rsg[..., 1] * x[:, None, 0]) / CLIGHT  # sagnac
+
+        # elevation mask and atmosphere once the position is no longer the
+        # initial guess
+        lat, lon, hgt = ecef2pos(x[:, :3])
+        az, el = azel(los, enu_matrix(lat, lon)[:, None])
+        placed = np.linalg.norm(x[:, :3], axis=-1) > MIN_RADIUS
+        used = valid & ((el >= el_mask) | ~placed[:, None])
+        if ion is not None:
+            r += placed[:, None] * ion_scale * klobuchar(times[:, None], lat[:, None], lon[:, None],
+                                                         hgt[:, None], az, el, ion)
+        if tropo:
+            r += placed[:, None] * saastamoinen(lat[:, None], hgt[:, None], el)
+
+        w = used.astype(np.float64)
+        v = np.where(used, Pg - (r + np.einsum('esg,eg->es', group, x[:, 3:]) - CLIGHT * dtsg), 0.0)
+        H = np.concatenate([-los, group], axis=-1)
+        N = np.einsum('esi,es,esj->eij', H, w, H)
+        b = np.einsum('esi,es->ei', H, w * v)
+
+        present = np.einsum('es,esg->eg', w, group) > 0.0
+        idx = np.arange(3, 3 + NCLOCK)
+        N[:, idx, idx] += ~present  # hold absent clocks
+        solvable = w.sum(axis=1) >= 3 + present.sum(axis=1)
+        N[~solvable] = np.eye(3 + NCLOCK)
+        b[~solvable] = 0.0
+
+        dx = np.linalg.solve(N, b[..., None])[..., 0]
+        x += dx
+        if np.abs(dx[solvable, :3]).max(initial=0.0) < CONV_TOL:
+            converged = True
+            break
+
+    nsat = used.sum(axis=1)
+    nfree = np.maximum(nsat - 3 - present.sum(axis=1), 1)
+    rms = np.sqrt(np.square(np.where(used, v, 0.0)).sum(axis=1) / nfree)
+    ok = solvable & (np.linalg.norm(x[:, :3], axis=-1) > MIN_RADIUS)
+    if not converged:
+        ok &= np.abs(dx[:, :3]).max(axis=1) < CONV_TOL
+    return {
+        'time': times,
+        'pos': x[:, :3],
+        'clk': x[:, 3:],
+        'nsat': nsat,
+        'rms': rms,
+        'ok': ok,
+    }
+
+
+# Position errors (epoch x 3) of an SPP solution against a known position,
+# nan for epochs without a solution
+def spp_errors(solution, reference_position):
+    errors = solution['pos'] - np.asarray(reference_position, dtype=np.float64)
+    errors[~solution['ok']] = np.nan
+    return errors
+
+
+# SPP of an OBS/NAV file pair through the parsed table cache, ionospheric
+# correction with the Klobuchar coefficients of the NAV header and
+# tropospheric correction unless given otherwise
+def solve_spp_files(obs_path, nav_path, **kwargs):
+    from rinex_cache import load_nav, load_obs
+    kwargs.setdefault('ion', read_ion_params(nav_path))
+    kwargs.setdefault('tropo', True)
+    return solve_spp(load_obs(obs_path), BroadcastOrbits(load_nav(nav_path)), **kwargs)